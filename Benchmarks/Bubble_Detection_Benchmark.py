@@ -0,0 +1,88 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore Bubble Detection Benchmark
+#
+#    - Compares the original row-by-row bubble loop from Phase 1 with detect_bubbles
+#    - Uses synthetic liquid conductivity (ECM) data with injected bubbles
+#    - Checks that both methods NaN exactly the same rows, then prints run times
+#
+# Not required for data processing
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import os
+import sys
+import time
+
+# Import functions from the spicecore_dust package (one folder up from this script)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spicecore_dust import detect_bubbles
+
+#%%
+# Function to make synthetic CFA depth & ECM data with bubbles
+# Inputs: Number of rows, number of bubbles, random seed
+# Output: CFA dataframe with depth, flow rate, and ECM columns
+
+def make_bubble_data(n_rows, n_bubbles, seed = 0):
+    rng = np.random.default_rng(seed)
+    
+    # ~1 mm depth steps, with some repeated depths to exercise the divide-by-0 check
+    steps = rng.uniform(0.0005, 0.0015, n_rows)
+    steps[rng.random(n_rows) < 0.01] = 0
+    depth = 100 + np.cumsum(steps)
+    
+    # Smooth ECM signal with noise
+    ecm = 2 + 0.5 * np.sin(depth) + rng.normal(0, 0.01, n_rows)
+    # Sharp single-row drops in ECM look like bubbles
+    bubble_rows = rng.choice(np.arange(2, n_rows - 2), n_bubbles, replace = False)
+    ecm[bubble_rows] = ecm[bubble_rows] - 1
+    # Some rows are missing depth or ECM values
+    depth[rng.random(n_rows) < 0.001] = np.nan
+    ecm[rng.random(n_rows)   < 0.001] = np.nan
+    
+    return pd.DataFrame({'Depth (m)': depth, 'Flow Rate': 1.0, 'ECM': ecm})
+
+#%%
+# Original Phase 1 bubble loop, kept here for comparison
+# Inputs: CFA dataframe, slope threshold
+# Output: Number of bubbles. Bubble rows are NaN'd in the CFA dataframe.
+
+def detect_bubbles_loop(cfa, threshold_bubbles):
+    bubbles = 0
+    for i in range(1, len(cfa['Depth (m)']) - 1):                      
+        # Calculate the slope between the liquid conductivity at index i and the points before and after it
+        if (cfa['Depth (m)'][i] - cfa['Depth (m)'][i - 1]) == 0 or (cfa['Depth (m)'][i + 1] - cfa['Depth (m)'][i]) == 0: 
+            continue # Don't divide by 0
+        else:
+            slope1 = (cfa['ECM'][i] - cfa['ECM'][i - 1]) / (cfa['Depth (m)'][i] - cfa['Depth (m)'][i - 1])
+            if slope1 <= -threshold_bubbles:  
+                slope2 = (cfa['ECM'][i + 1] - cfa['ECM'][i]) / (cfa['Depth (m)'][i + 1] - cfa['Depth (m)'][i]) 
+                if slope2 >= threshold_bubbles:                       
+                    bubbles = bubbles + 1
+                    cfa.loc[i, :] = np.nan
+    return bubbles
+
+#%%
+# Run both methods on the same data and compare
+
+for n_rows in [10000, 50000]:
+    cfa_loop = make_bubble_data(n_rows, n_rows // 200)
+    cfa_fast = cfa_loop.copy()
+    
+    start = time.perf_counter()
+    loop_bubbles = detect_bubbles_loop(cfa_loop, 25)
+    loop_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    fast_bubbles = len(detect_bubbles(cfa_fast, 25))
+    fast_time = time.perf_counter() - start
+    
+    # Both methods must NaN exactly the same rows
+    assert loop_bubbles == fast_bubbles
+    assert cfa_loop.equals(cfa_fast)
+    
+    print('Rows: %d, bubbles: %d' % (n_rows, fast_bubbles))
+    print('    Loop:       %.4f s' % loop_time)
+    print('    Vectorized: %.4f s' % fast_time)
+    print('    Speedup:    %.0fx' % (loop_time / fast_time))
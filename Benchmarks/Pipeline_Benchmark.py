@@ -0,0 +1,187 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore Dust Processing Pipeline Benchmark
+#
+#    - Times each stage of Phase 1 & Phase 2 on synthetic CFA data (see synthetic_cfa.py):
+#      bubble detection, melter error filters, melt day correction, timescale interpolation,
+#      event labelling, particle sums & CPP, Phase 1 export, MAD outlier removal, manual removal,
+#      summary statistics, and Phase 2 export, plus run_phase1 & run_phase2 as a whole
+#    - Each stage gets the output of the stage before it, as in the real pipeline
+#    - Repeats the whole pipeline and saves the times (all repeats, minimum, median) to a JSON file,
+#      with the data size, settings, and package versions, so runs can be compared over time
+#
+#    python Benchmarks/Pipeline_Benchmark.py --rows 1000000 --repeats 3 --output benchmark.json
+#
+# Not required for data processing
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from   datetime import datetime
+
+# Import functions from the spicecore_dust package (one folder up from this script)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spicecore_dust import (make_config, detect_bubbles, remove_melter_errors, correct_meltday, label_core_breaks,
+                            label_volc_events, label_dust_events, label_manual_removal, find_cpp,
+                            remove_outliers_MAD, summary_statistics, run_phase1, run_phase2,
+                            export_phase1, export_phase2, set_ledger, record_errors)
+from spicecore_dust.ledger import NO_ERROR
+from synthetic_cfa import make_synthetic_inputs, save_synthetic_data
+
+#%%
+# Function to time one stage
+# Inputs: Dictionary of stage times (updated), stage name, function to run, its arguments
+# Output: What the function returns
+
+def time_stage(times, name, function, *args, **kwargs):
+
+    start  = time.perf_counter()
+    result = function(*args, **kwargs)
+    times[name] = time.perf_counter() - start
+
+    return result
+
+#%%
+# Function to run each stage of Phase 1 & Phase 2 once, timing each one
+# Inputs: Dictionary of synthetic input dataframes, config dictionary, folder to export to
+# Output: Dictionary of stage times (s)
+
+def run_stages(inputs, config, output_folder):
+    times = {}
+
+    # Phase 1
+    cfa = inputs['cfa'].copy()
+    ledger = np.full(len(cfa), NO_ERROR, dtype = np.int8)
+
+    bubble_rows = time_stage(times, 'bubble_detection', detect_bubbles, cfa, config['bubble_threshold'])
+    record_errors(ledger, cfa.index.isin(bubble_rows), 'Bubble')
+    time_stage(times, 'melter_filters', remove_melter_errors, cfa, ledger)
+    cfa = time_stage(times, 'meltday_correction', correct_meltday, cfa)
+
+    annual_depths = inputs['annual_depths']
+    cfa['AgeBP'] = time_stage(times, 'timescale_interpolation', np.interp, cfa['Depth (m)'],
+                              annual_depths['Depth (m)'], annual_depths['Age (Years Before 1950)'])
+
+    def label_events():
+        break_rows, new_break_rows = label_core_breaks(cfa, inputs['breaks'], config['core_break_buffer'])
+        volc_rows, new_event_rows  = label_volc_events(cfa, inputs['volcanic_record'],
+                                                       config['volc_start_buffer'], config['volc_end_buffer'])
+        for label, rows in [('Break?', break_rows), ('New Break?', new_break_rows), ('Volcanic Event?', volc_rows),
+                            ('New Volcanic Event?', new_event_rows), ('Dust Event?', label_dust_events(cfa, inputs['dust_events']))]:
+            cfa[label] = False
+            cfa.loc[rows, label] = True
+    time_stage(times, 'labelling', label_events)
+
+    def sums_cpp():
+        cfa['Sum 1.1-12'] = cfa.loc[:, '1.1':'12'].sum(axis = 1, min_count = 1)
+        cfa['CPP'] = find_cpp(cfa)
+    time_stage(times, 'sums_cpp', sums_cpp)
+    set_ledger(cfa, ledger)
+
+    time_stage(times, 'export_phase1', export_phase1, cfa, output_folder)
+
+    # Phase 2
+    cfa = cfa.reset_index(drop = True)
+    dust_rows = cfa.index[cfa['Dust Event?']].tolist()
+    volc_rows = cfa.index[cfa['Volcanic Event?']].tolist()
+
+    mad_rows = time_stage(times, 'mad_removal', remove_outliers_MAD, cfa, dust_rows, volc_rows,
+                          config['window'], config['mad_threshold'], True)
+    record_errors(ledger, cfa.index.isin(mad_rows), 'MAD Outlier')
+
+    def manual_removal():
+        manual_rows = cfa.index.isin(label_manual_removal(cfa, inputs['manual']))
+        record_errors(ledger, manual_rows & cfa['Flow Rate'].notna().to_numpy(), 'Manual Removal')
+    time_stage(times, 'manual_removal', manual_removal)
+
+    time_stage(times, 'summary_statistics', summary_statistics, cfa)
+    time_stage(times, 'export_phase2', export_phase2, cfa, cfa.iloc[:0], output_folder)
+
+    # Whole phases, as run by the scripts & command line
+    phase1_inputs = {name: table for name, table in inputs.items() if name != 'manual'}
+    cfa_phase1, errors = time_stage(times, 'run_phase1', run_phase1, phase1_inputs, config)
+    time_stage(times, 'run_phase2', run_phase2, cfa_phase1, config, inputs['manual'])
+
+    return times
+
+#%%
+# Function to get the git commit of the package, if it is in a git repository
+# Input: None
+# Output: Commit hash (None if not available)
+
+def git_commit():
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)),
+                              capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#%%
+# Run the benchmark
+
+parser = argparse.ArgumentParser(description = 'Time each stage of SPICEcore dust processing on synthetic CFA data.')
+parser.add_argument('--rows',      type = int, default = 1000000, help = 'Number of synthetic CFA rows (default: 1000000)')
+parser.add_argument('--repeats',   type = int, default = 3,       help = 'Number of times to run the pipeline (default: 3)')
+parser.add_argument('--seed',      type = int, default = 0,       help = 'Random seed for the synthetic data (default: 0)')
+parser.add_argument('--output',    default = 'Pipeline_Benchmark_' + str(datetime.now().date()) + '.json',
+                    help = 'JSON file to save the results to')
+parser.add_argument('--save-data', dest = 'save_data',
+                    help = 'Also save the synthetic data to this folder, to run the command line on it')
+args = parser.parse_args()
+
+config = make_config(preserve_volcanic = True)
+
+start  = time.perf_counter()
+inputs = make_synthetic_inputs(args.rows, seed = args.seed)
+generate_time = time.perf_counter() - start
+if args.save_data:
+    save_synthetic_data(inputs, args.save_data)
+
+# Time every stage for each repeat. Processing messages are hidden.
+repeats = []
+with tempfile.TemporaryDirectory() as output_folder:
+    for repeat in range(args.repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            repeats.append(run_stages(inputs, config, output_folder))
+
+stages = {name: {'times':  [times[name] for times in repeats],
+                 'min':    min(times[name] for times in repeats),
+                 'median': float(np.median([times[name] for times in repeats]))}
+          for name in repeats[0]}
+
+try:
+    import numba
+    numba_version = numba.__version__
+except ImportError:
+    numba_version = None
+
+results = {'date':     datetime.now().isoformat(timespec = 'seconds'),
+           'commit':   git_commit(),
+           'machine':  {'platform': platform.platform(), 'processor': platform.processor(), 'cpus': os.cpu_count()},
+           'versions': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'pandas': pd.__version__, 'numba': numba_version},
+           'data':     {'rows': args.rows, 'seed': args.seed,
+                        'tables': {name: len(table) for name, table in inputs.items() if name != 'cfa'},
+                        'generate_time': generate_time},
+           'settings': config,
+           'repeats':  args.repeats,
+           'stages':   stages}
+
+with open(args.output, 'w') as f:
+    json.dump(results, f, indent = 1)
+
+print('Rows: %d, repeats: %d' % (args.rows, args.repeats))
+for name, stage in stages.items():
+    print('    %-24s min %8.3f s   median %8.3f s' % (name + ':', stage['min'], stage['median']))
+print('Results saved to', args.output)
@@ -0,0 +1,69 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore Rolling Median Benchmark
+#
+#    - Compares pandas rolling medians (used originally in remove_outliers_MAD) with rolling_median
+#    - Uses a synthetic 3-million-row CFA series of CPP & particle concentration, with missing values
+#    - Checks that both methods give exactly the same background values, then prints run times
+#      for several MAD window sizes
+#
+# rolling_median needs numba for its speedup (included with Anaconda). Without numba it uses pandas.
+# Not required for data processing
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import os
+import sys
+import time
+
+# Import functions from the spicecore_dust package (one folder up from this script)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spicecore_dust import rolling_median
+
+#%%
+# Function to make a synthetic CFA series of CPP & particle concentration
+# Inputs: Number of rows, random seed
+# Output: CFA dataframe with CPP and 'Sum 1.1-12' columns
+
+def make_cfa_series(n_rows, seed = 0):
+    rng = np.random.default_rng(seed)
+
+    # Slowly changing background with log-normal noise, plus short dust spikes
+    background = 200 + 100 * np.sin(np.linspace(0, 50, n_rows))
+    conc = background * rng.lognormal(0, 0.3, n_rows)
+    spikes = rng.random(n_rows) < 0.002
+    conc[spikes] = conc[spikes] * 10
+    cpp  = 0.6 + 0.1 * rng.standard_normal(n_rows)
+    # Rows removed in Phase 1 are NaN
+    conc[rng.random(n_rows) < 0.05] = np.nan
+    cpp[rng.random(n_rows)  < 0.05] = np.nan
+
+    return pd.DataFrame({'CPP': cpp, 'Sum 1.1-12': conc})
+
+#%%
+# Run both methods on the same data and compare
+
+cfa = make_cfa_series(3000000)
+
+# Compile rolling_median before timing it
+rolling_median([cfa['CPP'][:1000]], 500)
+
+for window in [100, 500, 5000, 20000]:
+    start = time.perf_counter()
+    cpp_pandas  = cfa['CPP'].rolling(window, min_periods = 3).median().to_numpy()
+    conc_pandas = cfa['Sum 1.1-12'].rolling(window, min_periods = 3).median().to_numpy()
+    pandas_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cpp_fast, conc_fast = rolling_median([cfa['CPP'], cfa['Sum 1.1-12']], window, min_periods = 3)
+    fast_time = time.perf_counter() - start
+
+    # Both methods must give exactly the same backgrounds
+    assert np.array_equal(cpp_pandas,  cpp_fast,  equal_nan = True)
+    assert np.array_equal(conc_pandas, conc_fast, equal_nan = True)
+
+    print('Rows: %d, window: %d' % (len(cfa), window))
+    print('    pandas:         %.3f s' % pandas_time)
+    print('    rolling_median: %.3f s' % fast_time)
+    print('    Speedup:        %.1fx' % (pandas_time / fast_time))
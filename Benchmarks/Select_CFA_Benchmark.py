@@ -0,0 +1,65 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore select_cfa Benchmark
+#
+#    - Compares select_cfa on a CFA dataframe (2 full scans per range) with select_cfa on a CFAIndex
+#      (2 binary searches per range), for many age intervals in a loop
+#    - Uses a synthetic 3-million-row CFA dataset with increasing depths & ages, and 5% NaN'd rows
+#    - Checks that both give exactly the same rows, then prints run times
+#
+# Not required for data processing
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import os
+import sys
+import time
+
+# Import functions from the spicecore_dust package (one folder up from this script)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spicecore_dust import CFAIndex, select_cfa
+
+#%%
+# Function to make a synthetic CFA dataset after Phase 1
+# Inputs: Number of rows, random seed
+# Output: CFA dataframe with depth, age, and 5 data columns
+
+def make_cfa(n_rows, seed = 0):
+    rng = np.random.default_rng(seed)
+
+    depth = 130 + np.cumsum(rng.uniform(0, 0.001, n_rows))
+    cfa = pd.DataFrame({'Depth (m)': depth, 'AgeBP': 20 * depth ** 1.2})
+    for column in ['Flow Rate', 'ECM', 'Sum 1.1-12', 'CPP', '1']:
+        cfa[column] = rng.random(n_rows)
+    # Rows removed in Phase 1 are NaN
+    cfa.loc[rng.random(n_rows) < 0.05, :] = np.nan
+
+    return cfa
+
+#%%
+# Select every age interval with both methods and compare
+
+cfa = make_cfa(3000000)
+ages = np.linspace(cfa['AgeBP'].min(), cfa['AgeBP'].max(), 1001)
+
+start = time.perf_counter()
+scans = [select_cfa(cfa, lower, upper, 'AgeBP') for lower, upper in zip(ages[:-1], ages[1:])]
+scan_time = time.perf_counter() - start
+
+start = time.perf_counter()
+cfa_index = CFAIndex(cfa)
+index_build_time = time.perf_counter() - start
+
+start = time.perf_counter()
+searches = [select_cfa(cfa_index, lower, upper, 'AgeBP') for lower, upper in zip(ages[:-1], ages[1:])]
+search_time = time.perf_counter() - start
+
+# Both methods must give exactly the same rows
+assert all(scan.equals(search) for scan, search in zip(scans, searches))
+
+print('Rows: %d, age intervals: %d' % (len(cfa), len(ages) - 1))
+print('    select_cfa (dataframe): %.3f s' % scan_time)
+print('    CFAIndex (build once):  %.3f s' % index_build_time)
+print('    select_cfa (CFAIndex):  %.3f s' % search_time)
+print('    Speedup:                %.1fx' % (scan_time / (index_build_time + search_time)))
@@ -0,0 +1,134 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore Synthetic CFA Data
+#
+# Makes synthetic raw continuous flow analysis (CFA) data and supporting datafiles, for benchmarks
+#    - Depths increase ~1 mm per row, with some repeated or decreasing depths and rows without depth
+#    - Liquid conductivity (ECM) with injected bubbles (sharp 1-row drops) and some values < 0.6
+#    - Flow rate with dropouts (0, negative, and missing values)
+#    - 30 Abakus particle size bins: counts fall off with particle size, with a slowly changing
+#      dust background, short dust spikes (MAD outliers), and some infinite or negative values
+#    - Depth-age timescale, volcanic record, core breaks, dust events, and manual cleaning intervals
+#      over the same depth range, at a density set by the arguments (plus the Holocene volcanic events)
+#
+# Not required for data processing
+#
+# List of functions:
+#
+#  1) make_synthetic_inputs: Make synthetic raw CFA data and supporting datafiles
+#  2) save_synthetic_data:   Save synthetic data to a data folder, with the usual file names
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import os
+import sys
+
+# Import from the spicecore_dust package (one folder up from this script)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spicecore_dust.phase1 import PHASE1_FILES
+from spicecore_dust.phase2 import MANUAL_FILE
+from spicecore_dust.schema import ABAKUS_BINS
+
+#%%
+# Function to make synthetic raw CFA data and supporting datafiles
+# Inputs: Number of CFA rows, starting depth (m), fraction of rows with bubbles, fraction of rows with
+#         flow rate dropouts, number of core breaks, volcanic events, dust events, and manual cleaning
+#         intervals per meter of core, random seed
+# Output: Dictionary of input dataframes (keys match PHASE1_FILES, plus 'manual')
+
+def make_synthetic_inputs(n_rows, start_depth = 150, bubble_fraction = 0.02, dropout_fraction = 0.005,
+                          breaks_per_m = 1, volcanic_per_m = 0.75, dust_events_per_m = 0.02,
+                          manual_per_m = 0.04, seed = 0):
+    rng = np.random.default_rng(seed)
+
+    # Depths: ~1 mm steps. Some steps are 0 (repeated depths) or negative (depth errors).
+    steps = rng.uniform(0.0005, 0.0015, n_rows)
+    steps[rng.random(n_rows) < 0.002] = 0
+    decreases = rng.random(n_rows) < 0.001
+    steps[decreases] = -rng.uniform(0.0005, 0.003, decreases.sum())
+    depth = start_depth + np.cumsum(steps)
+    end_depth = depth.max()
+
+    # Liquid conductivity: smooth signal with noise, sharp 1-row drops for bubbles,
+    # and some stretches of 20 rows with low values
+    ecm = 2 + 0.5 * np.sin(depth / 3) + rng.normal(0, 0.005, n_rows)
+    bubble_rows = rng.choice(np.arange(1, n_rows - 1), int(n_rows * bubble_fraction), replace = False)
+    ecm[bubble_rows] = ecm[bubble_rows] - rng.uniform(0.5, 1.2, len(bubble_rows))
+    low_rows = (rng.choice(n_rows - 20, max(n_rows // 40000, 1))[:, None] + np.arange(20)).ravel()
+    ecm[low_rows] = rng.uniform(0.3, 0.6, len(low_rows))
+
+    # Flow rate: ~1, with dropouts to 0 or negative values, and some missing values
+    flow = rng.normal(1, 0.02, n_rows)
+    dropouts = rng.random(n_rows) < dropout_fraction
+    flow[dropouts] = rng.choice([0, -0.1], dropouts.sum())
+    flow[rng.random(n_rows) < 0.001] = np.nan
+
+    # Abakus counts: mean counts fall off with particle size. The dust background changes slowly with depth,
+    # with log-normal noise and short dust spikes.
+    sizes = np.array(ABAKUS_BINS, dtype = 'float')
+    bin_means = 150 * sizes ** -2.5
+    background = np.exp(np.log(3) * np.sin(depth / 7) + rng.normal(0, 0.3, n_rows))
+    spikes = rng.random(n_rows) < 0.002
+    background[spikes] = background[spikes] * rng.uniform(5, 20, spikes.sum())
+    # Coarse particles are more common in spikes, so CPP & concentration are both outliers
+    coarse = np.where(spikes[:, None] & (sizes[None, :] >= 4.5), 4, 1)
+    abakus = rng.poisson(bin_means[None, :] * background[:, None] * coarse).astype('float')
+    abakus[rng.random(n_rows) < 0.0005, rng.integers(len(sizes))] = np.inf
+    abakus[rng.random(n_rows) < 0.0005, rng.integers(len(sizes))] = -1
+
+    # Some rows have data but no depth
+    depth[rng.random(n_rows) < 0.001] = np.nan
+
+    cfa = pd.DataFrame(abakus, columns = ABAKUS_BINS)
+    cfa.insert(0, 'Depth (m)', depth)
+    cfa.insert(1, 'Flow Rate', flow)
+    cfa.insert(2, 'ECM', ecm)
+    cfa.index = cfa.index.astype('float')
+
+    # Depth-age timescale: annual layers thin with depth
+    timescale_depths = np.linspace(0, end_depth + 10, 4001)
+    annual_depths = pd.DataFrame({'Depth (m)': timescale_depths,
+                                  'Age (Years Before 1950)': 4 * timescale_depths + 0.02 * timescale_depths ** 2})
+
+    # Supporting tables over the CFA depth range
+    span = end_depth - start_depth
+
+    # As in the real volcanic record, the first 1209 events are Holocene events (above the CFA data here),
+    # and Phase 1 interpolates ages for the events after them
+    volcanic_depths = np.concatenate([np.sort(rng.uniform(0, start_depth, 1209)),
+                                      np.sort(rng.uniform(start_depth, end_depth, max(int(span * volcanic_per_m), 1)))])
+    volcanic_record = pd.DataFrame({'Start Year (b1950)': np.interp(volcanic_depths, annual_depths['Depth (m)'],
+                                                                    annual_depths['Age (Years Before 1950)']),
+                                    'Volcanic Depth (m)': volcanic_depths})
+
+    breaks = pd.DataFrame({'Depth (m)': np.sort(rng.uniform(start_depth, end_depth, max(int(span * breaks_per_m), 1)))})
+
+    dust_starts = np.sort(rng.uniform(start_depth, end_depth, max(int(span * dust_events_per_m), 1)))
+    dust_events = pd.DataFrame({'Dust Event Start (m)': dust_starts,
+                                'Dust Event End (m)':   dust_starts + rng.uniform(0.05, 0.5, len(dust_starts))})
+
+    manual_starts = np.sort(rng.uniform(start_depth, end_depth, max(int(span * manual_per_m), 1)))
+    manual = pd.DataFrame({'Depth Start (m)': manual_starts,
+                           'Depth End (m)':   manual_starts + rng.uniform(0.01, 0.3, len(manual_starts))})
+
+    return {'cfa': cfa, 'volcanic_record': volcanic_record, 'breaks': breaks,
+            'annual_depths': annual_depths, 'dust_events': dust_events, 'manual': manual}
+
+#%%
+# Function to save synthetic data to a data folder, with the usual file names
+# The folder can then be processed like the real data, e.g. python -m spicecore_dust --data-folder folder
+# Inputs: Dictionary of input dataframes (from make_synthetic_inputs), data folder
+# Output: None
+
+def save_synthetic_data(inputs, data_folder):
+
+    os.makedirs(data_folder, exist_ok = True)
+    inputs['cfa'].to_csv(os.path.join(data_folder, PHASE1_FILES['cfa']))
+    inputs['volcanic_record'].to_excel(os.path.join(data_folder, PHASE1_FILES['volcanic_record']), index = False)
+    inputs['breaks'].to_excel(os.path.join(data_folder, PHASE1_FILES['breaks']), index = False)
+    inputs['annual_depths'].to_excel(os.path.join(data_folder, PHASE1_FILES['annual_depths']),
+                                     sheet_name = 'Depth-Age Scale', index = False)
+    inputs['dust_events'].to_excel(os.path.join(data_folder, PHASE1_FILES['dust_events']), index = False)
+    inputs['manual'].to_excel(os.path.join(data_folder, MANUAL_FILE), index = False)
@@ -36,15 +36,16 @@ print('.......................................................')
 # Import needed modules & packages
 import pandas as pd
 import os 
+import sys
 import numpy  as np
 from datetime import date
 
 # Ask user for directory where scripts are located
 directory = input('Enter path for SPICEcore dust scripts: ')
-os.chdir(directory)
+sys.path.insert(0, directory)
 
-# Run script with function definitions
-exec(open('SPICEcore_Dust_Processing_Functions.py').read())
+# Import the function definitions from the spicecore_dust package
+from spicecore_dust.functions import *
 
 # Ask user for directory where data are located
 directory = input('Enter path for SPICEcore dust data: ')
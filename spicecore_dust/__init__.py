@@ -0,0 +1,55 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore DUST PROCESSING PACKAGE
+#
+# Importable Phase 1 and Phase 2 dust processing for the South Pole Ice Core (SPICEcore)
+#
+#    from spicecore_dust import load_phase1_inputs, run_phase1, run_phase2
+#
+#    inputs             = load_phase1_inputs('path/to/data')
+#    cfa_phase1, errors = run_phase1(inputs, config)
+#    cfa, bad_cfa, errors = run_phase2(cfa_phase1, config)
+#
+# Modules:
+#    - cfa_index:   Sorted depth & age index for fast select_cfa range queries
+#    - config:      Default processing settings and config files
+#    - cli:         Command-line entry point (python -m spicecore_dust)
+#    - formats:     CSV, Parquet, and Arrow files for the cleaned CFA data
+#    - functions:   Functions used in Phase 1 and Phase 2 data cleaning
+#    - handoff:     Memory-mapped Phase 1 -> Phase 2 handoff
+#    - incremental: Reprocessing only the depth ranges where reference tables changed
+#    - ledger:      Error type recorded for each removed CFA row
+#    - outliers:    Registry of Phase 2 outlier methods, run together over shared arrays
+#    - partition:   Phase 1 & Phase 2 on depth shards in parallel worker processes
+#    - phase1:      Phase 1 processing (melter error removal)
+#    - phase2:      Phase 2 processing (outlier and contamination removal)
+#    - report:      Run reports with the time & memory use of each processing stage
+#    - rolling:     Fast rolling medians for MAD backgrounds
+#    - resample:    Age-binned resampling of particle concentration & CPP, for many bin widths at once
+#    - schema:      Compact column types for CFA data
+#    - stats:       One-pass summary statistics, with median & MAD by selection
+#    - sweep:       MAD window & threshold sensitivity sweeps
+# ---------------------------------------------------------------------------------------
+
+from .cfa_index import CFAIndex
+from .config    import DEFAULT_CONFIG, make_config, load_config
+from .formats   import OUTPUT_FORMATS, CFAWriter, save_cfa, patch_csv, find_cfa_file, load_cfa
+from .functions import (load_cached, detect_bubbles, remove_melter_errors, correct_meltday,
+                        label_intervals, label_core_breaks, label_volc_events, label_dust_events,
+                        label_manual_removal, find_cpp, find_humps, median_absolute_deviation, find_MAD_outliers,
+                        remove_outliers_MAD, block_integrals, integral_limit, find_integral_contamination, select_cfa,
+                        summary_statistics, find_depth_gaps, segment_gaps)
+from .handoff   import save_handoff, map_handoff, remove_handoff
+from .incremental import (make_manifest, save_manifest, load_manifest, save_state, remove_state, changed_windows,
+                          run_incremental)
+from .ledger    import ERROR_TYPES, PHASE1_ERRORS, PHASE2_ERRORS, get_ledger, set_ledger, record_errors, count_errors, error_rows
+from .phase1    import load_phase1_inputs, run_phase1, export_phase1, stream_phase1
+from .phase2    import load_phase2_inputs, run_phase2, export_phase2
+from .outliers  import (OUTLIER_METHODS, SHARED_ARRAYS, OutlierArrays, register_shared_array, register_outlier_method,
+                        chosen_methods, find_outliers)
+from .partition import run_partitioned
+from .report    import PHASE1_STAGES, PHASE2_STAGES, new_report, stage, add_stages, save_report
+from .resample  import RESAMPLE_COLUMNS, resample_cfa, export_resample
+from .rolling   import rolling_median
+from .schema    import CFA_DTYPES, FLAG_BITS, compact_cfa, expand_cfa, get_flag, set_flag
+from .stats     import column_statistics, print_statistics
+from .sweep     import run_sweep, export_sweep
@@ -0,0 +1,6 @@
+# Run SPICEcore dust processing from the command line: python -m spicecore_dust --help
+import sys
+
+from .cli import main
+
+sys.exit(main())
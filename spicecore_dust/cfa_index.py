@@ -0,0 +1,103 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore CFA DEPTH & AGE INDEX
+#
+# Fast depth and age range queries on continuous flow analysis (CFA) data
+#    - Built once per dataset: sorted depth and AgeBP values, with the row position of each value
+#    - Each range query is 2 binary searches (searchsorted) instead of 2 full scans of the data
+#    - Rows with NaN depths or ages (e.g. rows NaN'd in Phase 1) are never selected, as in select_cfa
+#    - When the selected rows are next to each other (the usual case after Phase 1, when depth and age
+#      are increasing), the result is a slice of the CFA data instead of a copy
+#    - Opt-in: select_cfa only uses the index when it is given a CFAIndex instead of a dataframe. No processing
+#      stage builds one (manual removal uses the sorted searches of label_manual_removal), so it is for scripts
+#      which call select_cfa for many ranges (e.g. Benchmarks/Select_CFA_Benchmark.py, below)
+#
+# Build the index after rows are NaN'd or changed: it doesn't see later changes to depth or age
+#
+#    cfa_index = CFAIndex(cfa)
+#    for start, end in intervals:
+#        cfa_interval = select_cfa(cfa_index, start, end, 'AgeBP')
+#
+# List of classes:
+#
+#  1) CFAIndex: Sorted depth and age index of CFA data, for range queries
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+
+# Columns which can be searched
+INDEX_COLUMNS = ['Depth (m)', 'AgeBP']
+
+#%%
+# Class for the sorted depth and age index of CFA data
+# Input: CFA dataframe (kept by the index, not copied)
+#
+# Methods:
+#    rows(lower, upper, variable):   Row positions with lower <= variable < upper, in row order
+#    select(lower, upper, variable): Subset of the CFA data with lower <= variable < upper
+
+class CFAIndex:
+
+    def __init__(self, cfa_data):
+
+        self.cfa_data = cfa_data
+        # Sorted values and their row positions for each column, and whether the column was already sorted
+        self.values    = {}
+        self.positions = {}
+        self.is_sorted = {}
+
+        for column in INDEX_COLUMNS:
+            if column not in cfa_data.columns:
+                continue
+            values    = cfa_data[column].to_numpy(dtype = 'float')
+            positions = np.flatnonzero(~np.isnan(values))
+            values    = values[positions]
+
+            # Depth and age columns are already increasing after Phase 1. Only sort if needed.
+            is_sorted = bool(np.all(values[1:] >= values[:-1]))
+            if not is_sorted:
+                order     = np.argsort(values, kind = 'stable')
+                positions = positions[order]
+                values    = values[order]
+
+            self.values[column]    = values
+            self.positions[column] = positions
+            self.is_sorted[column] = is_sorted
+
+    # Function to get the row positions in a depth or age range
+    # Inputs: Starting value, ending value (not included), column ('Depth (m)' or 'AgeBP')
+    # Output: Array of row positions, in row order
+
+    def rows(self, lower, upper, variable):
+
+        if variable not in self.values:
+            raise KeyError('CFA index has no column ' + repr(variable) + ' (columns: ' + ', '.join(self.values) + ')')
+
+        # No rows are selected with NaN limits (all comparisons with NaN are False)
+        if np.isnan(lower) or np.isnan(upper):
+            return self.positions[variable][:0]
+
+        start = np.searchsorted(self.values[variable], lower, side = 'left')
+        end   = np.searchsorted(self.values[variable], upper, side = 'left')
+        positions = self.positions[variable][start:max(start, end)]
+
+        if not self.is_sorted[variable]:
+            positions = np.sort(positions)
+        return positions
+
+    # Function to get the subset of CFA data in a depth or age range
+    # Same rows as select_cfa on the CFA dataframe
+    # Inputs: Starting value, ending value (not included), column ('Depth (m)' or 'AgeBP')
+    # Output: Subset of CFA data (a slice of the CFA data if the rows are next to each other)
+
+    def select(self, lower, upper, variable):
+
+        positions = self.rows(lower, upper, variable)
+
+        # Rows next to each other: take a slice instead of copying them
+        if len(positions) == 0 or positions[-1] - positions[0] == len(positions) - 1:
+            start = positions[0] if len(positions) > 0 else 0
+            return self.cfa_data.iloc[start:start + len(positions)]
+
+        return self.cfa_data.iloc[positions]
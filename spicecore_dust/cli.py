@@ -0,0 +1,244 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore DUST PROCESSING COMMAND LINE
+#
+# Runs Phase 1 and/or Phase 2 dust processing without any prompts, for scheduled or batch runs
+# Settings come from a TOML/YAML config file and/or command-line flags (flags win)
+# Saves a run report for each phase next to the results (see report.py)
+#
+#    python -m spicecore_dust --data-folder path/to/data
+#    python -m spicecore_dust --phase 2 --phase1-file Cleaned_CFA_Phase1_2020-07-16.csv --window 1000
+#    python -m spicecore_dust --config run1.toml --output-folder results/run1
+#    python -m spicecore_dust --phase 1 --chunk-rows 1000000
+#    python -m spicecore_dust --data-folder path/to/data --incremental
+#    python -m spicecore_dust --data-folder path/to/data --partitioned --processes 8
+#    python -m spicecore_dust --data-folder path/to/data --profile-stage mad_outliers
+#    python -m spicecore_dust --data-folder path/to/data --outlier-methods mad integral
+#    python -m spicecore_dust --data-folder path/to/data --output-format parquet --no-archive-csv
+#    python -m spicecore_dust --data-folder path/to/data --resample-widths 1 10 100
+#    python -m spicecore_dust --phase 2 --phase1-file Cleaned_CFA_Phase1_2020-07-16.csv --sweep-windows 100 500 1000 2000 --sweep-thresholds 1.5 2 3 4
+#
+# List of functions:
+#
+#  1) make_parser: Get the command-line argument parser
+#  2) main:        Run dust processing from command-line arguments (and resample the results onto AgeBP bins)
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import argparse
+import os
+import pandas as pd
+
+from .config import make_config, load_config
+from .phase1 import load_phase1_inputs, run_phase1, export_phase1, stream_phase1
+from .phase2 import load_phase2_inputs, run_phase2, export_phase2
+from .sweep  import run_sweep, export_sweep
+from .incremental import (make_manifest, save_manifest, load_manifest, save_state, remove_state, changed_windows,
+                          run_incremental)
+from .report import PHASE1_STAGES, PHASE2_STAGES, new_report, stage
+from .formats import OUTPUT_FORMATS
+from .handoff import save_handoff, remove_handoff
+from .partition import run_partitioned
+from .outliers import OUTLIER_METHODS
+from .resample import RESAMPLE_CACHE, resample_cfa, export_resample
+
+#%%
+# Function to get the command-line argument parser
+# Input: None
+# Output: argparse parser
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog = 'python -m spicecore_dust',
+                                     description = 'Run SPICEcore dust processing without prompts.')
+
+    parser.add_argument('--phase', choices = ['all', '1', '2'], default = 'all',
+                        help = "'all' runs Phase 1 & Phase 2, '1' runs Phase 1 only, '2' runs Phase 2 only (default: all)")
+    parser.add_argument('--config', help = 'TOML or YAML file with processing settings')
+
+    # Settings. None means 'use the config file or the default'.
+    parser.add_argument('--data-folder',   dest = 'data_folder',   help = 'Folder with the data files')
+    parser.add_argument('--output-folder', dest = 'output_folder', help = 'Folder to save results to (default: data folder)')
+    parser.add_argument('--phase1-file',   dest = 'phase1_file',   help = 'CFA file after Phase 1 processing, for --phase 2')
+
+    parser.add_argument('--output-format', dest = 'output_format', choices = list(OUTPUT_FORMATS),
+                        help = "Format of the cleaned CFA files: 'csv', 'parquet', or 'arrow' (default: csv). Phase 2 loads Parquet & Arrow files automatically.")
+    parser.add_argument('--no-archive-csv', dest = 'archive_csv', action = 'store_false', default = None,
+                        help = 'Only save the Parquet or Arrow files, without a CSV copy')
+    parser.add_argument('--row-group-depth', dest = 'row_group_depth', type = float,
+                        help = 'Depth interval of each Parquet row group or Arrow record batch, in m (default: 10)')
+    parser.add_argument('--no-mmap-handoff', dest = 'mmap_handoff', action = 'store_false', default = None,
+                        help = 'Keep the Phase 1 data in memory for Phase 2, instead of memory-mapped files (--phase all)')
+    parser.add_argument('--compact-dtypes', dest = 'compact_dtypes', action = 'store_true', default = None,
+                        help = 'Keep CFA data in compact column types (about half the memory)')
+    parser.add_argument('--incremental', dest = 'incremental', action = 'store_true', default = None,
+                        help = 'Only reprocess depth ranges where core breaks, dust events, or manual cleaning intervals changed since the last run (--phase all)')
+    parser.add_argument('--partitioned', dest = 'partitioned', action = 'store_true', default = None,
+                        help = 'Run Phase 1 & Phase 2 on depth shards of the core in parallel worker processes (--phase all, CSV files only)')
+    parser.add_argument('--profile-stage', dest = 'profile_stage', choices = list(dict.fromkeys(PHASE1_STAGES + PHASE2_STAGES)),
+                        help = 'Profile this processing stage with cProfile, saving a .prof file next to the run report')
+    parser.add_argument('--chunk-rows',        dest = 'chunk_rows',        type = int,   help = 'Run Phase 1 on this many raw CFA rows at a time, for files too large to load at once')
+    parser.add_argument('--bubble-threshold',  dest = 'bubble_threshold',  type = float, help = 'ECM slope threshold for bubbles (default: 25)')
+    parser.add_argument('--core-break-buffer', dest = 'core_break_buffer', type = float, help = 'Depth buffer around core breaks, in m (default: 0.03)')
+    parser.add_argument('--volc-start-buffer', dest = 'volc_start_buffer', type = float, help = 'Years before volcanic events to label (default: 2)')
+    parser.add_argument('--volc-end-buffer',   dest = 'volc_end_buffer',   type = float, help = 'Years after volcanic events to label (default: 6)')
+    parser.add_argument('--depth-gaps',        dest = 'depth_gaps',        action = 'store_true', default = None,
+                        help = "Number the contiguous depth segments ('Segment' column) and save a table of the depth gaps")
+    parser.add_argument('--gap-depth',         dest = 'gap_depth',         type = float, help = 'Depth jump which starts a new segment, in m (default: 0.03)')
+    parser.add_argument('--remove-humps',      dest = 'remove_humps',      action = 'store_true', default = None,
+                        help = 'Remove hump-shaped particle size distribution (PSD) anomalies before the MAD outliers')
+    parser.add_argument('--outlier-methods',   dest = 'outlier_methods',   choices = list(OUTLIER_METHODS), nargs = '+',
+                        help = 'Outlier methods: mad (MAD peaks above background medians), integral (blocks with high trapezoid integrals), and/or humps (default: mad)')
+    parser.add_argument('--window',            dest = 'window',            type = int,   help = 'Number of measurements for MAD background medians (default: 500)')
+    parser.add_argument('--mad-threshold',     dest = 'mad_threshold',     type = float, help = 'MAD outlier threshold (default: 2)')
+    parser.add_argument('--integral-block',    dest = 'integral_block',    type = int,   help = 'Number of rows in each block for the integral method (default: 2)')
+    parser.add_argument('--integral-threshold', dest = 'integral_threshold', type = float,
+                        help = 'Standard deviations above the median integral for the integral method (default: 2)')
+
+    parser.add_argument('--preserve-volcanic', dest = 'preserve_volcanic', action = 'store_true', default = None,
+                        help = 'Preserve outliers at volcanic events (default)')
+    parser.add_argument('--no-preserve-volcanic', dest = 'preserve_volcanic', action = 'store_false',
+                        help = 'Remove outliers at volcanic events')
+    parser.add_argument('--print-stats', dest = 'print_stats', action = 'store_true', default = None,
+                        help = 'Print summary statistics before and after Phase 2')
+    parser.add_argument('--resample-widths', dest = 'resample_widths', type = float, nargs = '+',
+                        help = 'Resample the Phase 2 concentration & CPP onto AgeBP bins of these widths, in years')
+
+    # Sensitivity sweep. Replaces Phase 2 with a table of results for every combination of settings.
+    parser.add_argument('--sweep-windows',    dest = 'sweep_windows',    type = int,   nargs = '+',
+                        help = 'Run a MAD sweep over these window sizes instead of Phase 2')
+    parser.add_argument('--sweep-thresholds', dest = 'sweep_thresholds', type = float, nargs = '+',
+                        help = 'Run a MAD sweep over these MAD thresholds instead of Phase 2')
+    parser.add_argument('--sweep-volcanic',   dest = 'sweep_volcanic',   choices = ['both', 'preserve', 'remove'], default = 'both',
+                        help = 'Volcanic outlier options to sweep over (default: both)')
+    parser.add_argument('--processes', dest = 'processes', type = int,
+                        help = 'Number of worker processes for --partitioned runs and sweeps (default: all cores)')
+
+    return parser
+
+#%%
+# Function to resample the cleaned Phase 2 data onto AgeBP bins, if the 'resample_widths' setting is on
+# Results are cached in a 'Resample_Cache' folder in the output folder (see resample.py)
+# Inputs: Cleaned Phase 2 CFA dataframe (or the name of the saved CSV file), folder to save to, config dictionary
+# Output: None
+
+def _resample(cfa, output_folder, config):
+
+    if not config['resample_widths']:
+        return
+
+    if isinstance(cfa, str):
+        # Only the columns needed for resampling, with the values exactly as saved
+        columns = ['Depth (m)', 'AgeBP', 'Segment', 'Sum 1.1-12', 'CPP']
+        cfa = pd.read_csv(cfa, usecols = lambda column: column in columns, float_precision = 'round_trip')
+
+    print('\nResampling onto AgeBP bins of', ', '.join('%g' % width for width in config['resample_widths']), 'years.')
+    resampled = resample_cfa(cfa, config['resample_widths'], cache_folder = os.path.join(output_folder, RESAMPLE_CACHE))
+    export_resample(resampled, output_folder)
+
+#%%
+# Function to run dust processing from command-line arguments
+# Never asks for input: anything not set by a flag or the config file uses the default setting
+# Input: List of command-line arguments (None uses sys.argv)
+# Output: Exit code (0 if processing finished)
+
+def main(args = None):
+    parser = make_parser()
+    args   = parser.parse_args(args)
+
+    # Start from the config file (or the defaults), then apply any flags
+    config  = load_config(args.config) if args.config else make_config()
+    changes = {setting: value for setting, value in vars(args).items()
+               if setting in config and value is not None}
+    config  = make_config(config, **changes)
+
+    # Don't ask the user about volcanic outliers. Preserving them is the default.
+    if config['preserve_volcanic'] is None:
+        config['preserve_volcanic'] = True
+
+    if args.phase == '2' and config['phase1_file'] is None:
+        parser.error('--phase 2 needs --phase1-file (or phase1_file in the config file)')
+
+    data_folder   = config['data_folder']
+    output_folder = config['output_folder'] or data_folder
+    os.makedirs(output_folder, exist_ok = True)
+    sweep = args.sweep_windows or args.sweep_thresholds
+
+    # Time, memory, and rows of each processing stage
+    phase1_report = new_report('Phase 1', config)
+    phase2_report = new_report('Phase 2', config)
+
+    if args.phase == 'all' and config['incremental'] and not sweep:
+        # Compare the reference tables with the last run. None means a full run is needed.
+        manifest = load_manifest(output_folder)
+        windows  = changed_windows(manifest, data_folder, config)
+        if windows is not None:
+            with stage(phase1_report, 'incremental'):
+                cfa_phase1, cfa, bad_cfa, phase2_errors, rows = run_incremental(manifest, *windows, data_folder, config)
+            # Only the reprocessed rows are saved again in the CSV files of the last run
+            phase1_file = export_phase1(cfa_phase1, output_folder, phase1_report, config, (manifest['files']['phase1'], rows))
+            phase2_file, bad_file = export_phase2(cfa, bad_cfa, output_folder, phase2_report, config,
+                                                  (manifest['files']['phase2'], rows))
+            state = {name: save_state(data, name, output_folder) for name, data in [('phase1', cfa_phase1), ('phase2', cfa)]}
+            save_manifest(make_manifest(data_folder, config, phase1_file, phase2_file, state), output_folder)
+            _resample(cfa, output_folder, config)
+            return 0
+
+    if args.phase == 'all' and config['partitioned'] and not sweep:
+        # Both phases on depth shards in worker processes
+        phase1_file, phase2_file, bad_file, phase1_errors, phase2_errors = run_partitioned(
+            data_folder, output_folder, config, config['processes'], phase1_report = phase1_report, phase2_report = phase2_report)
+        remove_state(output_folder)
+        save_manifest(make_manifest(data_folder, config, phase1_file, phase2_file), output_folder)
+        _resample(phase2_file, output_folder, config)
+        return 0
+
+    # Phase 1 & Phase 2 data saved for the next --incremental run
+    state = {}
+    if args.phase in ['all', '1'] and config['chunk_rows']:
+        # Stream Phase 1 to CSV, then load the result for Phase 2
+        phase1_file, phase1_errors = stream_phase1(data_folder, output_folder, config, config['chunk_rows'], phase1_report)
+        if args.phase == 'all':
+            cfa_phase1, manual = load_phase2_inputs(os.path.abspath(phase1_file), data_folder, config['compact_dtypes'])
+    elif args.phase in ['all', '1']:
+        inputs = load_phase1_inputs(data_folder, compact = config['compact_dtypes'])
+        cfa_phase1, phase1_errors = run_phase1(inputs, config, phase1_report)
+        phase1_file = export_phase1(cfa_phase1, output_folder, phase1_report, config)
+        manual = None
+        # The raw CFA data aren't needed for Phase 2
+        del inputs
+
+        if args.phase == 'all' and config['incremental'] and not sweep:
+            state['phase1'] = save_state(cfa_phase1, 'phase1', output_folder)
+
+        # Hand the Phase 1 data to Phase 2 through memory-mapped files, instead of keeping them in memory
+        if args.phase == 'all' and config['mmap_handoff'] and not sweep:
+            cfa_phase1 = save_handoff(cfa_phase1, output_folder)
+    else:
+        cfa_phase1, manual = load_phase2_inputs(config['phase1_file'], data_folder, config['compact_dtypes'])
+
+    if args.phase in ['all', '2'] and sweep:
+        # Settings not swept use the config value
+        windows    = args.sweep_windows    or [config['window']]
+        thresholds = args.sweep_thresholds or [config['mad_threshold']]
+        preserve_options = {'both': (True, False), 'preserve': (True,), 'remove': (False,)}[args.sweep_volcanic]
+        sweep = run_sweep(cfa_phase1, windows, thresholds, preserve_options, config['processes'])
+        export_sweep(sweep, output_folder)
+
+    elif args.phase in ['all', '2']:
+        cfa, bad_cfa, phase2_errors = run_phase2(cfa_phase1, config, manual, phase2_report)
+        phase2_file, bad_file = export_phase2(cfa, bad_cfa, output_folder, phase2_report, config)
+        _resample(cfa, output_folder, config)
+
+        # Save the settings & reference tables of this run, for --incremental runs
+        if args.phase == 'all':
+            if state:
+                state['phase2'] = save_state(cfa, 'phase2', output_folder)
+            else:
+                remove_state(output_folder)
+            save_manifest(make_manifest(data_folder, config, phase1_file, phase2_file, state), output_folder)
+
+        # The handoff files are only needed until Phase 2 is saved
+        if isinstance(cfa_phase1, str):
+            remove_handoff(cfa_phase1)
+
+    return 0
@@ -0,0 +1,147 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore DUST PROCESSING SETTINGS
+#
+# Default settings for Phase 1 and Phase 2 dust processing
+# Pass a config dictionary to run_phase1 / run_phase2 to change them
+#
+# Settings can also be saved in a TOML or YAML config file, with one line per setting, e.g.
+#
+#    data_folder       = "path/to/data"
+#    window            = 1000
+#    preserve_volcanic = true
+#
+# List of functions:
+#
+#  1) make_config: Get a config dictionary with the default settings, updated with any changes
+#  2) load_config: Load settings from a TOML or YAML config file
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import os
+
+#%%
+# Default settings
+DEFAULT_CONFIG = {
+    # Folder with the data files
+    'data_folder':           '.',
+    # Folder to save results to. None saves them to the data folder.
+    'output_folder':         None,
+    # CFA file after Phase 1 processing, for Phase 2-only runs (in the data folder)
+    'phase1_file':           None,
+    # Keep CFA data in compact column types (float32, packed event labels; see schema.py)?
+    # Uses about half the memory. Flow rate & ECM keep ~7 significant digits instead of ~16.
+    'compact_dtypes':        False,
+    # Only reprocess depth ranges where the core breaks, dust events, or manual cleaning intervals changed
+    # since the last run (see incremental.py)? Runs everything if there is no manifest from an earlier run.
+    'incremental':           False,
+    # Format of the cleaned CFA files: 'csv', 'parquet', or 'arrow' (see formats.py). Parquet & Arrow need pyarrow.
+    'output_format':         'csv',
+    # Also save a CSV copy of Parquet or Arrow files, for archiving?
+    'archive_csv':           True,
+    # Depth interval of each Parquet row group or Arrow record batch (m)
+    'row_group_depth':       10,
+    # Hand the Phase 1 data to Phase 2 through memory-mapped files, when running both phases (see handoff.py)?
+    # Phase 2 then doesn't keep a second full copy of the CFA data in memory.
+    'mmap_handoff':          True,
+    # Run Phase 1 & Phase 2 on depth shards of the core in a pool of worker processes (see partition.py)?
+    # Saves the same files as a normal run. CSV output only.
+    'partitioned':           False,
+    # Number of worker processes for partitioned runs and MAD sweeps. None uses all cores.
+    'processes':             None,
+    # Stage to profile with cProfile, saved next to the run report (see report.py). None profiles nothing.
+    'profile_stage':         None,
+
+    # Phase 1
+    # Number of raw CFA rows to process at a time, for files too large to load at once. None loads the whole file.
+    'chunk_rows':            None,
+    # Liquid conductivity slope threshold for bubbles (+/- ECM units per meter)
+    'bubble_threshold':      25,
+    # Depth buffer around core breaks (+/- meters)
+    'core_break_buffer':     0.03,
+    # Years before (+) and after (-) each volcanic event to label
+    'volc_start_buffer':     2,
+    'volc_end_buffer':       6,
+    # Find depth gaps between measurements, and number the contiguous segments between them?
+    # Adds a 'Segment' column to the CFA data, and saves a table of the gaps (Depth_Gaps_Phase1_...)
+    'depth_gaps':            False,
+    # Depth jump which starts a new segment (m)
+    'gap_depth':             0.03,
+
+    # Phase 2
+    # Remove hump-shaped particle size distribution (PSD) anomalies before the other outliers? (Same as adding 'humps'
+    # to the outlier methods)
+    # (Rows where every 3.2-10 um bin is above the mean of the 1.5-2.9 um bins, outside dust & volcanic events)
+    'remove_humps':          False,
+    # Outlier methods to use (see outliers.py): 'mad' (peaks above a rolling median background, by MAD),
+    # 'integral' (blocks of rows with high CPP & particle concentration trapezoid integrals), and/or 'humps'
+    'outlier_methods':       ['mad'],
+    # Number of measurements to use for background medians
+    'window':                500,
+    # Threshold for accepted Median Absolute Deviations (MAD) (e.g., 2 * MAD)
+    'mad_threshold':         2,
+    # Number of rows in each block for the integral method, and the number of standard deviations
+    # above the median integral which are contamination
+    'integral_block':        2,
+    'integral_threshold':    2,
+    # Preserve outliers at volcanic events? True/False. None asks the user.
+    'preserve_volcanic':     None,
+    # Print summary statistics before and after Phase 2?
+    'print_stats':           False,
+
+    # Resampling
+    # AgeBP bin widths (years) to resample the cleaned Phase 2 particle concentration & CPP onto (see resample.py),
+    # e.g. [1, 10, 100]. None doesn't resample.
+    'resample_widths':       None,
+}
+
+#%%
+# Function to get a config dictionary with the default settings, updated with any changes
+# Inputs: Config dictionary (or None), any settings to change as keywords
+# Output: Complete config dictionary
+
+def make_config(config = None, **changes):
+
+    new_config = dict(DEFAULT_CONFIG)
+    if config is not None:
+        new_config.update(config)
+    new_config.update(changes)
+
+    # Catch misspelled settings, which would otherwise be silently ignored
+    unknown = set(new_config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise KeyError('Unknown setting(s): ' + ', '.join(sorted(unknown)))
+
+    return new_config
+
+#%%
+# Function to load settings from a TOML (.toml) or YAML (.yaml/.yml) config file
+# Settings which are not in the file keep their default values
+# Input: Config file name or path
+# Output: Complete config dictionary
+
+def load_config(file):
+
+    extension = os.path.splitext(file)[1].lower()
+
+    if extension == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            # Python < 3.11
+            import tomli as tomllib
+        with open(file, 'rb') as f:
+            settings = tomllib.load(f)
+
+    elif extension in ['.yaml', '.yml']:
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('PyYAML is needed to read YAML config files. Install it, or use a TOML config file.')
+        with open(file) as f:
+            settings = yaml.safe_load(f) or {}
+
+    else:
+        raise ValueError('Config file must be .toml, .yaml, or .yml: ' + file)
+
+    return make_config(settings)
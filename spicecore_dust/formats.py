@@ -0,0 +1,276 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore CFA OUTPUT FILE FORMATS
+#
+# Saves and loads the cleaned continuous flow analysis (CFA) data as CSV, Parquet, or Arrow IPC files
+#    - Parquet and Arrow files save and load much faster than CSV and keep the column types
+#      (True/False labels stay booleans, the 'Error Type' column stays categorical, and floats are exact)
+#    - Rows are written in groups of 'row_group_depth' meters of core (Parquet row groups, Arrow record
+#      batches), so a depth range can be read without reading the whole file
+#    - Parquet & Arrow files are zstd-compressed
+#    - A CSV copy is also saved for archiving, unless 'archive_csv' is False
+#    - Phase 2 and --incremental runs load a Parquet or Arrow file instead of the CSV with the same name,
+#      if there is one which is not older than the CSV
+#    - --incremental runs patch the CSV files of the last run: only the changed rows are formatted again
+#    - Parquet & Arrow files need pyarrow
+#
+# Output format settings: 'output_format' ('csv', 'parquet', or 'arrow'), 'archive_csv', 'row_group_depth'
+#
+# List of functions & classes:
+#
+#  1) CFAWriter:     Save CFA data to a CSV, Parquet, or Arrow file, all at once or chunk by chunk
+#  2) save_cfa:      Save CFA data to a CSV, Parquet, or Arrow file
+#  3) patch_csv:     Save CFA data to CSV by patching the CSV file of an earlier run with the same rows
+#  4) find_cfa_file: Get the Parquet or Arrow file saved with a CSV file, if there is one
+#  5) load_cfa:      Load CFA data from a Parquet or Arrow file
+#  6) format_name:   Get the name of the saved file format(s), for messages
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import os
+
+from .schema import expand_cfa
+
+# File extension of each output format
+OUTPUT_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+# Name of each output format, for messages
+FORMAT_NAMES   = {'csv': 'CSV', 'parquet': 'Parquet', 'arrow': 'Arrow'}
+# Number of bytes of a CSV file to read at a time, when finding its lines or copying them
+CSV_BLOCK_BYTES = 1 << 26
+
+#%%
+# Function to import pyarrow, with a clear message if it is not installed
+# Input: None
+# Output: pyarrow and pyarrow.parquet modules
+
+def _import_pyarrow():
+
+    try:
+        import pyarrow         as pa
+        import pyarrow.ipc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is needed for Parquet and Arrow files. Install it, or use output_format = 'csv'.")
+
+    return pa, pq
+
+#%%
+# Function to split CFA rows into groups of whole depth intervals
+# Rows without depth (e.g. NaN'd rows) go with the rows above them
+# Inputs: Depth column, depth interval of each group (m, None for one group)
+# Output: List of (start, end) row positions of each group
+
+def _depth_groups(depth, row_group_depth):
+
+    if row_group_depth is None or len(depth) == 0:
+        return [(0, len(depth))]
+
+    # Deepest depth so far. Rows before the first depth get -inf, so they are one group.
+    depth  = np.fmax.accumulate(np.asarray(depth, dtype = 'float'))
+    groups = np.floor(np.where(np.isnan(depth), -np.inf, depth) / row_group_depth)
+    starts = np.concatenate([[0], np.flatnonzero(groups[1:] != groups[:-1]) + 1])
+    ends   = np.append(starts[1:], len(depth))
+
+    return list(zip(starts, ends))
+
+#%%
+# Class to save CFA data to a CSV, Parquet, or Arrow file, all at once or chunk by chunk
+# Inputs: File name without extension, output format ('csv', 'parquet', or 'arrow'),
+#         whether to also save a CSV copy, depth interval of each row group (m)
+#
+# Methods:
+#    write(cfa): Add CFA data (a whole dataset or the next chunk) to the file(s)
+#    close():    Finish the file(s). Returns the name of the main file (Parquet, Arrow, or CSV).
+
+class CFAWriter:
+
+    def __init__(self, file_stem, output_format = 'csv', archive_csv = True, row_group_depth = 10):
+
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError('Output format must be one of ' + ', '.join(OUTPUT_FORMATS) + ': ' + repr(output_format))
+
+        self.output_format   = output_format
+        self.row_group_depth = row_group_depth
+        self.file            = file_stem + OUTPUT_FORMATS[output_format]
+        self.csv_file        = file_stem + '.csv' if output_format == 'csv' or archive_csv else None
+        self.first_chunk     = True
+        self.writer          = None
+
+        if output_format != 'csv':
+            self.pa, self.pq = _import_pyarrow()
+
+    # Function to add CFA data to the file(s)
+    # Input: CFA dataframe (compact or not; event labels are saved as True/False columns)
+    # Output: None
+
+    def write(self, cfa_data):
+
+        cfa_data = expand_cfa(cfa_data)
+
+        # The CSV copy is written first, so it is never newer than the Parquet or Arrow file
+        if self.csv_file is not None:
+            cfa_data.to_csv(self.csv_file, mode = 'w' if self.first_chunk else 'a', header = self.first_chunk)
+        self.first_chunk = False
+
+        if self.output_format == 'csv':
+            return
+
+        table = self.pa.Table.from_pandas(cfa_data, preserve_index = True)
+        if self.writer is None:
+            if self.output_format == 'parquet':
+                self.writer = self.pq.ParquetWriter(self.file, table.schema, compression = 'zstd')
+            else:
+                self.writer = self.pa.ipc.new_file(self.file, table.schema,
+                                                   options = self.pa.ipc.IpcWriteOptions(compression = 'zstd'))
+
+        # One row group (or record batch) per depth interval
+        for start, end in _depth_groups(cfa_data['Depth (m)'], self.row_group_depth):
+            self.writer.write_table(table.slice(start, end - start))
+
+    # Function to finish the file(s)
+    # Input: None
+    # Output: Name of the main file
+
+    def close(self):
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+        return self.file
+
+#%%
+# Function to save CFA data to a CSV, Parquet, or Arrow file
+# Inputs: CFA dataframe, file name without extension, output format ('csv', 'parquet', or 'arrow'),
+#         whether to also save a CSV copy, depth interval of each row group (m)
+# Output: Name of the main file (Parquet, Arrow, or CSV)
+
+def save_cfa(cfa_data, file_stem, output_format = 'csv', archive_csv = True, row_group_depth = 10):
+
+    writer = CFAWriter(file_stem, output_format, archive_csv, row_group_depth)
+    writer.write(cfa_data)
+
+    return writer.close()
+
+#%%
+# Function to find where each line of a CSV file starts
+# Input: CSV file name or path
+# Output: Array of the byte position of each line, and the size of the file at the end
+
+def _line_starts(file):
+
+    line_ends = []
+    with open(file, 'rb') as f:
+        position = 0
+        while True:
+            block = f.read(CSV_BLOCK_BYTES)
+            if not block:
+                break
+            line_ends.append(position + np.flatnonzero(np.frombuffer(block, dtype = np.uint8) == ord('\n')) + 1)
+            position += len(block)
+
+    starts = np.concatenate([[0]] + line_ends)
+    # A last line without a line break still ends at the end of the file
+    return starts if starts[-1] == position else np.append(starts, position)
+
+#%%
+# Function to copy part of one open file to another
+# Inputs: Open file to copy from, open file to copy to, first and last (+1) byte positions
+# Output: None
+
+def _copy_bytes(source, target, start, end):
+
+    source.seek(start)
+    while start < end:
+        block = source.read(min(CSV_BLOCK_BYTES, end - start))
+        target.write(block)
+        start += len(block)
+
+#%%
+# Function to save CFA data to CSV by patching the CSV file of an earlier run with the same rows
+# Only the changed rows are formatted again. The lines of the other rows are copied from the old file,
+# which is much faster than formatting every row (e.g. for --incremental runs, see incremental.py).
+# Inputs: CFA dataframe (compact or not), file name without extension, name of the old CSV file,
+#         list of (start, end) positions of the changed rows
+# Output: Name of the saved CSV file (None if the old file doesn't have the same columns and number of rows,
+#         and nothing is saved)
+
+def patch_csv(cfa_data, file_stem, old_file, rows):
+
+    if not old_file.lower().endswith('.csv') or not os.path.exists(old_file):
+        return None
+
+    # The column names, then one line per row
+    line_starts = _line_starts(old_file)
+    if len(line_starts) != len(cfa_data) + 2:
+        return None
+    header = expand_cfa(cfa_data.iloc[:0]).to_csv().encode()
+
+    file = file_stem + '.csv'
+    # The old file can have the same name, so write to a temporary file first
+    with open(old_file, 'rb') as source, open(file + '.tmp', 'wb') as target:
+        if source.read(line_starts[1]) != header:
+            target.close()
+            os.remove(file + '.tmp')
+            return None
+        target.write(header)
+
+        # Row i is on line i + 1
+        copied = 0
+        for start, end in sorted(rows):
+            _copy_bytes(source, target, line_starts[copied + 1], line_starts[start + 1])
+            target.write(expand_cfa(cfa_data.iloc[start:end]).to_csv(header = False).encode())
+            copied = end
+        _copy_bytes(source, target, line_starts[copied + 1], line_starts[-1])
+
+    os.replace(file + '.tmp', file)
+
+    return file
+
+#%%
+# Function to get the Parquet or Arrow file saved with a CSV file, if there is one
+# A Parquet or Arrow file is only used if it is not older than the CSV file (or there is no CSV file)
+# Input: CFA file name or path
+# Output: Name of the Parquet or Arrow file with the same name, or the file name given
+
+def find_cfa_file(file):
+
+    file_stem, extension = os.path.splitext(file)
+    if extension.lower() != '.csv':
+        return file
+
+    for binary_extension in ['.parquet', '.arrow']:
+        binary_file = file_stem + binary_extension
+        if os.path.exists(binary_file) and (not os.path.exists(file) or
+                                            os.path.getmtime(binary_file) >= os.path.getmtime(file)):
+            return binary_file
+
+    return file
+
+#%%
+# Function to load CFA data from a Parquet or Arrow file
+# Column types and the row index are as they were saved
+# Input: Parquet (.parquet) or Arrow (.arrow) file name or path
+# Output: CFA dataframe
+
+def load_cfa(file):
+
+    pa, pq = _import_pyarrow()
+
+    if file.lower().endswith('.parquet'):
+        return pq.read_table(file).to_pandas()
+
+    with pa.ipc.open_file(file) as reader:
+        return reader.read_pandas()
+
+#%%
+# Function to get the name of the saved file format(s), for messages
+# Inputs: Output format ('csv', 'parquet', or 'arrow'), whether a CSV copy is also saved
+# Output: Format name, e.g. 'Parquet & CSV'
+
+def format_name(output_format, archive_csv = True):
+
+    if output_format != 'csv' and archive_csv:
+        return FORMAT_NAMES[output_format] + ' & CSV'
+    return FORMAT_NAMES[output_format]
@@ -0,0 +1,647 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore DUST PROCESSING FUNCTIONS
+
+# Module with function definitions for functions called in the Phase 1 and Phase 2 processing
+# No need to run this file on its own- import it from the spicecore_dust package
+#
+# List of functions:
+#
+#  1) load_cached:               Load a CSV or Excel file, using a fast binary copy saved after the first load
+#  2) detect_bubbles:            NaN all continuous flow analysis (CFA) rows where liquid conductivity slopes indicate bubbles
+#  3) remove_melter_errors:      NaN all rows with liquid conductivity, flow rate, depth, or Abakus errors in one pass
+#  4) correct_meltday:           Correct time units during melt day 7/19/2016
+#  5) label_intervals:           Find all rows (and the first row) within a list of depth or age intervals
+#  6) label_core_breaks:         Get a list of indices for each CFA row near a core break
+#  7) label_volc_events:         Get a list of indices for each row in a volcanic window (by age)
+#  8) label_dust_events:         Get a list of indices for each row in a dust event (by depth)
+#  9) label_manual_removal:      Get a list of indices for each row in a manual removal interval (by depth)
+# 10) find_cpp:                  Calculate CPP for a CFA dataframe
+# 11) find_humps:                Find hump-shaped particle size distribution (PSD) anomalies, and count the discrete events
+# 12) median_absolute_deviation: Calculate median absolute deviation (MAD) for one column of CFA data
+# 13) find_MAD_outliers:         Find rows where both CPP & particle concentration exceed their backgrounds by a MAD threshold
+# 14) remove_outliers_MAD:       Remove outliers from the CFA data, using MAD
+# 15) block_integrals:           Calculate trapezoid integrals over consecutive blocks of rows
+# 16) integral_limit:            Calculate the contamination limit of one column's block integrals
+# 17) find_integral_contamination: Find rows in blocks where both the CPP & particle concentration integrals are high
+# 18) select_cfa:                Subset CFA data for given depth or age range (fast with a CFAIndex)
+# 19) summary_statistics:        Print (and return) summary statistics for dust concentration & CPP during data cleaning
+# 20) find_depth_gaps:           Find depth gaps between measurements, and number the contiguous segments between them
+# 21) segment_gaps:              Get the depth gap table from a column of segment numbers
+    
+# Katie Anderson, 7/16/20
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import os
+import hashlib
+
+from .rolling import rolling_median
+from .ledger  import NO_ERROR, record_errors
+from .cfa_index import CFAIndex, INDEX_COLUMNS
+from .stats   import column_statistics, print_statistics
+
+# Abakus bins compared to find PSD humps: a hump has every 3.2-10 um bin above the mean of the 1.5-2.9 um bins
+HUMP_BINS  = ['3.2', '3.6', '4', '4.5', '5.1', '5.7', '6.4', '7.2', '8.1', '9', '10']
+SMALL_BINS = ['1.5', '1.6', '1.7', '1.8', '1.9', '2', '2.1', '2.2', '2.3', '2.4', '2.5', '2.7', '2.9']
+# Depth gap between hump rows which starts a new hump event (m, ~3 cm melt resolution)
+HUMP_GAP   = 0.03
+# Depth jump between measurements which starts a new contiguous segment (m)
+DEPTH_GAP  = 0.03
+
+#%%
+# Function to load a CSV or Excel file through a binary cache
+#    - The first load reads the original file and saves a Parquet copy in a 'Cache' folder next to it
+#      (a pickle copy if pyarrow is not installed)
+#    - Later loads read the Parquet copy, which takes milliseconds instead of seconds
+#    - The cache is matched to the file path, modification time, size, and read options,
+#      so editing or replacing the original file makes a new cache automatically
+# Inputs: File name or path, read options for pd.read_csv or pd.read_excel (e.g. sheet_name = ...)
+# Output: Dataframe
+
+def load_cached(file, **read_options):
+    
+    file = os.path.abspath(file)
+    file_info = os.stat(file)
+    cache_folder = os.path.join(os.path.dirname(file), 'Cache')
+    
+    # Name cache files by source file + a short key for the path & read options and one for the file version
+    path_key    = hashlib.md5(repr((file, sorted(read_options.items()))).encode()).hexdigest()[:8]
+    version_key = hashlib.md5(repr((file_info.st_mtime_ns, file_info.st_size)).encode()).hexdigest()[:12]
+    cache_name  = os.path.basename(file) + '_' + path_key + '_'
+    
+    # Load from the cache if it exists
+    for extension in ['.parquet', '.pkl']:
+        cache_file = os.path.join(cache_folder, cache_name + version_key + extension)
+        if os.path.exists(cache_file):
+            if extension == '.parquet': return pd.read_parquet(cache_file)
+            else:                       return pd.read_pickle(cache_file)
+    
+    # Otherwise read the original file
+    if file.lower().endswith(('.xlsx', '.xls')):
+        data = pd.read_excel(file, **read_options)
+    else:
+        data = pd.read_csv(file, **read_options)
+    
+    # Remove out-of-date caches of this file
+    os.makedirs(cache_folder, exist_ok = True)
+    for old_file in os.listdir(cache_folder):
+        if old_file.startswith(cache_name):
+            os.remove(os.path.join(cache_folder, old_file))
+    
+    # Save the cache. Write to a temporary file first so an interrupted run can't leave a broken cache.
+    cache_file = os.path.join(cache_folder, cache_name + version_key)
+    try:
+        data.to_parquet(cache_file + '.tmp')
+        os.replace(cache_file + '.tmp', cache_file + '.parquet')
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        # No pyarrow, or columns Parquet can't store (like non-text column names)
+        data.to_pickle(cache_file + '.tmp')
+        os.replace(cache_file + '.tmp', cache_file + '.pkl')
+    
+    return data
+
+#%%
+# Function to NaN all rows where liquid conductivity (ECM) slopes indicate air bubbles
+# A row is a bubble if the ECM slope from the row before is <= -threshold and the slope to the row after is >= threshold
+# Slopes are calculated for the whole dataset at once instead of looping through each row
+# Inputs: CFA dataframe, slope threshold (ECM units per meter)
+# Output: Indices of the bubble rows. Bubble rows are NaN'd in the CFA dataframe.
+
+def detect_bubbles(cfa_data, threshold):
+    
+    # Get depth and liquid conductivity as arrays
+    depth = cfa_data['Depth (m)'].to_numpy(dtype = 'float')
+    ecm   = cfa_data['ECM'].to_numpy(dtype = 'float')
+    
+    # Need a row before and a row after to calculate both slopes
+    if len(depth) < 3:
+        return cfa_data.index[:0]
+    
+    # Difference in depth & ECM between each row and the row before it
+    depth_diff = np.diff(depth)
+    ecm_diff   = np.diff(ecm)
+    
+    # Don't divide by 0. Skip rows with no change in depth before or after them.
+    # NaN depths are not skipped, but their slopes become NaN and never pass the thresholds.
+    valid = (depth_diff[:-1] != 0) & (depth_diff[1:] != 0)
+    
+    # Slope between each row and the row before it (slope1) and the row after it (slope2)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        slope1 = ecm_diff[:-1] / depth_diff[:-1]
+        slope2 = ecm_diff[1:]  / depth_diff[1:]
+    
+    # If slope1 <= -threshold and slope2 >= threshold, it's a bubble
+    # The first and last rows are never bubbles
+    bubbles = np.zeros(len(depth), dtype = bool)
+    bubbles[1:-1] = valid & (slope1 <= -threshold) & (slope2 >= threshold)
+    
+    # Change all values in the bubble rows to NaN
+    bubble_rows = cfa_data.index[bubbles]
+    cfa_data.loc[bubble_rows, :] = np.nan
+    
+    # Return indices of the bubble rows
+    return bubble_rows
+
+#%%
+# Function to NaN all rows with melter errors (Phase 1 steps 2-5)
+#    - Each error is a mask over the column arrays, instead of a separate pass over the dataframe
+#    - Errors are recorded in the error ledger in this order, and each row only keeps its first error:
+#      liquid conductivity < 0.6, no positive flow rate, depth not increasing, no depth value, infinite or negative Abakus values
+#    - All rows with new errors are NaN'd at once
+# Inputs: CFA dataframe, array of ledger codes (see ledger.py), last depth before this data (for data processed in chunks)
+# Output: Last depth in this data (before depth errors were removed).
+#         Error rows are NaN'd in the CFA dataframe and recorded in the ledger.
+
+def remove_melter_errors(cfa_data, ledger, previous_depth = np.nan):
+    
+    # Get columns as arrays
+    ecm    = cfa_data['ECM'].to_numpy(dtype = 'float')
+    flow   = cfa_data['Flow Rate'].to_numpy(dtype = 'float')
+    depth  = cfa_data['Depth (m)'].to_numpy(dtype = 'float')
+    abakus = cfa_data.loc[:, '1':'12'].to_numpy(dtype = 'float')
+    
+    # Rows without errors before this step
+    no_error = ledger == NO_ERROR
+    
+    # Liquid conductivity values < 0.6
+    record_errors(ledger, ecm < 0.6, 'Liquid Conductivity')
+    
+    # No positive flow rate value
+    record_errors(ledger, flow <= 0, 'Flow Rate')
+    
+    # Depth does not increase. Compare each depth with the depth in the row above it,
+    # skipping rows without depths or with the errors above
+    has_depth = np.flatnonzero((ledger == NO_ERROR) & ~np.isnan(depth))
+    bad_depth = np.zeros(len(cfa_data), dtype = bool)
+    if len(has_depth) > 0:
+        # The first row is compared with the last depth before this data, if there is one
+        depth_diff = np.diff(depth[has_depth], prepend = previous_depth)
+        previous_depth = depth[has_depth[-1]]
+        bad_depth[has_depth[depth_diff <= 0]] = True
+    record_errors(ledger, bad_depth, 'Depth Not Increasing')
+    
+    # No depth value, but some other data
+    has_data = cfa_data.notna().any(axis = 1).to_numpy()
+    record_errors(ledger, np.isnan(depth) & has_data, 'No Depth')
+    
+    # Infinite or negative Abakus values
+    record_errors(ledger, (np.isinf(abakus) | (abakus < 0)).any(axis = 1), 'Abakus')
+    
+    # Change all values in the new error rows to NaN
+    cfa_data.loc[no_error & (ledger != NO_ERROR), :] = np.nan
+    
+    return previous_depth
+
+#%%
+# Function to correct time units during melt day 7/19/2019
+# Inputs: CFA dataframe
+# Output: Corrected CFA dataframe
+
+def correct_meltday(cfa_data):
+    # Correcting low Abakus values during melt day 7/19/2016 (302-312 m)
+    # Multiply all Abakus values by 60. Data were recorded in /min, not /sec
+       
+    # Select data from Jul 19 (302-312 m), which need the correction
+    cfa_Jul19 = cfa_data.loc[cfa_data['Depth (m)'] >= 302].copy()
+    cfa_Jul19 = cfa_Jul19.loc[cfa_Jul19['Depth (m)'] <  312].copy()
+    
+    # Select only the Abakus columns
+    cfa_Jul19 = cfa_Jul19.loc[:, '1':'12']
+    
+    # Multiply all Abakus values by 60 to convert to /sec
+    cfa_Jul19 = cfa_Jul19.mul(60)
+    
+    # Update original CFA data with the new values in the corrected dataframe
+    cfa_data.update(cfa_Jul19)
+    
+    # Return corrected CFA dataframe
+    return(cfa_data)
+
+#%%
+# Function to find all rows within a list of intervals (inclusive on both ends)
+# Used for core breaks, volcanic events, and dust events
+#    - Sorts the column values once, then finds the edges of every interval with a binary search
+#    - Marks the rows in all intervals at once, instead of scanning the whole dataset for each interval
+#    - Rows with NaN values are never in an interval. Intervals with NaN limits are skipped.
+#    - Intervals include both limits, unless include_upper is False (lower <= value < upper)
+# Inputs: CFA column values (depth or age), arrays of lower and upper interval limits, whether to include upper limits
+# Outputs: Boolean array (True for rows in any interval), array of the first row position in each non-empty interval
+
+def label_intervals(values, lower, upper, include_upper = True):
+    
+    values = np.asarray(values, dtype = 'float')
+    lower  = np.asarray(lower,  dtype = 'float')
+    upper  = np.asarray(upper,  dtype = 'float')
+    
+    # Get row positions and values of rows with data
+    positions = np.flatnonzero(~np.isnan(values))
+    sorted_values = values[positions]
+    
+    # Depth and age columns are already increasing after Phase 1. Only sort if needed.
+    is_sorted = np.all(sorted_values[1:] >= sorted_values[:-1])
+    if not is_sorted:
+        order = np.argsort(sorted_values, kind = 'stable')
+        positions = positions[order]
+        sorted_values = sorted_values[order]
+    
+    # Find where each interval starts and ends in the sorted values
+    starts = np.searchsorted(sorted_values, lower, side = 'left')
+    ends   = np.searchsorted(sorted_values, upper, side = 'right' if include_upper else 'left')
+    
+    # Skip intervals without any CFA measurements (or with NaN limits)
+    non_empty = (ends > starts) & ~np.isnan(lower) & ~np.isnan(upper)
+    starts = starts[non_empty]
+    ends   = ends[non_empty]
+    
+    # Sweep through the sorted values: +1 where an interval opens, -1 where it closes
+    # Rows with a running total above 0 are within at least one interval
+    sweep = np.zeros(len(sorted_values) + 1, dtype = np.int64)
+    np.add.at(sweep, starts, 1)
+    np.add.at(sweep, ends,  -1)
+    in_interval = np.cumsum(sweep[:-1]) > 0
+    
+    rows = np.zeros(len(values), dtype = bool)
+    rows[positions[in_interval]] = True
+    
+    # Get the first row in each interval
+    if is_sorted or len(starts) == 0:
+        first_rows = positions[starts]
+    else:
+        # Sorted order is not row order here, so take the smallest row position in each interval
+        first_rows = np.array([positions[start:end].min() for start, end in zip(starts, ends)])
+    
+    return rows, first_rows
+
+#%%
+# Function to get indices of all CFA measurements taken within a specified core break range
+# Inputs: CFA dataframe, core breaks dataframe, specified +/- core break range (in meters)
+# Output: List of rows within core breaks, list of the first row within each core break
+
+def label_core_breaks(cfa_data, core_breaks, core_range):
+    
+    # Find rows within range of each core break
+    rows, first_rows = label_intervals(cfa_data['Depth (m)'], 
+                                       core_breaks['Depth (m)'] - core_range, 
+                                       core_breaks['Depth (m)'] + core_range)
+    
+    # Return list of indices occurring within core breaks, and the first index of each core break
+    return cfa_data.index[rows].tolist(), cfa_data.index[first_rows].tolist()
+#%%
+# Function to get indices of all CFA measurements taken within range of years around volcanic events
+# Inputs: Holocene CFA, Holocene volcanic dates, before/after buffers, in years
+# Output: List of rows within volcanic range, list of the first row within each volcanic event
+
+def label_volc_events(cfa_data, volc_record, start_buffer, end_buffer):
+    
+    # Find rows within the buffer years around each volcanic event
+    rows, first_rows = label_intervals(cfa_data['AgeBP'], 
+                                       volc_record['Start Year (b1950)'] - end_buffer, 
+                                       volc_record['Start Year (b1950)'] + start_buffer)
+            
+    # Return list of rows within buffer dates of volcanic events, and the first row of each event
+    return cfa_data.index[rows].tolist(), cfa_data.index[first_rows].tolist()
+#%%
+# Function to get a list of rows within dust events
+# Inputs: CFA data, dust event dataframe with depth intervals
+# Output: List of rows within dust events
+
+def label_dust_events(cfa_data, dust_depths):
+    
+    # Find rows within the depth range of each dust event
+    rows, first_rows = label_intervals(cfa_data['Depth (m)'], 
+                                       dust_depths['Dust Event Start (m)'], 
+                                       dust_depths['Dust Event End (m)'])
+            
+    # Return list of rows within dust events 
+    return cfa_data.index[rows].tolist()
+#%%
+# Function to get a list of rows within the manual removal intervals
+# Same rows as select_cfa for each interval (start <= depth < end), but all intervals are found at once
+# Inputs: CFA data, manual removal dataframe with depth intervals
+# Output: List of rows within manual removal intervals
+
+def label_manual_removal(cfa_data, manual):
+    
+    # Find rows within the depth range of each manual removal interval
+    rows, first_rows = label_intervals(cfa_data['Depth (m)'], 
+                                       manual['Depth Start (m)'], 
+                                       manual['Depth End (m)'], include_upper = False)
+    
+    # Return list of rows within manual removal intervals
+    return cfa_data.index[rows].tolist()
+#%%
+# Function to calculate CPP per measurement
+# Input: CFA data
+# Output: List of CPP for each row
+
+def find_cpp(cfa_data):
+   
+    # Create dataframe to record particle sums. Need to prevent dividing by 0
+    cpp_df = pd.DataFrame(columns = ['Sum_All', 'Sum_Coarse'])
+    
+    col_list = ['1.1', '1.2', '1.3', '1.4', '1.5', '1.6', '1.7', '1.8', '1.9', 
+                '2', '2.1', '2.2', '2.3', '2.4', '2.5', '2.7', '2.9', '3.2', 
+                '3.6', '4', '4.5', '5.1', '5.7', '6.4', '7.2', '8.1', '9', 
+                '10', '12']
+    
+    # Sum particle counts for each measurement using the above columns
+    cpp_df['Sum_All'] = cfa_data[col_list].sum(min_count = 1, axis = 1)
+
+    # Remake the column lists for only the coarse particles (>= 4.5 um)
+    col_list = ['4.5', '5.1', '5.7', '6.4', '7.2', '8.1', '9', '10', '12']
+
+    # Sum coarse particle counts for each measurement using the above columns
+    cpp_df['Sum_Coarse'] = cfa_data[col_list].sum(min_count = 1, axis = 1)
+    
+    # Remove rows with 0 sum_all counts. Don't divide by 0
+    cpp_df = cpp_df[cpp_df['Sum_All'] > 0]
+
+    # Return a series of the percent of particles that are coarse per row
+    return(cpp_df['Sum_Coarse'] / cpp_df['Sum_All'] * 100)
+
+#%%
+# Function to find hump-shaped particle size distribution (PSD) anomalies, and count the discrete events
+#    - A row is a hump if every 3.2-10 um bin is above the mean of the 1.5-2.9 um bins (NaN bins are skipped
+#      in the mean; a NaN 3.2-10 um bin is never above it)
+#    - Works through the rows a block at a time, with the bins of each block in one 2-D array
+#    - Hump rows more than 3 cm apart (by depth) are separate events. Events are counted in the same pass.
+# Inputs: CFA data, boolean array of rows which can't be humps (e.g. dust & volcanic events, or None),
+#         depth gap between events (m), number of rows per block
+# Outputs: Boolean array (True for hump rows), number of discrete hump events
+
+def find_humps(cfa_data, exclude = None, gap = HUMP_GAP, block_rows = 65536):
+
+    bins  = [cfa_data[column].to_numpy() for column in SMALL_BINS + HUMP_BINS]
+    depth = cfa_data['Depth (m)'].to_numpy(dtype = 'float')
+
+    humps  = np.zeros(len(cfa_data), dtype = bool)
+    events = 0
+    # Depth of the last hump row so far (the first hump row always starts an event)
+    last_depth = -np.inf
+
+    for start in range(0, len(cfa_data), block_rows):
+        block = np.stack([np.asarray(values[start:start + block_rows], dtype = 'float') for values in bins])
+        small = block[:len(SMALL_BINS)]
+
+        # Mean of the 1.5-2.9 um bins in each row, skipping NaNs
+        valid = ~np.isnan(small)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            small_mean = np.where(valid, small, 0).sum(axis = 0) / valid.sum(axis = 0)
+
+        block_humps = (block[len(SMALL_BINS):] > small_mean).all(axis = 0)
+        if exclude is not None:
+            block_humps &= ~np.asarray(exclude[start:start + block_rows], dtype = bool)
+        humps[start:start + block_rows] = block_humps
+
+        # A new event starts wherever the depth jumps by the gap or more since the last hump row
+        hump_depths = depth[start:start + block_rows][block_humps]
+        if len(hump_depths) > 0:
+            events += int(np.count_nonzero(np.diff(hump_depths, prepend = last_depth) >= gap))
+            last_depth = hump_depths[-1]
+
+    return humps, events
+
+#%%
+# Function to calculate Median Absolute Deviation (MAD)
+# Inputs: One-dimensional dataset (like CFA particle concentration or CPP)
+# Output: MAD
+
+def median_absolute_deviation(x, axis = None):
+    # Get the absolute value of every element minus the overall mean
+    deviation = abs(x - x.median())
+    
+    # Return the median of that deviation
+    return deviation.median()
+#%%
+# Function to find rows where both CPP & particle concentration are outliers
+# Point is an outlier if it exceeds threshold * MAD from the background
+# Inputs: CPP, particle concentration, their background (rolling median) values, their MADs, MAD threshold
+# Output: Boolean array (True for rows where both are outliers)
+
+def find_MAD_outliers(cpp, conc, cpp_background, conc_background, cpp_mad, conc_mad, threshold):
+    
+    cpp_peaks  = np.asarray(cpp)  >= (np.asarray(cpp_background)  + threshold * cpp_mad)
+    conc_peaks = np.asarray(conc) >= (np.asarray(conc_background) + threshold * conc_mad)
+    
+    return cpp_peaks & conc_peaks
+#%%
+# Function to remove outliers given different background & sensitivity conditions
+# Inputs: CFA data, list of dust event rows, list of volcanic event rows, background window size, MAD threshold,
+#         whether to preserve outliers at volcanic events (True/False; None asks the user)
+# Outputs: Dataframe with overlapping outliers removed, list of outlier indices
+
+def remove_outliers_MAD(cfa_data, dust_indices, volc_indices, background_interval, threshold, preserve_volcanic = None):
+    print('\nRemoving MAD outliers.')
+    
+    # Calculate rolling medians and overall median absolute deviation (MAD)
+    # Will calculate if 3 measurements in the window that aren't NaN
+    
+    cpp_background, conc_background = rolling_median([cfa_data['CPP'], cfa_data['Sum 1.1-12']],
+                                                     background_interval, min_periods = 3)
+    
+    cpp_mad  = median_absolute_deviation(cfa_data['CPP'])
+    conc_mad = median_absolute_deviation(cfa_data['Sum 1.1-12'])
+
+    # Want to find when CPP & concentration outliers occur at the same time
+    outliers = find_MAD_outliers(cfa_data['CPP'], cfa_data['Sum 1.1-12'], cpp_background, conc_background, 
+                                 cpp_mad, conc_mad, threshold)
+    overlap = cfa_data.index[outliers]
+    # Prevent rows in real dust events from being removed
+    overlap = overlap.difference(dust_indices)
+    
+    # Ask the user whether or not to preserve outliers at volcanic events, if not already chosen
+    if preserve_volcanic is None:
+        choice1 = input('\tPreserve outliers at volcanic events? Enter Y or N: ')
+    elif preserve_volcanic:
+        choice1 = 'Y'
+    else:
+        choice1 = 'N'
+    
+    if choice1 == 'n' or choice1 == 'N':
+        # Remove variable has the indices at which to NaN values
+        remove = overlap
+    elif choice1 == 'y' or choice1 == 'Y':
+        # Subtract the volcanic event indices from the overlapping outlier indices
+        remove = overlap.difference(volc_indices)
+    else:
+        print('Invalid entry. Defaulted to preserving outliers at volcanic events.')
+        remove = overlap.difference(volc_indices)
+       
+    return remove
+#%%
+# Function to calculate trapezoid integrals over consecutive blocks of rows (1 row apart)
+#    - The full blocks are one reshaped view of the data (one block per row), so the integrals
+#      for any block size are one NumPy expression. A shorter last block is added on the end.
+#    - Same values as np.trapz of each block: NaN if a row in the block is NaN, 0 for a 1-row block
+# Inputs: Column of data (e.g. CPP), number of rows per block
+# Output: Array of integrals (one per block)
+
+def block_integrals(values, block_rows = 2):
+
+    values = np.asarray(values, dtype = 'float')
+    full   = len(values) // block_rows * block_rows
+
+    blocks    = values[:full].reshape(-1, block_rows)
+    integrals = ((blocks[:, 1:] + blocks[:, :-1]) / 2.0).sum(axis = 1)
+
+    if full < len(values):
+        tail      = values[full:]
+        integrals = np.append(integrals, ((tail[1:] + tail[:-1]) / 2.0).sum())
+
+    return integrals
+#%%
+# Function to calculate the contamination limit of one column's block integrals: the median + threshold * standard
+# deviation of all blocks' integrals (NaN integrals are skipped)
+# Inputs: Column of data (e.g. CPP), number of rows per block, number of standard deviations above the median
+# Output: Limit (NaN if every integral is NaN)
+
+def integral_limit(values, block_rows = 2, threshold = 2):
+
+    integrals = block_integrals(values, block_rows)
+    if np.isnan(integrals).all():
+        return np.nan
+
+    return np.nanmedian(integrals) + threshold * np.nanstd(integrals)
+#%%
+# Function to find contamination with trapezoid integrals (the archived CFA_Phase2_part1 method)
+# A block of rows is contaminated if both its CPP & particle concentration integrals are at their limits or above
+#    - Limits are calculated from the rows given, unless given (e.g. for the whole core, see integral_limit)
+#    - Blocks start every block_rows rows from the top of the core. For rows from part way down the core,
+#      give the position of the first row, and rows before the first whole block are one shorter block.
+# Inputs: CPP, particle concentration, number of rows per block, number of standard deviations above the median,
+#         CPP & particle concentration limits (or None), position of the first row in the core
+# Output: Boolean array (True for every row of a contaminated block)
+
+def find_integral_contamination(cpp, conc, block_rows = 2, threshold = 2, limits = None, first_row = 0):
+
+    if limits is None:
+        limits = [integral_limit(cpp, block_rows, threshold), integral_limit(conc, block_rows, threshold)]
+
+    # Rows before the first whole block, and the block of each row
+    lead   = -first_row % block_rows
+    blocks = (np.arange(len(cpp)) + first_row) // block_rows - first_row // block_rows
+
+    contaminated = np.ones(blocks[-1] + 1 if len(cpp) > 0 else 0, dtype = bool)
+    for values, limit in zip([cpp, conc], limits):
+        values    = np.asarray(values, dtype = 'float')
+        integrals = np.concatenate([block_integrals(values[:lead], max(lead, 1)), block_integrals(values[lead:], block_rows)])
+        contaminated &= integrals >= limit
+
+    return contaminated[blocks]
+#%%
+# Function to subset CFA data for given depth or age range
+#     For many ranges, build a CFAIndex of the CFA data once and pass it instead of the dataframe:
+#     each range is then found with binary searches instead of scanning all the data (see cfa_index.py)
+#     Inputs: CFA dataframe (or CFAIndex), starting value, ending value, how ('Depth (m)' or 'AgeBP')
+#     Outputs: Subset of CFA data
+
+def select_cfa(cfa_data, lower, upper, variable):
+    
+    if isinstance(cfa_data, CFAIndex):
+        if variable in INDEX_COLUMNS:
+            return cfa_data.select(lower, upper, variable)
+        print('Invalid entry')
+        return cfa_data.cfa_data
+    
+    if variable == 'Depth (m)':
+        cfa_data = cfa_data[cfa_data['Depth (m)'] >= lower]
+        cfa_data = cfa_data[cfa_data['Depth (m)'] <  upper]
+        return cfa_data
+    elif variable == 'AgeBP':
+        cfa_data = cfa_data[cfa_data['AgeBP'] >= lower]
+        cfa_data = cfa_data[cfa_data['AgeBP'] <  upper]
+        return cfa_data
+    else:
+        print('Invalid entry')
+        return cfa_data
+
+#%%  
+# Function to print summary statistics for dust concentration & CPP during data cleaning
+# Statistics are calculated in one pass plus selection for the median & MAD (see stats.py)
+#     Inputs: CFA dataframe with particle sum and CPP columns
+#     Output: Dataframe of statistics for particle concentration & CPP (None without those columns). Prints summary statistics.
+
+def summary_statistics(cfa_data):
+    
+    if 'Sum 1.1-12' in cfa_data.columns and 'CPP' in cfa_data.columns:  
+        stats = column_statistics(cfa_data)
+        # NaNs are skipped
+        print_statistics(stats)
+        return stats
+        
+    else: print('Input data with particle sum and CPP columns.')
+
+#%%
+# Function to find depth gaps between measurements, and number the contiguous segments between them
+#    - A gap is a depth jump of 3 cm or more since the last row with a depth. Rows without a depth (e.g. error rows)
+#      are skipped, and stay in the segment above them.
+#    - Works through the depths a block at a time. The last depth & segment carry over between blocks, and between
+#      calls for data in chunks, so the segments and the gap table come from one pass.
+# Inputs: Depths, depth gap which starts a new segment (m), last depth before these rows (NaN if none),
+#         segment number of the rows before these rows, number of rows per block
+# Outputs: Array of segment numbers (int32), gap table (segment after each gap, depths before & after it, and its size),
+#          last depth in these rows (the last depth before them, if they have none)
+
+def find_depth_gaps(depth, gap = DEPTH_GAP, last_depth = np.nan, segment = 0, block_rows = 1048576):
+
+    depth    = np.asarray(depth, dtype = 'float')
+    segments = np.empty(len(depth), dtype = np.int32)
+    gap_starts, gap_ends = [], []
+
+    for start in range(0, len(depth), block_rows):
+        block = depth[start:start + block_rows]
+        rows  = np.flatnonzero(~np.isnan(block))
+        block_depths = block[rows]
+
+        # Depth before each row with a depth (a NaN last depth never starts a gap)
+        previous = np.concatenate([[last_depth], block_depths[:-1]])
+        with np.errstate(invalid = 'ignore'):
+            new = block_depths - previous >= gap
+
+        # Segment numbers go up by 1 at the first row after each gap
+        block_segments = segments[start:start + block_rows]
+        block_segments[:] = 0
+        block_segments[rows[new]] = 1
+        np.cumsum(block_segments, out = block_segments)
+        block_segments += segment
+
+        gap_starts.append(previous[new])
+        gap_ends.append(block_depths[new])
+        segment = block_segments[-1]
+        if len(rows) > 0:
+            last_depth = block_depths[-1]
+
+    gap_starts = np.concatenate(gap_starts) if gap_starts else np.empty(0)
+    gap_ends   = np.concatenate(gap_ends)   if gap_ends   else np.empty(0)
+    first_new  = segment - len(gap_ends) + 1
+    gaps = pd.DataFrame({'Segment':       np.arange(first_new, first_new + len(gap_ends), dtype = np.int32),
+                         'Gap Start (m)': gap_starts,
+                         'Gap End (m)':   gap_ends,
+                         'Gap Size (m)':  gap_ends - gap_starts})
+
+    return segments, gaps, last_depth
+
+#%%
+# Function to get the depth gap table from a column of segment numbers (e.g. saved Phase 1 data)
+# The same table as find_depth_gaps, without looking for the gaps again
+# Inputs: Depths, segment numbers (see find_depth_gaps)
+# Output: Gap table (segment after each gap, depths before & after it, and its size)
+
+def segment_gaps(depth, segments):
+
+    depth = np.asarray(depth, dtype = 'float')
+    rows  = np.flatnonzero(~np.isnan(depth))
+    row_depths   = depth[rows]
+    row_segments = np.asarray(segments)[rows]
+
+    # First row with a depth in each new segment
+    new = np.flatnonzero(row_segments[1:] != row_segments[:-1]) + 1
+
+    return pd.DataFrame({'Segment':       row_segments[new].astype(np.int32),
+                         'Gap Start (m)': row_depths[new - 1],
+                         'Gap End (m)':   row_depths[new],
+                         'Gap Size (m)':  row_depths[new] - row_depths[new - 1]})
+
+#%%
\ No newline at end of file
@@ -0,0 +1,118 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore PHASE 1 -> PHASE 2 HANDOFF
+#
+# Hands the Phase 1 CFA data to Phase 2 through memory-mapped column files, when both phases run
+# in one process (the command line with --phase all, and Complete_SPICEcore_Dust_Processing.py)
+#    - save_handoff saves each column as a .npy file in a 'Phase1_Handoff' folder
+#    - run_phase2 maps the folder twice instead of copying the Phase 1 data:
+#      - read-only, for the 'before' summary statistics
+#      - copy-on-write, for the Phase 2 edits: only the parts of the columns which change are copied
+#        into memory, and the files are never changed
+#    - Column types are kept ('Error Type' is saved as its category codes)
+#    - The folder is only needed until Phase 2 is saved. remove_handoff deletes it.
+#    - The row index can be saved too (index = True), e.g. for the saved state of --incremental runs
+#      (see incremental.py) and the raw CFA data shared by partitioned runs (see partition.py)
+#
+#    handoff = save_handoff(cfa_phase1, output_folder)
+#    cfa, bad_cfa, errors = run_phase2(handoff, config)
+#    remove_handoff(handoff)
+#
+# 'mmap_handoff' setting: False keeps the Phase 1 data in memory and copies it for Phase 2
+#
+# List of functions:
+#
+#  1) save_handoff:   Save Phase 1 CFA data as memory-mappable column files
+#  2) map_handoff:    Get the saved Phase 1 CFA data as a dataframe of memory-mapped columns
+#  3) remove_handoff: Delete the handoff folder
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import json
+import os
+import shutil
+
+# Name of the handoff folder (in the output folder), and the file listing its columns
+HANDOFF_FOLDER = 'Phase1_Handoff'
+COLUMNS_FILE   = 'columns.json'
+INDEX_FILE     = 'index.npy'
+
+#%%
+# Function to get the file name of one column
+# Input: Column position
+# Output: File name
+
+def _column_file(position):
+
+    return 'column_%03d.npy' % position
+
+#%%
+# Function to save Phase 1 CFA data as memory-mappable column files
+# Rows are saved in order, without the row index unless asked for (Phase 2 numbers rows from 0)
+# Inputs: Phase 1 CFA dataframe, folder to make the handoff folder in, whether to save the row index,
+#         name of the handoff folder
+# Output: Path of the handoff folder
+
+def save_handoff(cfa_data, data_folder, index = False, folder_name = HANDOFF_FOLDER):
+
+    handoff_folder = os.path.join(data_folder, folder_name)
+    # Replace the files of any earlier run
+    remove_handoff(handoff_folder)
+    os.makedirs(handoff_folder, exist_ok = True)
+
+    categories = {}
+    for position, column in enumerate(cfa_data.columns):
+        values = cfa_data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories[column] = values.cat.categories.tolist()
+            values = values.cat.codes
+        np.save(os.path.join(handoff_folder, _column_file(position)), values.to_numpy())
+
+    index_name = None
+    if index:
+        index_name = cfa_data.index.name
+        np.save(os.path.join(handoff_folder, INDEX_FILE), cfa_data.index.to_numpy())
+
+    # Save the column list last, so a handoff folder with it is complete
+    with open(os.path.join(handoff_folder, COLUMNS_FILE), 'w') as f:
+        json.dump({'columns': cfa_data.columns.tolist(), 'categories': categories,
+                   'index': index, 'index_name': index_name}, f, indent = 1)
+
+    return handoff_folder
+
+#%%
+# Function to get the saved Phase 1 CFA data as a dataframe of memory-mapped columns
+# Inputs: Path of the handoff folder, whether the dataframe can be changed
+#         (copy-on-write: changes are only made in memory, never in the files)
+# Output: CFA dataframe, with rows numbered from 0 (or the saved row index)
+
+def map_handoff(handoff_folder, writable = False):
+
+    with open(os.path.join(handoff_folder, COLUMNS_FILE)) as f:
+        layout = json.load(f)
+
+    columns = {}
+    for position, column in enumerate(layout['columns']):
+        values = np.load(os.path.join(handoff_folder, _column_file(position)), mmap_mode = 'c' if writable else 'r')
+        if column in layout['categories']:
+            values = pd.Categorical.from_codes(values, layout['categories'][column])
+        columns[column] = values
+
+    index = None
+    if layout.get('index'):
+        index = pd.Index(np.load(os.path.join(handoff_folder, INDEX_FILE), mmap_mode = 'r'), name = layout['index_name'])
+
+    # One block per column, so the mapped columns are not copied into one array
+    return pd.DataFrame(columns, index = index, copy = False)
+
+#%%
+# Function to delete the handoff folder
+# Folders still mapped on Windows can't be deleted, and are replaced on the next run instead
+# Input: Path of the handoff folder
+# Output: None
+
+def remove_handoff(handoff_folder):
+
+    shutil.rmtree(handoff_folder, ignore_errors = True)
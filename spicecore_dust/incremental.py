@@ -0,0 +1,386 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore INCREMENTAL REPROCESSING
+#
+# Reprocesses only the depth ranges affected by changes to the core breaks, dust events,
+# or manual cleaning intervals since the last run, instead of the whole core
+#    - Each full run saves a manifest (SPICEcore_Dust_Manifest.json) in the output folder, with the
+#      settings, the core break/dust event/manual cleaning intervals, and the names of the output files
+#    - Runs with --incremental also save their Phase 1 & Phase 2 data as memory-mappable column files
+#      (Incremental_State_... folders, see handoff.py), so the next run loads them without reading the CSV files
+#    - The next run compares the reference tables with the manifest. Each added, removed, or edited
+#      row gives a depth window (core breaks +/- the core break buffer).
+#    - Phase 1: only the event labels depend on these tables, so 'Break?', 'New Break?', and 'Dust Event?'
+#      are relabelled in the windows of the saved Phase 1 data. Windows are widened to cover whole
+#      core breaks, so the first row of each core break is still found.
+#    - Phase 2: outliers and manual removals are found again in the windows. Each outlier method gets its
+#      halo of rows around the windows (e.g. the (window - 1) rows before each depth window for the MAD
+#      background medians) and its values for the whole core (e.g. MADs), so they are the same as a full run.
+#    - The windows are spliced into the saved Phase 2 data, and the 'bad' data are taken from the ledger
+#    - Only the rows of the windows are saved again in the Phase 1 & cleaned Phase 2 CSV files (see patch_csv)
+#    - Changes to the settings, raw CFA data, volcanic record, or timescale need a full run
+#    - With PSD humps, changes to the dust events also need a full run: rows in dust events can't be
+#      PSD humps, and the humps are left out of the MADs of the whole core
+#
+# The raw CFA data are not read again, so bubbles and melter errors are taken from the saved Phase 1 data
+#
+# List of functions:
+#
+#  1) make_manifest:    Get the manifest for a run: settings, reference table intervals, output files, and saved state
+#  2) save_manifest:    Save a manifest to the output folder
+#  3) load_manifest:    Load the manifest of the last run from the output folder
+#  4) save_state:       Save the Phase 1 or Phase 2 data of a run for the next --incremental run
+#  5) remove_state:     Delete the saved state of the last run
+#  6) changed_windows:  Compare the reference tables with the manifest and get the depth windows to reprocess
+#  7) run_incremental:  Reprocess the depth windows and splice them into the saved Phase 1 & Phase 2 data
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import json
+import os
+from   collections import Counter
+
+from .config    import make_config
+from .schema    import CFA_DTYPES, compact_cfa, set_flag
+from .formats   import find_cfa_file, load_cfa
+from .handoff   import COLUMNS_FILE, save_handoff, map_handoff, remove_handoff
+from .ledger    import PHASE2_ERRORS, ERROR_COLUMN, get_ledger, set_ledger, record_errors, count_errors, error_rows
+from .functions import load_cached, label_core_breaks, label_dust_events, label_manual_removal
+from .outliers  import (OUTLIER_METHODS, OutlierArrays, chosen_methods, method_halo, whole_core_values, whole_core_rows,
+                        find_outliers)
+from .phase1    import PHASE1_FILES, load_phase1_inputs
+from .phase2    import MANUAL_FILE, DATA_COLUMNS
+
+# Name of the manifest file in the output folder
+MANIFEST_FILE = 'SPICEcore_Dust_Manifest.json'
+# Names of the saved state folders in the output folder
+STATE_FOLDERS = {'phase1': 'Incremental_State_Phase1', 'phase2': 'Incremental_State_Phase2'}
+
+# Settings which change the processed data. Changing any of them needs a full run.
+RESULT_SETTINGS = ['compact_dtypes', 'bubble_threshold', 'core_break_buffer', 'volc_start_buffer',
+                   'volc_end_buffer', 'depth_gaps', 'gap_depth', 'remove_humps', 'outlier_methods', 'window',
+                   'mad_threshold', 'integral_block', 'integral_threshold', 'preserve_volcanic']
+
+# Interval columns of the reference tables compared between runs
+TABLE_COLUMNS = {'breaks':      ['Depth (m)'],
+                 'dust_events': ['Dust Event Start (m)', 'Dust Event End (m)'],
+                 'manual':      ['Depth Start (m)', 'Depth End (m)']}
+
+# Other input files (in PHASE1_FILES). Any change to these needs a full run.
+SOURCE_FILES = ['cfa', 'volcanic_record', 'annual_depths']
+
+#%%
+# Function to get the intervals of a reference table as a list of rows
+# Input: Reference table dataframe, list of interval columns
+# Output: List of rows (lists of floats, None for missing values)
+
+def _table_rows(table, columns):
+
+    return [[None if np.isnan(value) else float(value) for value in row]
+            for row in table[columns].to_numpy(dtype = 'float')]
+
+#%%
+# Function to get the version (modification time & size) of an input file
+# Input: File path
+# Output: List of modification time (ns) and size
+
+def _file_version(file):
+
+    file_info = os.stat(file)
+    return [file_info.st_mtime_ns, file_info.st_size]
+
+#%%
+# Function to get the manifest for a run
+# Inputs: Folder with the data files, config dictionary (see config.py),
+#         names of the Phase 1 & Phase 2 CFA files saved by the run,
+#         dictionary of the state folders saved by the run (from save_state; None if not saved)
+# Output: Manifest dictionary
+
+def make_manifest(data_folder, config, phase1_file, phase2_file, state = None):
+    config = make_config(config)
+
+    inputs = load_phase1_inputs(data_folder, include_cfa = False)
+    inputs['manual'] = load_cached(os.path.join(data_folder, MANUAL_FILE))
+
+    return {'settings': {setting: config[setting] for setting in RESULT_SETTINGS},
+            'sources':  {name: _file_version(os.path.join(data_folder, PHASE1_FILES[name])) for name in SOURCE_FILES},
+            'tables':   {name: _table_rows(inputs[name], columns) for name, columns in TABLE_COLUMNS.items()},
+            'files':    {'phase1': os.path.abspath(phase1_file), 'phase2': os.path.abspath(phase2_file)},
+            'state':    {name: os.path.abspath(folder) for name, folder in (state or {}).items()}}
+
+#%%
+# Function to save a manifest to the output folder
+# Inputs: Manifest dictionary, output folder
+# Output: Name of the saved file
+
+def save_manifest(manifest, output_folder):
+
+    file = os.path.join(output_folder, MANIFEST_FILE)
+    with open(file, 'w') as f:
+        json.dump(manifest, f, indent = 1)
+
+    return file
+
+#%%
+# Function to load the manifest of the last run from the output folder
+# Input: Output folder
+# Output: Manifest dictionary (None if there is no manifest)
+
+def load_manifest(output_folder):
+
+    file = os.path.join(output_folder, MANIFEST_FILE)
+    if not os.path.exists(file):
+        return None
+
+    with open(file) as f:
+        return json.load(f)
+
+#%%
+# Function to save the Phase 1 or cleaned Phase 2 CFA data of a run for the next --incremental run
+# Saved as memory-mappable column files with the row index (see handoff.py), replacing the last run's state
+# Inputs: CFA dataframe, 'phase1' or 'phase2', output folder
+# Output: Path of the state folder (for make_manifest)
+
+def save_state(cfa_data, name, output_folder):
+
+    return save_handoff(cfa_data, output_folder, index = True, folder_name = STATE_FOLDERS[name])
+
+#%%
+# Function to delete the saved state of the last run, for runs which don't save one
+# Input: Output folder
+# Output: None
+
+def remove_state(output_folder):
+
+    for folder in STATE_FOLDERS.values():
+        remove_handoff(os.path.join(output_folder, folder))
+
+#%%
+# Function to load the Phase 1 or Phase 2 CFA data saved by the last run
+# The saved state is used if the last run saved one. Otherwise the output file is read: values and row indices
+# are read back exactly (pandas' default CSV reader can change the last digit), so saving them again doesn't
+# change them. Parquet & Arrow files are exact anyway (see formats.py).
+# The output files are rewritten by every run, so they are read directly rather than through load_cached.
+# Inputs: Manifest of the last run, 'phase1' or 'phase2',
+#         whether to load the CFA data in compact column types (see schema.py)
+# Output: CFA dataframe
+
+def _load_saved_cfa(manifest, name, compact = False):
+
+    state = manifest.get('state', {}).get(name)
+    if state is not None and os.path.exists(os.path.join(state, COLUMNS_FILE)):
+        # Copied into memory, so this run can save its state to the same folder
+        return map_handoff(state).copy()
+
+    file = find_cfa_file(manifest['files'][name])
+    if not file.lower().endswith('.csv'):
+        cfa = load_cfa(file)
+        return compact_cfa(cfa) if compact else cfa
+
+    if compact:
+        cfa = compact_cfa(pd.read_csv(file, header = 0, float_precision = 'round_trip', dtype = CFA_DTYPES))
+    else:
+        cfa = pd.read_csv(file, header = 0, float_precision = 'round_trip')
+    cfa = cfa.set_index('Unnamed: 0')
+    cfa.index.name = None
+
+    return cfa
+
+#%%
+# Function to merge overlapping depth windows
+# Inputs: Arrays of lower and upper window limits
+# Output: Arrays of lower and upper limits of the merged windows, in depth order
+
+def _merge_windows(lower, upper):
+
+    if len(lower) == 0:
+        return lower, upper
+
+    order = np.argsort(lower, kind = 'stable')
+    lower = lower[order]
+    # Highest upper limit so far: a window starts a new merged window if it starts above that
+    reach = np.maximum.accumulate(upper[order])
+    new   = np.ones(len(lower), dtype = bool)
+    new[1:] = lower[1:] > reach[:-1]
+    ends  = np.append(np.flatnonzero(new)[1:], len(lower)) - 1
+
+    return lower[new], reach[ends]
+
+#%%
+# Function to widen depth windows until every interval overlapping them is inside them
+# Inputs: Arrays of lower and upper window limits, arrays of lower and upper interval limits
+# Output: Arrays of lower and upper limits of the widened windows
+
+def _cover_intervals(lower, upper, interval_lower, interval_upper):
+
+    valid = ~np.isnan(interval_lower) & ~np.isnan(interval_upper)
+    interval_lower = interval_lower[valid]
+    interval_upper = interval_upper[valid]
+    if len(interval_lower) == 0 or len(lower) == 0:
+        return lower, upper
+
+    while True:
+        # Intervals overlapping each window
+        overlap = ((interval_lower[None, :] <= upper[:, None]) &
+                   (interval_upper[None, :] >= lower[:, None]))
+        new_lower = np.minimum(lower, np.where(overlap, interval_lower[None, :], np.inf).min(axis = 1))
+        new_upper = np.maximum(upper, np.where(overlap, interval_upper[None, :], -np.inf).max(axis = 1))
+        if np.array_equal(new_lower, lower) and np.array_equal(new_upper, upper):
+            return lower, upper
+        # Widened windows can overlap each other
+        lower, upper = _merge_windows(new_lower, new_upper)
+
+#%%
+# Function to compare the reference tables with the manifest of the last run
+# Added, removed, or edited rows give depth windows, which are merged and widened to cover whole core breaks
+# Inputs: Manifest of the last run, folder with the data files, config dictionary (see config.py)
+# Output: Arrays of lower and upper depth window limits (None if a full run is needed)
+
+def changed_windows(manifest, data_folder, config = None):
+    config = make_config(config)
+
+    if manifest is None:
+        print('\nNo manifest from an earlier run. Running everything.')
+        return None
+
+    current = make_manifest(data_folder, config, manifest['files']['phase1'], manifest['files']['phase2'])
+    if current['settings'] != manifest['settings']:
+        print('\nSettings changed since the last run. Running everything.')
+        return None
+    if current['sources'] != manifest['sources']:
+        print('\nRaw CFA data, volcanic record, or timescale changed since the last run. Running everything.')
+        return None
+    if not all(os.path.exists(file) for file in manifest['files'].values()):
+        print('\nCFA files from the last run are missing. Running everything.')
+        return None
+
+    # Rows in dust events can't be PSD humps, and the humps change the MADs of the whole core
+    if 'humps' in chosen_methods(config) and (Counter(tuple(row) for row in current['tables']['dust_events']) !=
+                                   Counter(tuple(row) for row in manifest['tables']['dust_events'])):
+        print('\nDust events changed, and PSD humps are removed. Running everything.')
+        return None
+
+    lower, upper = [], []
+    for name in TABLE_COLUMNS:
+        old_rows = Counter(tuple(row) for row in manifest['tables'][name])
+        new_rows = Counter(tuple(row) for row in current['tables'][name])
+        # Rows in only one of the tables
+        for row in (old_rows - new_rows) + (new_rows - old_rows):
+            if None in row:
+                continue
+            if name == 'breaks':
+                lower.append(row[0] - config['core_break_buffer'])
+                upper.append(row[0] + config['core_break_buffer'])
+            else:
+                lower.append(row[0])
+                upper.append(row[1])
+
+    lower, upper = _merge_windows(np.array(lower, dtype = 'float'), np.array(upper, dtype = 'float'))
+
+    # Widen the windows to cover every core break they overlap
+    breaks = np.array([row[0] if row[0] is not None else np.nan for row in current['tables']['breaks']], dtype = 'float')
+    return _cover_intervals(lower, upper, breaks - config['core_break_buffer'], breaks + config['core_break_buffer'])
+
+#%%
+# Function to get the CFA rows within depth windows
+# Rows without depths between two rows in a window are included
+# Inputs: CFA depth column, arrays of lower and upper depth window limits
+# Output: List of (start, end) row positions for each window with rows
+
+def _window_rows(depth, lower, upper):
+
+    depth = np.asarray(depth, dtype = 'float')
+    positions = np.flatnonzero(~np.isnan(depth))
+    starts = np.searchsorted(depth[positions], lower, side = 'left')
+    ends   = np.searchsorted(depth[positions], upper, side = 'right')
+
+    return [(positions[start], positions[end - 1] + 1) for start, end in zip(starts, ends) if end > start]
+
+#%%
+# Function to reprocess the depth windows and splice them into the saved Phase 1 & Phase 2 data
+# Inputs: Manifest of the last run, arrays of lower and upper depth window limits (from changed_windows),
+#         folder with the data files, config dictionary (see config.py)
+# Outputs: Phase 1 CFA dataframe, cleaned Phase 2 CFA dataframe, dataframe of removed 'bad' data,
+#          dictionary of Phase 2 error counts, list of (start, end) positions of the reprocessed rows
+#          (the only rows which can change, see patch_csv)
+
+def run_incremental(manifest, lower, upper, data_folder, config = None):
+    config = make_config(config)
+
+    print('\n\n...................................................................')
+    print('  SPICEcore Dust Data Incremental Processing')
+    print('...................................................................')
+
+    # Load the saved CFA data, and the current reference tables
+    cfa_phase1 = _load_saved_cfa(manifest, 'phase1', config['compact_dtypes'])
+    cfa        = _load_saved_cfa(manifest, 'phase2', config['compact_dtypes'])
+    inputs     = load_phase1_inputs(data_folder, include_cfa = False)
+    manual     = load_cached(os.path.join(data_folder, MANUAL_FILE))
+
+    windows = _window_rows(cfa_phase1['Depth (m)'], lower, upper)
+    print('\nReprocessing', len(windows), 'depth window(s),', sum(end - start for start, end in windows), 'rows.')
+
+    # Whole-core values of the outlier methods (e.g. MADs & PSD humps, see outliers.py), from the Phase 1 values.
+    # They don't depend on the reference tables (runs with changed dust events and PSD humps are full runs).
+    whole_core = whole_core_values(OutlierArrays(cfa_phase1, config))
+    before, after = method_halo(config)
+    # Volcanic outliers are preserved unless preserve_volcanic is False
+    preserve_volcanic = config['preserve_volcanic'] is not False
+
+    ledger = get_ledger(cfa)
+
+    for start, end in windows:
+        rows = cfa_phase1.index[start:end]
+        part = cfa_phase1.iloc[start:end]
+
+        # Phase 1: relabel core breaks & dust events
+        break_rows, new_break_rows = label_core_breaks(part, inputs['breaks'], config['core_break_buffer'])
+        dust_rows = label_dust_events(part, inputs['dust_events'])
+        for label, label_rows in [('Break?', break_rows), ('New Break?', new_break_rows), ('Dust Event?', dust_rows)]:
+            set_flag(cfa_phase1, label, rows, False)
+            set_flag(cfa_phase1, label, label_rows)
+        part = cfa_phase1.iloc[start:end]
+
+        # Phase 2: outliers, with each outlier method's halo of rows around the window
+        window_ledger = get_ledger(part)
+        halo_start, halo_end = max(start - before, 0), min(end + after, len(cfa_phase1))
+        arrays = OutlierArrays(cfa_phase1.iloc[halo_start:halo_end], config, halo_start,
+                               whole_core_rows(whole_core, halo_start, halo_end))
+        find_outliers(arrays, window_ledger, slice(start - halo_start, end - halo_start), preserve_volcanic)
+
+        # Manual removal, skipping rows which have already been NaN'd
+        manual_rows = part.index.isin(label_manual_removal(part, manual))
+        record_errors(window_ledger, manual_rows & part['Flow Rate'].notna().to_numpy(), 'Manual Removal')
+        ledger[start:end] = window_ledger
+
+        # Splice the window into the Phase 2 data, with bad rows NaN'd
+        for column in cfa.columns.drop(ERROR_COLUMN):
+            cfa.iloc[start:end, cfa.columns.get_loc(column)] = part[column].to_numpy()
+        bad_rows = cfa.index[start:end][error_rows(window_ledger, PHASE2_ERRORS)]
+        cfa.loc[bad_rows, DATA_COLUMNS] = np.nan
+
+    set_ledger(cfa, ledger)
+
+    # Make one dataframe of all bad data, labelled by error type (outliers before manual removals)
+    bad_rows = error_rows(ledger, PHASE2_ERRORS)
+    bad_cfa  = cfa_phase1.iloc[bad_rows].set_axis(cfa.index[bad_rows])
+    set_ledger(bad_cfa, ledger[bad_rows])
+
+    # Error counts for the whole dataset
+    counts = count_errors(ledger, PHASE2_ERRORS)
+    errors = {'Length after Phase 1': cfa_phase1['Sum 1.1-12'].count()}
+    for name in chosen_methods(config):
+        method = OUTLIER_METHODS[name]
+        errors[method['count_name']] = counts[method['error_type']]
+        print('\t' + method['count_name'] + ':', errors[method['count_name']])
+    if 'humps' in chosen_methods(config):
+        errors['PSD hump events'] = whole_core['hump_events']
+    errors['Manual removal'] = counts['Manual Removal']
+    errors['Final length']   = errors['Length after Phase 1'] - sum(counts.values())
+
+    print('\tManual removal:', errors['Manual removal'])
+    print('\n\tFinal dataset length:', errors['Final length'])
+
+    return cfa_phase1, cfa, bad_cfa, errors, windows
@@ -0,0 +1,96 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore ERROR LEDGER
+#
+# Records why each continuous flow analysis (CFA) row was removed during Phase 1 & Phase 2
+#    - The ledger is one int8 code per CFA row: the first error found in that row, or -1 for none
+#    - Errors are recorded for many rows at once, with boolean masks
+#    - A row keeps its first error. Later steps can't record another one.
+#    - Saved in the CFA data as the categorical 'Error Type' column (int8 codes), so the
+#      Phase 1 & Phase 2 CSV files list the error type for every removed row
+#    - Error counts and the 'bad' data (Bad_CFA...) are taken from the ledger
+#
+# List of functions:
+#
+#  1) get_ledger:    Get the ledger codes from CFA data (all -1 if there is no 'Error Type' column)
+#  2) set_ledger:    Save ledger codes in CFA data as the categorical 'Error Type' column
+#  3) record_errors: Record an error type for rows which don't have an error yet
+#  4) count_errors:  Count the rows with each error type
+#  5) error_rows:    Get the row positions with some error types, grouped by error type
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+
+# Error types, in the order they are checked
+PHASE1_ERRORS = ['Bubble', 'Liquid Conductivity', 'Flow Rate', 'Depth Not Increasing', 'No Depth', 'Abakus']
+PHASE2_ERRORS = ['PSD Hump Anomaly', 'MAD Outlier', 'Integral Contamination', 'Manual Removal']
+ERROR_TYPES   = PHASE1_ERRORS + PHASE2_ERRORS
+
+# Column with the error types in the CFA data
+ERROR_COLUMN = 'Error Type'
+ERROR_DTYPE  = pd.CategoricalDtype(ERROR_TYPES)
+# Ledger code for rows without errors
+NO_ERROR     = -1
+
+#%%
+# Function to get the ledger codes from CFA data
+# Error types loaded from CSV (text) are converted back to codes
+# Input: CFA dataframe
+# Output: Array of int8 ledger codes (a copy), -1 for rows without errors
+
+def get_ledger(cfa_data):
+
+    if ERROR_COLUMN not in cfa_data.columns:
+        return np.full(len(cfa_data), NO_ERROR, dtype = np.int8)
+
+    return cfa_data[ERROR_COLUMN].astype(ERROR_DTYPE).cat.codes.to_numpy(dtype = np.int8, copy = True)
+
+#%%
+# Function to save ledger codes in CFA data as the categorical 'Error Type' column
+# Inputs: CFA dataframe (changed in place), array of ledger codes
+# Output: None
+
+def set_ledger(cfa_data, ledger):
+
+    cfa_data[ERROR_COLUMN] = pd.Categorical.from_codes(ledger, dtype = ERROR_DTYPE)
+
+#%%
+# Function to record an error type for rows which don't have an error yet
+# Inputs: Array of ledger codes (changed in place), boolean array of rows with the error, error type
+# Output: Boolean array of the rows given this error (rows with an earlier error are not included)
+
+def record_errors(ledger, rows, error_type):
+
+    new_rows = np.asarray(rows, dtype = bool) & (ledger == NO_ERROR)
+    ledger[new_rows] = ERROR_TYPES.index(error_type)
+
+    return new_rows
+
+#%%
+# Function to count the rows with each error type
+# Inputs: Array of ledger codes, list of error types to count
+# Output: Dictionary of row counts for each error type
+
+def count_errors(ledger, error_types = ERROR_TYPES):
+
+    counts = np.bincount(ledger[ledger != NO_ERROR], minlength = len(ERROR_TYPES))
+
+    return {error_type: int(counts[ERROR_TYPES.index(error_type)]) for error_type in error_types}
+
+#%%
+# Function to get the row positions with some error types, grouped by error type
+# Rows are in the order of error_types, then in row order (e.g. all MAD outliers, then all manual removals)
+# Inputs: Array of ledger codes, list of error types
+# Output: Array of row positions
+
+def error_rows(ledger, error_types):
+
+    # Position of each error type in error_types
+    rank = np.zeros(len(ERROR_TYPES), dtype = np.int64)
+    codes = [ERROR_TYPES.index(error_type) for error_type in error_types]
+    rank[codes] = np.arange(len(codes))
+
+    rows = np.flatnonzero(np.isin(ledger, codes))
+    return rows[np.argsort(rank[ledger[rows]], kind = 'stable')]
@@ -0,0 +1,312 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore OUTLIER METHODS
+#
+# Registry of the Phase 2 outlier methods, which run together over shared arrays
+#    - Each method declares the CFA columns it reads, its halo (the rows before & after a row which it
+#      needs to decide that row), the whole-core values it needs (e.g. MADs), its error type, its
+#      run report stage, and any other counts printed with its rows (e.g. PSD hump events).
+#      The method's function returns a boolean mask of its rows.
+#    - Arrays used by several methods (CPP, particle concentration, PSD humps, background medians, MADs, ...)
+#      are calculated the first time they are asked for, once per run, by an OutlierArrays object.
+#      A new method only adds its own calculation.
+#    - find_outliers runs the chosen methods in order and records their rows in the error ledger
+#      (a row keeps its first error). Rows in dust events (and volcanic events, if chosen) are preserved.
+#    - Depth windows (incremental runs) and shards (partitioned runs) get each method's halo of rows and the
+#      whole-core values, so the methods find the same rows as a run on the whole core
+#    - Built-in methods, in the order they run:
+#      - 'humps':    Hump-shaped particle size distribution (PSD) anomalies (also chosen by 'remove_humps').
+#                    The other methods leave the hump rows out.
+#      - 'mad':      Peaks above rolling median backgrounds, by MAD
+#      - 'integral': Blocks of rows with high trapezoid integrals
+#
+#    def find_spikes(arrays):
+#        cpp = arrays['outlier_cpp'].to_numpy()
+#        return cpp > 10 * arrays['cpp_mad']
+#
+#    register_outlier_method('spikes', find_spikes, ['CPP'], 'MAD Outlier', 'spike_outliers', 'Spike outliers',
+#                            whole_core = ['cpp_mad'])
+#    config = make_config(outlier_methods = ['mad', 'spikes'])
+#
+# 'outlier_methods' setting: list of the methods to run
+#
+# List of functions & classes:
+#
+#  1) OutlierArrays:           Arrays shared by the outlier methods, calculated when first asked for
+#  2) register_shared_array:   Add an array (or value) which outlier methods can share
+#  3) register_outlier_method: Add an outlier method
+#  4) chosen_methods:          Get the outlier methods chosen in the settings, in the order they run
+#  5) method_halo:             Get the rows before & after each row needed by the chosen methods
+#  6) method_columns:          Get the CFA columns read by the chosen methods
+#  7) whole_core_values:       Get the whole-core values needed by the chosen methods
+#  8) whole_core_rows:         Get the whole-core values for some rows of the core
+#  9) find_outliers:           Run the chosen outlier methods and record their rows in the error ledger
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+
+from .ledger    import PHASE2_ERRORS, record_errors
+from .report    import PHASE2_STAGES, stage
+from .rolling   import rolling_median
+from .schema    import FLAG_COLUMN, FLAG_BITS, get_flag
+from .functions import (HUMP_BINS, SMALL_BINS, find_humps, median_absolute_deviation, find_MAD_outliers,
+                        integral_limit, find_integral_contamination)
+
+# Arrays (or values) shared by the outlier methods: name -> function and scope
+#    - 'rows': calculated from the rows of the OutlierArrays
+#    - 'core': one value for the whole core (e.g. a MAD)
+#    - 'core rows': one value per row, which needs the whole core (e.g. PSD humps, which are counted as events)
+SHARED_ARRAYS   = {}
+# Outlier methods, in the order they run: name -> function, columns, halo, whole-core values,
+# error type, run report stage, error count name, and description (for messages)
+OUTLIER_METHODS = {}
+
+#%%
+# Class of the arrays shared by the outlier methods, calculated the first time they are asked for
+# Inputs: CFA dataframe (the whole core, or some rows with their halos), config dictionary (see config.py),
+#         position of the first row in the core, whole-core values for these rows (from whole_core_rows;
+#         None if the CFA data are the whole core)
+#
+#    arrays = OutlierArrays(cfa, config)
+#    arrays['cpp_mad']             # Calculated once
+#    arrays['humps'] = humps       # Give a value calculated elsewhere
+
+class OutlierArrays:
+
+    def __init__(self, cfa_data, config, first_row = 0, whole_core = None):
+
+        self.cfa_data   = cfa_data
+        self.config     = config
+        self.first_row  = first_row
+        self.whole_core = whole_core
+        self.values     = {}
+
+    def __getitem__(self, name):
+
+        if name not in self.values:
+            if self.whole_core is not None and SHARED_ARRAYS[name]['scope'] != 'rows':
+                # Not calculated from part of the core
+                self.values[name] = self.whole_core[name]
+            else:
+                self.values[name] = SHARED_ARRAYS[name]['function'](self)
+        return self.values[name]
+
+    def __setitem__(self, name, value):
+
+        self.values[name] = value
+
+#%%
+# Function to add an array (or value) which outlier methods can share
+# Inputs: Name, function of an OutlierArrays object which calculates it,
+#         scope ('rows', 'core', or 'core rows', see SHARED_ARRAYS)
+# Output: None
+
+def register_shared_array(name, function, scope = 'rows'):
+
+    if scope not in ['rows', 'core', 'core rows']:
+        raise ValueError("Scope must be 'rows', 'core', or 'core rows': " + repr(scope))
+
+    SHARED_ARRAYS[name] = {'function': function, 'scope': scope}
+
+#%%
+# Function to add an outlier method (after the methods already added)
+# Inputs: Name (for the 'outlier_methods' setting), function of an OutlierArrays object which returns a boolean
+#         mask of the outlier rows, CFA columns it reads, error type (one of the Phase 2 error types in ledger.py),
+#         run report stage name, error count name, function of the config dictionary which returns the rows
+#         (before, after) each row needs, names of the shared whole-core values it needs, whether rows in dust &
+#         volcanic events are preserved, description for messages (the error count name if not given),
+#         dictionary of other counts to print after its rows (count name -> shared value name, e.g. events)
+# Output: None
+
+def register_outlier_method(name, function, columns, error_type, stage_name, count_name, halo = None,
+                            whole_core = (), preserve_events = True, description = None, other_counts = None):
+
+    if error_type not in PHASE2_ERRORS:
+        raise ValueError('Error type must be one of ' + ', '.join(PHASE2_ERRORS) + ': ' + repr(error_type))
+
+    OUTLIER_METHODS[name] = {'function':        function,
+                             'columns':         list(columns),
+                             'halo':            halo or (lambda config: (0, 0)),
+                             'whole_core':      list(whole_core),
+                             'error_type':      error_type,
+                             'stage':           stage_name,
+                             'count_name':      count_name,
+                             'description':     description or count_name,
+                             'preserve_events': preserve_events,
+                             'other_counts':    dict(other_counts or {})}
+
+    # So the stage can be profiled from the command line
+    if stage_name not in PHASE2_STAGES:
+        PHASE2_STAGES.insert(PHASE2_STAGES.index('manual_removal'), stage_name)
+
+#%%
+# Function to get the outlier methods chosen in the settings ('outlier_methods', and 'remove_humps'),
+# in the order they run
+# Input: Config dictionary (see config.py)
+# Output: List of method names
+
+def chosen_methods(config):
+
+    methods = config['outlier_methods']
+    unknown = set(methods) - set(OUTLIER_METHODS)
+    if isinstance(methods, str) or unknown:
+        raise ValueError('Outlier methods must be a list of ' + ', '.join(OUTLIER_METHODS) + ': ' + repr(methods))
+
+    return [name for name in OUTLIER_METHODS if name in methods or (name == 'humps' and config['remove_humps'])]
+
+#%%
+# Function to get the rows before & after each row needed by the chosen outlier methods
+# Input: Config dictionary (see config.py)
+# Output: Number of rows before, number of rows after
+
+def method_halo(config):
+
+    halos = [OUTLIER_METHODS[name]['halo'](config) for name in chosen_methods(config)]
+
+    return max([before for before, after in halos], default = 0), max([after for before, after in halos], default = 0)
+
+#%%
+# Function to get the CFA columns read by the chosen outlier methods, and the event label columns
+# (for the rows preserved in dust & volcanic events)
+# Inputs: Config dictionary (see config.py), columns of the CFA data
+# Output: List of columns
+
+def method_columns(config, cfa_columns):
+
+    columns = [column for name in chosen_methods(config) for column in OUTLIER_METHODS[name]['columns']]
+    columns += [column for column in cfa_columns if column in FLAG_BITS or column == FLAG_COLUMN]
+
+    return [column for column in dict.fromkeys(columns) if column in cfa_columns]
+
+#%%
+# Function to get the whole-core values needed by the chosen outlier methods
+# Input: OutlierArrays of the whole core
+# Output: Dictionary of values
+
+def whole_core_values(arrays):
+
+    names = [value for name in chosen_methods(arrays.config) for value in OUTLIER_METHODS[name]['whole_core']]
+
+    return {name: arrays[name] for name in dict.fromkeys(names)}
+
+#%%
+# Function to get the whole-core values for some rows of the core (values per row are cut to the rows)
+# Inputs: Dictionary of whole-core values (from whole_core_values), first and last (+1) row positions
+# Output: Dictionary of values
+
+def whole_core_rows(whole_core, start, end):
+
+    return {name: value[start:end] if SHARED_ARRAYS[name]['scope'] == 'core rows' else value
+            for name, value in whole_core.items()}
+
+#%%
+# Function to run the chosen outlier methods and record their rows in the error ledger
+# Each method's rows are recorded before the next method runs, so a row keeps the first error type found
+# Inputs: OutlierArrays, ledger of the rows to record (changed in place), row positions of these rows in the
+#         OutlierArrays (None for all rows; the other rows are halo), whether to preserve rows in volcanic events,
+#         run report (see report.py), whether to print progress
+# Output: Dictionary of the number of rows recorded by each method (by count name)
+
+def find_outliers(arrays, ledger, rows = None, preserve_volcanic = True, report = None, verbose = False):
+
+    rows = slice(None) if rows is None else rows
+    cfa  = arrays.cfa_data.iloc[rows]
+
+    # Rows in dust events are always preserved, and rows in volcanic events if chosen
+    preserve = get_flag(cfa, 'Dust Event?').to_numpy().copy()
+    if preserve_volcanic:
+        preserve |= get_flag(cfa, 'Volcanic Event?').to_numpy()
+
+    counts = {}
+    for name in chosen_methods(arrays.config):
+        method = OUTLIER_METHODS[name]
+        if verbose:
+            print('\nRemoving ' + method['description'] + '.')
+
+        with stage(report, method['stage'], cfa, ledger):
+            outliers = np.asarray(method['function'](arrays), dtype = bool)[rows]
+            if method['preserve_events']:
+                outliers = outliers & ~preserve
+            counts[method['count_name']] = int(record_errors(ledger, outliers, method['error_type']).sum())
+
+        if verbose:
+            print('\tRows removed: ', counts[method['count_name']])
+            for other_name, value_name in method['other_counts'].items():
+                print('\t' + other_name + ':', arrays[value_name])
+
+    return counts
+
+#%%
+# Shared arrays of the built-in methods
+
+# CPP & particle concentration
+register_shared_array('cpp',  lambda arrays: arrays.cfa_data['CPP'])
+register_shared_array('conc', lambda arrays: arrays.cfa_data['Sum 1.1-12'])
+
+# Rows in dust or volcanic events (never PSD humps)
+register_shared_array('events', lambda arrays: get_flag(arrays.cfa_data, 'Dust Event?').to_numpy() |
+                                               get_flag(arrays.cfa_data, 'Volcanic Event?').to_numpy())
+
+# PSD humps, and the number of discrete hump events (calculated together)
+def _humps(arrays):
+
+    humps, arrays['hump_events'] = find_humps(arrays.cfa_data, arrays['events'])
+    return humps
+
+def _hump_events(arrays):
+
+    arrays['humps']
+    return arrays.values['hump_events']
+
+register_shared_array('humps',       _humps,       'core rows')
+register_shared_array('hump_events', _hump_events, 'core')
+
+# CPP & particle concentration for the outlier methods: without the PSD humps, if they are removed
+def _outlier_column(arrays, name):
+
+    if 'humps' in chosen_methods(arrays.config):
+        return arrays[name].mask(arrays['humps'])
+    return arrays[name]
+
+register_shared_array('outlier_cpp',  lambda arrays: _outlier_column(arrays, 'cpp'))
+register_shared_array('outlier_conc', lambda arrays: _outlier_column(arrays, 'conc'))
+
+# Rolling median backgrounds (calculated if 3 measurements in the window aren't NaN), and overall MADs
+register_shared_array('mad_backgrounds', lambda arrays: rolling_median([arrays['outlier_cpp'], arrays['outlier_conc']],
+                                                                       arrays.config['window'], min_periods = 3))
+register_shared_array('cpp_mad',  lambda arrays: median_absolute_deviation(arrays['outlier_cpp']),  'core')
+register_shared_array('conc_mad', lambda arrays: median_absolute_deviation(arrays['outlier_conc']), 'core')
+
+# Limits of the CPP & particle concentration block integrals
+register_shared_array('integral_limits', lambda arrays: [integral_limit(arrays[name], arrays.config['integral_block'],
+                                                                        arrays.config['integral_threshold'])
+                                                         for name in ['outlier_cpp', 'outlier_conc']], 'core')
+
+#%%
+# Built-in outlier methods
+
+# PSD humps: rows where every 3.2-10 um bin is above the mean of the 1.5-2.9 um bins, outside dust & volcanic events
+register_outlier_method('humps', lambda arrays: arrays['humps'], SMALL_BINS + HUMP_BINS + ['Depth (m)'],
+                        'PSD Hump Anomaly', 'psd_humps', 'PSD hump anomalies',
+                        whole_core = ['humps', 'hump_events'], preserve_events = False,
+                        other_counts = {'PSD hump events': 'hump_events'})
+
+# MAD outliers: CPP & particle concentration both at least threshold * MAD above their background medians
+def _mad_outliers(arrays):
+
+    cpp_background, conc_background = arrays['mad_backgrounds']
+    return find_MAD_outliers(arrays['outlier_cpp'], arrays['outlier_conc'], cpp_background, conc_background,
+                             arrays['cpp_mad'], arrays['conc_mad'], arrays.config['mad_threshold'])
+
+register_outlier_method('mad', _mad_outliers, ['CPP', 'Sum 1.1-12'], 'MAD Outlier', 'mad_outliers', 'MAD outliers',
+                        halo = lambda config: (config['window'] - 1, 0), whole_core = ['cpp_mad', 'conc_mad'])
+
+# Integral contamination: blocks of rows where the CPP & particle concentration integrals are both at their limits
+register_outlier_method('integral', lambda arrays: find_integral_contamination(
+                            arrays['outlier_cpp'], arrays['outlier_conc'], arrays.config['integral_block'],
+                            limits = arrays['integral_limits'], first_row = arrays.first_row),
+                        ['CPP', 'Sum 1.1-12'], 'Integral Contamination', 'integral_contamination',
+                        'Integral contamination',
+                        halo = lambda config: (config['integral_block'] - 1, config['integral_block'] - 1),
+                        whole_core = ['integral_limits'], description = 'integral contamination')
@@ -0,0 +1,591 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore PARTITIONED PROCESSING
+#
+# Runs Phase 1 and Phase 2 on depth shards of the core in a pool of worker processes
+#    - The raw CFA rows are split into shards of consecutive rows (depth ranges of the core), which are
+#      processed at the same time. Saving the CSV files takes most of the run time, and each worker saves its own part.
+#    - The raw CFA data are saved once as memory-mapped column files (see handoff.py), so each worker
+#      only reads the rows of its shard, plus a halo of rows from the shards around it:
+#      - Bubbles: 1 raw row before & after the shard, for the bubble slopes (as in stream_phase1)
+#      - Depth not increasing: the last depth before the shard, found by going back from the shard
+#        until there is a row without bubble, liquid conductivity, or flow rate errors
+#      - Outlier methods: each method's halo of rows around the shard (e.g. the (window - 1) rows before it
+#        for the MAD background medians), with the columns the methods read (see outliers.py)
+#      - PSD hump events: events crossing a shard boundary (by the 3 cm gap rule) are only counted once
+#      - Depth gaps: the last depth & segment number before the shard, from the depths & gap counts of the
+#        shards before it
+#    - Quantities for the whole core are reduced in the main process between two rounds of work:
+#      1) Each worker runs Phase 1 on its shard and returns its CPP & concentration values, PSD humps,
+#         error counts, the rows at its edges (for the halos of the other shards), and which core breaks &
+#         volcanic events have rows in the shard
+#      2) The main process calculates the whole-core values of the outlier methods (e.g. the MADs of CPP &
+#         concentration) from the values of all shards (the same values as the whole dataset), the halo of
+#         each shard, and which shard has the first row of each core break & volcanic event
+#         ('New Break?', 'New Volcanic Event?')
+#      3) Each worker runs Phase 1 on its shard again (it is fast next to saving it), then Phase 2 with
+#         the whole-core values, and saves its part of each output file
+#    - Parts are joined in shard order, with the 'bad' rows grouped by error type (as in run_phase2). The files are the same, byte for byte, as a run without partitions.
+#    - Run reports add the stages of all workers together (see report.py)
+#    - Only saves CSV files ('output_format' = 'csv')
+#
+# 'partitioned' setting: True runs --phase all this way. 'processes' sets the number of worker processes.
+#
+# List of functions:
+#
+#  1) run_partitioned: Run Phase 1 & Phase 2 on depth shards in a pool of worker processes, and save the results
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import os
+import shutil
+from   datetime import date
+from   concurrent.futures import ProcessPoolExecutor
+
+from .config    import make_config
+from .schema    import compact_cfa, expand_cfa, get_flag
+from .handoff   import save_handoff, map_handoff, remove_handoff
+from .ledger    import PHASE1_ERRORS, PHASE2_ERRORS, NO_ERROR, get_ledger, set_ledger, record_errors, count_errors, error_rows
+from .report    import new_report, stage, add_stages, save_report
+from .stats     import column_statistics, print_statistics
+from .functions import (HUMP_GAP, load_cached, detect_bubbles, remove_melter_errors, label_manual_removal, find_humps,
+                        find_depth_gaps)
+from .outliers  import (OUTLIER_METHODS, OutlierArrays, chosen_methods, method_halo, method_columns, whole_core_values,
+                        whole_core_rows, find_outliers)
+from .phase1    import (ERROR_COUNTS, load_phase1_inputs, _interpolate_volcanic_ages, _print_errors, _add_columns,
+                        _add_segments, _save_gaps, _final_length, _event_intervals, _intervals_with_rows,
+                        _first_rows_in_chunk)
+from .phase2    import MANUAL_FILE, DATA_COLUMNS
+
+# Folder for the raw CFA column files and the saved parts (in the output folder), deleted after the run
+PARTITION_FOLDER = 'Partition_Shards'
+RAW_FOLDER       = 'Raw_CFA'
+# Number of shards per worker process, so workers with faster shards don't wait for the others
+SHARDS_PER_PROCESS = 4
+# Number of rows before a shard to look through first for the last depth before it
+DEPTH_LOOKBACK = 1000
+
+# Settings and supporting data shared with the worker processes (set once per worker by _start_worker)
+_shared = {}
+
+#%%
+# Function to store the shared settings & supporting data in a worker process, and map the raw CFA data
+# Input: Dictionary of settings, supporting dataframes, and folders
+# Output: None
+
+def _start_worker(shared):
+    _shared.clear()
+    _shared.update(shared)
+    _shared['raw'] = map_handoff(shared['raw_folder'])
+
+#%%
+# Function to get the name of one saved part
+# Inputs: Folder of the parts, part name ('phase1', 'phase2', 'bad_mad', or 'bad_manual'),
+#         shard number ('header' for the column names)
+# Output: Path of the part file
+
+def _part_file(partition_folder, name, shard):
+
+    if shard == 'header':
+        return os.path.join(partition_folder, name + '_header.csv')
+    return os.path.join(partition_folder, '%s_%04d.csv' % (name, shard))
+
+#%%
+# Function to find the last depth before a shard, for the depth-not-increasing check
+# The depth of the last row before the shard without bubble, liquid conductivity, or flow rate errors
+# (the row run_phase1 compares the first rows of the shard with). Looks further back until one is found.
+# Inputs: Memory-mapped raw CFA dataframe, first row of the shard, bubble threshold
+# Output: Last depth before the shard (NaN if there isn't one)
+
+def _previous_depth(raw, start, threshold):
+
+    lookback = DEPTH_LOOKBACK
+    while start > 0:
+        lower = max(start - lookback, 0)
+        # Rows before the shard, with 1 raw row on each side for the bubble slopes
+        halo_before = 1 if lower > 0 else 0
+        rows = raw.iloc[lower - halo_before:start + 1].copy()
+        bubble_rows = detect_bubbles(rows, threshold)
+        rows = rows.iloc[halo_before:halo_before + start - lower].copy()
+        ledger = np.full(len(rows), NO_ERROR, dtype = np.int8)
+        record_errors(ledger, rows.index.isin(bubble_rows), 'Bubble')
+
+        depth = remove_melter_errors(rows, ledger)
+        if not np.isnan(depth) or lower == 0:
+            return depth
+        lookback *= 4
+
+    return np.nan
+
+#%%
+# Function to run Phase 1 steps 1-10 on one shard
+# Inputs: First and last (+1) raw rows of the shard, last depth before the shard, run report (see report.py)
+# Outputs: CFA dataframe of the shard (before the 'New ...?' labels), error ledger, number of raw rows with data,
+#          dictionary of error counts
+
+def _phase1_shard(start, end, previous_depth, report = None):
+    raw    = _shared['raw']
+    config = _shared['config']
+
+    original_length = raw['1'].iloc[start:end].count()
+
+    # 1) Remove data reflecting bubbles, with 1 raw row on each side of the shard for the slopes
+    halo_before = 1 if start > 0 else 0
+    cfa = raw.iloc[start - halo_before:end + 1].copy()
+    with stage(report, 'bubbles'):
+        bubble_rows = detect_bubbles(cfa, config['bubble_threshold'])
+        # Drop the halo rows again
+        cfa = cfa.iloc[halo_before:halo_before + end - start].copy()
+        ledger = np.full(len(cfa), NO_ERROR, dtype = np.int8)
+        record_errors(ledger, cfa.index.isin(bubble_rows), 'Bubble')
+
+    # 2-5) Remove liquid conductivity, flow rate, depth, and Abakus errors, all in one pass
+    with stage(report, 'melter_errors', cfa, ledger):
+        remove_melter_errors(cfa, ledger, previous_depth)
+    counts = count_errors(ledger, PHASE1_ERRORS)
+
+    # 6-10) Correct units, add ages & event labels, and calculate particle concentration & CPP
+    cfa = _add_columns(cfa, _shared['volcanic_record'], _shared['breaks'], _shared['annual_depths'],
+                       _shared['dust_events'], config, verbose = False, report = report)
+
+    return cfa, ledger, original_length, counts
+
+#%%
+# Function to find the PSD humps in one shard, if chosen
+# Input: CFA dataframe of the shard, after Phase 1
+# Outputs: Boolean array (True for hump rows), number of discrete hump events in the shard
+
+def _shard_humps(cfa):
+
+    if 'humps' not in chosen_methods(_shared['config']):
+        return np.zeros(len(cfa), dtype = bool), 0
+
+    # Rows in dust & volcanic events are never humps
+    events = get_flag(cfa, 'Dust Event?').to_numpy() | get_flag(cfa, 'Volcanic Event?').to_numpy()
+    return find_humps(cfa, events)
+
+#%%
+# Function to get the columns of the outlier method halos
+# The columns the outlier methods read, the event labels, and the '1' Abakus bin (for the run report)
+# Input: CFA dataframe of a shard, after Phase 1
+# Output: List of columns
+
+def _halo_columns(cfa):
+
+    return list(dict.fromkeys(method_columns(_shared['config'], cfa.columns) + ['1']))
+
+#%%
+# Function to get the halo rows of each shard, from the edge rows of the other shards
+# Halos can be longer than a shard, so they can take rows from several shards
+# Inputs: List of the first (or last) rows of each shard, number of halo rows, whether the halo is after the shards
+# Output: List of halo dataframes (None for shards without halo rows)
+
+def _halos(edges, rows, after = False):
+
+    halos = []
+    for shard in range(len(edges)):
+        # Shards next to this one, nearest first
+        others = edges[shard + 1:] if after else edges[:shard][::-1]
+        parts, count = [], 0
+        for edge in others:
+            if count >= rows:
+                break
+            if len(edge) > 0:
+                parts.append(edge)
+                count += len(edge)
+
+        if not parts:
+            halos.append(None)
+            continue
+        halo = pd.concat(parts if after else parts[::-1], ignore_index = True)
+        halos.append(halo.iloc[:rows] if after else halo.iloc[len(halo) - rows:] if len(halo) > rows else halo)
+
+    return halos
+
+#%%
+# Function to run Phase 1 on one shard and get what the main process needs for the whole core (round 1)
+# Inputs: First and last (+1) raw rows of the shard
+# Output: Dictionary of the last depth before the shard, number of raw rows with data, error counts,
+#         which core breaks & volcanic events have rows in the shard, the CPP & concentration values,
+#         the PSD hump rows (with the depths of the first & last ones, and the number of events),
+#         the first & last depths and the number of depth gaps in the shard (if finding depth gaps),
+#         and the first & last rows of the shard for the outlier method halos (columns the methods read)
+
+def _scan_shard(start, end):
+    config = _shared['config']
+
+    previous_depth = _previous_depth(_shared['raw'], start, config['bubble_threshold'])
+    cfa, ledger, original_length, counts = _phase1_shard(start, end, previous_depth)
+
+    # CPP & concentration in the column types Phase 2 uses
+    if config['compact_dtypes']:
+        cfa = compact_cfa(cfa)
+
+    humps, hump_events = _shard_humps(cfa)
+    hump_depths = cfa['Depth (m)'].to_numpy()[humps]
+
+    # Depth gaps inside the shard (gaps from the shard before are found in the main process)
+    depths = cfa['Depth (m)'].dropna().to_numpy()
+    depth_gaps = None
+    if config['depth_gaps'] and len(depths) > 0:
+        depth_gaps = (depths[0], depths[-1], len(find_depth_gaps(depths, config['gap_depth'])[1]))
+
+    before, after = method_halo(config)
+    columns = _halo_columns(cfa)
+
+    return {'previous_depth':  previous_depth,
+            'original_length': original_length,
+            'counts':          counts,
+            'has_breaks':      _intervals_with_rows(cfa['Depth (m)'], _shared['break_lower'], _shared['break_upper']),
+            'has_volc':        _intervals_with_rows(cfa['AgeBP'], _shared['volc_lower'], _shared['volc_upper']),
+            'cpp':             cfa['CPP'].to_numpy(),
+            'conc':            cfa['Sum 1.1-12'].to_numpy(),
+            'humps':           humps,
+            'hump_events':     hump_events,
+            'hump_depths':     (hump_depths[0], hump_depths[-1]) if len(hump_depths) > 0 else None,
+            'depth_gaps':      depth_gaps,
+            'head':            cfa[columns].iloc[:after],
+            'tail':            cfa[columns].iloc[max(len(cfa) - before, 0):]}
+
+#%%
+# Function to save part of an output file
+# The column names are saved once, from the first shard
+# Inputs: CFA dataframe (compact or not), part name, shard number
+# Output: None
+
+def _save_part(cfa_data, name, shard):
+
+    # Save the event labels as True/False columns
+    cfa_data = expand_cfa(cfa_data)
+    if shard == 0:
+        cfa_data.iloc[:0].to_csv(_part_file(_shared['partition_folder'], name, 'header'))
+    cfa_data.to_csv(_part_file(_shared['partition_folder'], name, shard), header = False)
+
+#%%
+# Function to run Phase 1 & Phase 2 on one shard and save its parts of the output files (round 2)
+# Inputs: Shard number, first and last (+1) raw rows of the shard, last depth before the shard,
+#         core breaks & volcanic events with rows in earlier shards, last depth & segment number before the shard
+#         (for the depth gaps), halo rows before & after the shard (None if none), whole-core values of the outlier
+#         methods for the rows of the shard & its halos
+# Output: Dictionary of Phase 2 error counts, row positions of the 'bad' rows, depth gaps (None if not finding them),
+#         and the stages of both run reports
+
+def _process_shard(shard, start, end, previous_depth, seen_breaks, seen_volc, segment_start, halo_before, halo_after,
+                   whole_core):
+    config = _shared['config']
+    phase1_report = new_report('Phase 1')
+    phase2_report = new_report('Phase 2')
+
+    # Phase 1
+    cfa, ledger, original_length, counts = _phase1_shard(start, end, previous_depth, phase1_report)
+
+    # Only the first row of each core break & volcanic event in the whole dataset is 'new'
+    cfa['New Break?'] = False
+    new_break_rows = _first_rows_in_chunk(cfa['Depth (m)'], _shared['break_lower'], _shared['break_upper'], seen_breaks)
+    cfa.loc[cfa.index[new_break_rows], 'New Break?'] = True
+
+    cfa['New Volcanic Event?'] = False
+    new_event_rows = _first_rows_in_chunk(cfa['AgeBP'], _shared['volc_lower'], _shared['volc_upper'], seen_volc)
+    cfa.loc[cfa.index[new_event_rows], 'New Volcanic Event?'] = True
+
+    # Number the contiguous depth segments, if asked for
+    gaps = None
+    if config['depth_gaps']:
+        gaps, _ = _add_segments(cfa, config, *segment_start, phase1_report)
+
+    # Add the error type of each row as the last column
+    set_ledger(cfa, ledger)
+
+    # Pack the event labels into one column, if using compact column types
+    if config['compact_dtypes']:
+        cfa = compact_cfa(cfa)
+
+    with stage(phase1_report, 'export', cfa):
+        _save_part(cfa, 'phase1', shard)
+
+    # Phase 2, with rows numbered by their position in the whole dataset
+    cfa = cfa.set_axis(pd.RangeIndex(start, end))
+
+    ledger = get_ledger(cfa)
+
+    # 1) Outliers, with the halo rows around the shard and the whole-core values (see outliers.py)
+    halos = [halo for halo in [halo_before, halo_after] if halo is not None]
+    rows  = cfa[_halo_columns(cfa)]
+    if halos:
+        rows = pd.concat([halo_before, rows, halo_after], ignore_index = True)
+    first = len(halo_before) if halo_before is not None else 0
+    arrays = OutlierArrays(rows, config, start - first, whole_core)
+    find_outliers(arrays, ledger, slice(first, first + end - start), config['preserve_volcanic'] is not False, phase2_report)
+    del arrays, rows
+
+    # 2) Manual removal, skipping rows which have already been NaN'd, and the outliers
+    with stage(phase2_report, 'manual_removal', cfa, ledger):
+        manual_rows = cfa.index.isin(label_manual_removal(cfa, _shared['manual']))
+        record_errors(ledger, manual_rows & cfa['Flow Rate'].notna().to_numpy(), 'Manual Removal')
+
+    with stage(phase2_report, 'remove_bad_rows', cfa):
+        set_ledger(cfa, ledger)
+        bad_rows = error_rows(ledger, PHASE2_ERRORS)
+        bad_cfa  = cfa.iloc[bad_rows]
+
+        # NaN values in all bad rows at once, except depth, age, boolean, & error type columns
+        cfa.loc[cfa.index[bad_rows], DATA_COLUMNS] = np.nan
+
+    # 'Bad' rows are saved in one part per error type, so all rows of each type can go before the next type
+    counts = count_errors(ledger, PHASE2_ERRORS)
+    with stage(phase2_report, 'export', cfa):
+        _save_part(cfa, 'phase2', shard)
+        type_start = 0
+        for error_type in PHASE2_ERRORS:
+            _save_part(bad_cfa.iloc[type_start:type_start + counts[error_type]], _bad_part(error_type), shard)
+            type_start += counts[error_type]
+
+    return {'counts':        counts,
+            'bad_rows':      start + bad_rows,
+            'gaps':          gaps,
+            'phase1_stages': phase1_report['stages'],
+            'phase2_stages': phase2_report['stages']}
+
+#%%
+# Function to get the part name of the 'bad' rows of one error type
+# Input: Phase 2 error type
+# Output: Part name
+
+def _bad_part(error_type):
+
+    return 'bad_' + error_type.lower().replace(' ', '_')
+
+#%%
+# Function to join the saved parts into one file, in shard order
+# Inputs: Output file name, folder of the parts, list of part names, number of shards
+# Output: None
+
+def _join_parts(file, partition_folder, names, shards):
+
+    parts = [_part_file(partition_folder, names[0], 'header')]
+    parts.extend(_part_file(partition_folder, name, shard) for name in names for shard in range(shards))
+
+    with open(file, 'wb') as output:
+        for part in parts:
+            with open(part, 'rb') as f:
+                shutil.copyfileobj(f, output)
+
+#%%
+# Function to run Phase 1 & Phase 2 on depth shards in a pool of worker processes, and save the results
+# Saves the same CSV files and run reports as run_phase1, export_phase1, run_phase2, and export_phase2
+# Inputs: Folder with the data files, folder to save to, config dictionary (see config.py),
+#         number of worker processes (None uses 'processes' setting, or all cores; 1 runs without a pool),
+#         number of shards (None: 4 per process), Phase 1 & Phase 2 run reports (see report.py; new ones if not given)
+# Outputs: Names of the Phase 1, cleaned Phase 2, and 'bad' Phase 2 files, dictionaries of Phase 1 & Phase 2 error counts
+
+def run_partitioned(data_folder, output_folder, config = None, processes = None, shards = None,
+                    phase1_report = None, phase2_report = None):
+    config = make_config(config)
+    if config['output_format'] != 'csv':
+        raise ValueError("Partitioned runs only save CSV files. Use output_format = 'csv', or run without partitions.")
+    if phase1_report is None:
+        phase1_report = new_report('Phase 1', config)
+    if phase2_report is None:
+        phase2_report = new_report('Phase 2', config)
+
+    processes = processes or config['processes'] or os.cpu_count() or 1
+    shards    = shards or processes * SHARDS_PER_PROCESS
+
+    print('\n\n.......................................................')
+    print('  SPICEcore Dust Data Phase 1 Cleaning: Melter Errors')
+    print('.......................................................')
+
+    # Share the raw CFA data with the workers as memory-mapped column files
+    partition_folder = os.path.join(output_folder, PARTITION_FOLDER)
+    remove_handoff(partition_folder)
+    os.makedirs(partition_folder, exist_ok = True)
+
+    inputs     = load_phase1_inputs(data_folder, compact = config['compact_dtypes'])
+    raw_folder = save_handoff(inputs['cfa'], partition_folder, index = True, folder_name = RAW_FOLDER)
+    n_rows     = len(inputs['cfa'])
+
+    # Interpolate ages for glacial volcanic events
+    volcanic_record = _interpolate_volcanic_ages(inputs['volcanic_record'], inputs['annual_depths'])
+    break_lower, break_upper, volc_lower, volc_upper = _event_intervals(inputs['breaks'], volcanic_record, config)
+
+    shared = {'config':           config,
+              'raw_folder':       raw_folder,
+              'partition_folder': partition_folder,
+              'breaks':           inputs['breaks'],
+              'annual_depths':    inputs['annual_depths'],
+              'dust_events':      inputs['dust_events'],
+              'volcanic_record':  volcanic_record,
+              'manual':           load_cached(os.path.join(data_folder, MANUAL_FILE)),
+              'break_lower':      break_lower,
+              'break_upper':      break_upper,
+              'volc_lower':       volc_lower,
+              'volc_upper':       volc_upper}
+    # The raw CFA data are read from the column files from now on
+    del inputs
+
+    # Shards of consecutive rows, as equal in size as possible
+    bounds = np.unique(np.linspace(0, n_rows, min(shards, max(n_rows, 1)) + 1).astype(int))
+    starts, ends = bounds[:-1].tolist(), bounds[1:].tolist()
+    shards = len(starts)
+
+    print('\n\n---------------------------------------------------------------------------------')
+    print('Filtering errors from liquid conductivity, flow rate, depth, and Abakus data,')
+    print('and adding timescale & event labels, in', shards, 'depth shards on', processes, 'process(es).')
+
+    if processes == 1:
+        _start_worker(shared)
+        pool = None
+        pool_map = map
+    else:
+        # Each worker gets the shared data once, when it starts
+        pool = ProcessPoolExecutor(max_workers = processes, initializer = _start_worker, initargs = (shared,))
+        pool_map = pool.map
+
+    try:
+        # Round 1: Phase 1 on each shard
+        scans = list(pool_map(_scan_shard, starts, ends))
+
+        # Phase 1 error counts for the whole dataset
+        errors = {'Original length': sum(scan['original_length'] for scan in scans)}
+        for error, count in ERROR_COUNTS.items():
+            errors[count] = sum(scan['counts'][error] for scan in scans)
+
+        # Core breaks & volcanic events with rows in the shards before each shard
+        seen_breaks = np.cumsum([np.zeros(len(break_lower), dtype = bool)] + [scan['has_breaks'] for scan in scans[:-1]], axis = 0) > 0
+        seen_volc   = np.cumsum([np.zeros(len(volc_lower),  dtype = bool)] + [scan['has_volc']   for scan in scans[:-1]], axis = 0) > 0
+
+        # Last depth before each shard (found in round 1)
+        previous_depths = [scan['previous_depth'] for scan in scans]
+
+        # Last depth & segment number before each shard, for the depth gaps
+        # (a gap between two shards starts a new segment in the shard after it)
+        segment_starts, last_depth, segment = [], np.nan, 0
+        for scan in scans:
+            segment_starts.append((last_depth, segment))
+            if scan['depth_gaps'] is not None:
+                first_depth, shard_last_depth, shard_gaps = scan['depth_gaps']
+                segment += int(first_depth - last_depth >= config['gap_depth']) + shard_gaps
+                last_depth = shard_last_depth
+
+        # Discrete PSD hump events: events continuing from the shard before are only counted once
+        hump_depths = [scan['hump_depths'] for scan in scans if scan['hump_depths'] is not None]
+        hump_events = sum(scan['hump_events'] for scan in scans) - sum(
+            1 for before, after in zip(hump_depths[:-1], hump_depths[1:]) if after[0] - before[1] < HUMP_GAP)
+
+        # CPP & concentration of the whole core, from the values of all shards
+        cpp   = np.concatenate([scan['cpp']   for scan in scans])
+        conc  = np.concatenate([scan['conc']  for scan in scans])
+        humps = np.concatenate([scan['humps'] for scan in scans])
+
+        # Whole-core values of the outlier methods (e.g. MADs, without the PSD humps), from the values of all shards
+        whole = OutlierArrays(pd.DataFrame({'CPP': cpp, 'Sum 1.1-12': conc}), config)
+        whole['humps'], whole['hump_events'] = humps, hump_events
+        whole_core = whole_core_values(whole)
+        del whole
+
+        # Halo rows of each shard, from the edge rows of the shards around it
+        before, after = method_halo(config)
+        halos_before = _halos([scan['tail'] for scan in scans], before)
+        halos_after  = _halos([scan['head'] for scan in scans], after, after = True)
+        del scans
+
+        # Round 2: Phase 1 & Phase 2 on each shard, saving the parts
+        # (whole-core values per row are cut to the rows of each shard & its halos)
+        results = list(pool_map(_process_shard, range(shards), starts, ends, previous_depths, seen_breaks, seen_volc,
+                                segment_starts, halos_before, halos_after,
+                                [whole_core_rows(whole_core, start - (len(halo_before) if halo_before is not None else 0),
+                                                 end + (len(halo_after) if halo_after is not None else 0))
+                                 for start, end, halo_before, halo_after in zip(starts, ends, halos_before, halos_after)]))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for result in results:
+        add_stages(phase1_report, result['phase1_stages'])
+        add_stages(phase2_report, result['phase2_stages'])
+
+    print('Original CFA dataset length:', errors['Original length'])
+    _print_errors(errors)
+
+    # Report final length
+    errors['Final length'] = _final_length(errors)
+    print('\nFinished Phase 1 dust processing.')
+    print('\tFinal dataset length:', errors['Final length'])
+    if config['depth_gaps']:
+        gaps = pd.concat([result['gaps'] for result in results], ignore_index = True)
+        errors['Depth gaps'] = len(gaps)
+        print('\tDepth gaps:', errors['Depth gaps'])
+
+    # Join the parts in shard order
+    phase1_file = os.path.join(output_folder, 'Cleaned_CFA_Phase1_' + str(date.today()) + '.csv')
+    with stage(phase1_report, 'export'):
+        _join_parts(phase1_file, partition_folder, ['phase1'], shards)
+
+    print('\tData exported to CSV [Cleaned_CFA_Phase1_...].')
+    if config['depth_gaps']:
+        _save_gaps(gaps, output_folder)
+    save_report(phase1_report, output_folder)
+    print('\tRun report saved [Run_Report_Phase1_...].')
+    print('---------------------------------------------------------------------------------')
+
+    # Print header for Phase 2 data processing
+    print('\n\n...................................................................')
+    print('  SPICEcore Dust Data Phase 2 Cleaning: Outliers and Contamination')
+    print('...................................................................')
+
+    # Phase 2 error counts for the whole dataset
+    counts = {error_type: sum(result['counts'][error_type] for result in results) for error_type in PHASE2_ERRORS}
+    phase2_errors = {'Length after Phase 1': int(np.count_nonzero(~np.isnan(conc)))}
+
+    print('\n\n-----------------------------------------------------------------------')
+    print('CFA dataset length after error removal:', phase2_errors['Length after Phase 1'])
+    for name in chosen_methods(config):
+        method = OUTLIER_METHODS[name]
+        phase2_errors[method['count_name']] = counts[method['error_type']]
+        print('\t' + method['count_name'] + ':', phase2_errors[method['count_name']])
+    if 'humps' in chosen_methods(config):
+        phase2_errors['PSD hump events'] = hump_events
+        print('\tPSD hump events:', hump_events)
+    phase2_errors['Manual removal'] = counts['Manual Removal']
+    print('\tManual removal:', phase2_errors['Manual removal'])
+
+    # Compute summary statistics before and after Phase 2 processing, if requested
+    if config['print_stats']:
+
+        with stage(phase2_report, 'summary_statistics'):
+            bad_rows = np.concatenate([result['bad_rows'] for result in results])
+            cfa_phase1 = pd.DataFrame({'Sum 1.1-12': conc, 'CPP': cpp})
+            cfa = cfa_phase1.copy()
+            cfa.iloc[bad_rows] = np.nan
+
+            # Statistics of the before & after CFA data are calculated together
+            stats = column_statistics({'After Phase 1': cfa_phase1, 'After Phase 2': cfa})
+            print('\n--Results After Phase 1 Processing--')
+            print_statistics(stats, 'After Phase 1')
+            print('\n--Results After Phase 2 Processing--')
+            print_statistics(stats, 'After Phase 2')
+
+    # Report final length
+    phase2_errors['Final length'] = phase2_errors['Length after Phase 1'] - sum(counts.values())
+    print('\n\nFinished SPICEcore dust processing.')
+    print('\n\tFinal dataset length:', phase2_errors['Final length'])
+
+    phase2_file = os.path.join(output_folder, 'Cleaned_CFA_Phase2_' + str(date.today()) + '.csv')
+    bad_file    = os.path.join(output_folder, 'Bad_CFA_Phase2_' + str(date.today()) + '.csv')
+    with stage(phase2_report, 'export'):
+        _join_parts(phase2_file, partition_folder, ['phase2'], shards)
+        # All rows of each error type, in the order of the error types (as in run_phase2)
+        _join_parts(bad_file, partition_folder, [_bad_part(error_type) for error_type in PHASE2_ERRORS], shards)
+
+    print('\n\tData exported to CSV [Cleaned_CFA_Phase2_...].'
+          '\n\tBad data saved in separate file [Bad_CFA_Phase2_...].')
+    save_report(phase2_report, output_folder)
+    print('\tRun report saved [Run_Report_Phase2_...].')
+    print('-----------------------------------------------------------------------')
+
+    # The raw CFA column files and parts are only needed during the run
+    remove_handoff(partition_folder)
+
+    return phase1_file, phase2_file, bad_file, errors, phase2_errors
@@ -0,0 +1,530 @@
+# ------------------------------------------------------------------------------------------------------
+#                     SPICEcore Dust Phase 1 Processing: Mechanical Error Removal
+# Removes melting errors in the raw CFA data, interpolates a timescale, and adds descriptive columns
+#
+# Phase 1 Dust Processing
+#    - Loads raw, unfiltered continuous flow analysis (CFA) data with minor depth corrections
+#    - Loads supporting datafiles
+#    - Tracks the number of measurements NaN'ed in each step
+#    - Records the error type of each NaN'ed measurement in the 'Error Type' column (see ledger.py)
+#    - Records the time, memory, and rows of each step in a run report, if given (see report.py)
+#
+#    1) NaNs data from air bubbles bubbles using liquid conductivity values
+#    2) NaNs liquid conductivity values < 0.6 us
+#    3) NaNs measurements without positive flow rates
+#    4) NaNs measurements with depth duplicates or decreases
+#    5) NaNs measurements with infinite or negative dust values
+#    6) Applies correction to dust data from bad melt day (7/19/2016)
+#    7) Applies timescale to the dust data (annual layers in the Holocene, volcanic tie points for the glacial)
+#    8) Labels all measurements near core breaks
+#    9) Labels all measurements within volcanic events and dust events
+#   10) Calculates particle concentration and coarse particle percentage (CPP)
+#       Optional: numbers the contiguous depth segments between depth gaps ('depth_gaps' setting), and saves a table
+#       of the gaps with the cleaned dataset
+#   11) Exports cleaned dataset to CSV (or Parquet or Arrow, see formats.py)
+#
+# Raw CFA files too large to load at once can be processed in chunks with stream_phase1
+#    - Reads the raw CSV a chunk of rows at a time and appends each cleaned chunk to the output CSV
+#    - Each chunk gets 1 raw row from the chunks before & after it (the halo) for the bubble slopes
+#    - The last depth of the chunk before carries over for the depth-not-increasing check,
+#      and core break & volcanic events already seen carry over for the 'New ...?' columns
+#      (and the last depth & segment, for the depth gaps)
+#    - Output is the same, byte for byte, as run_phase1 followed by export_phase1
+#
+# List of functions:
+#
+#  1) load_phase1_inputs: Load the raw CFA data and supporting datafiles
+#  2) run_phase1:         Run Phase 1 processing (steps 1-10) and report error counts
+#  3) export_phase1:      Save the Phase 1 CFA data to CSV, Parquet, or Arrow (step 11)
+#  4) stream_phase1:      Run Phase 1 processing chunk by chunk, saving each chunk to CSV, Parquet, or Arrow (steps 1-11)
+#
+# Katie Anderson and Aaron Chesler, 7/16/20
+# ------------------------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import os
+from   datetime import date
+
+from .config    import make_config
+from .schema    import CFA_DTYPES, compact_cfa
+from .formats   import CFAWriter, save_cfa, patch_csv, format_name
+from .ledger    import PHASE1_ERRORS, NO_ERROR, set_ledger, record_errors, count_errors
+from .report    import new_report, stage, save_report
+from .functions import (load_cached, detect_bubbles, remove_melter_errors, correct_meltday, label_intervals,
+                        label_core_breaks, label_volc_events, label_dust_events, find_cpp, find_depth_gaps, segment_gaps)
+
+# Names of the Phase 1 input files in the data folder
+PHASE1_FILES = {
+    'cfa':             'CFA_Unfiltered_Synchronized_1_2_20.csv',
+    'volcanic_record': 'Full_final_volcanic_record_7August2019.xlsx',
+    'breaks':          'core_breaks_full.xlsx',
+    'annual_depths':   'SPICEcore_Timescale_4_24_2019.xlsx',
+    'dust_events':     'Dust_Events.xlsx',
+}
+
+# Names of the error counts for each Phase 1 error type in the ledger
+ERROR_COUNTS = dict(zip(PHASE1_ERRORS, ['Bubble errors', 'Liquid conductivity < 0.6', 'No/negative flow rate errors',
+                                        'Depth not increasing errors', 'Rows without depth data',
+                                        'Rows with invalid dust data']))
+
+# Options for reading the raw CFA CSV (as floats)
+CFA_READ_OPTIONS = {'dtype': 'float', 'index_col': 'Unnamed: 0'}
+
+#%%
+# Function to get the options for reading the raw CFA CSV
+# Input: Whether to read the compact column types (see schema.py)
+# Output: Dictionary of read options for pd.read_csv
+
+def _cfa_read_options(compact = False):
+
+    if not compact:
+        return CFA_READ_OPTIONS
+    # Read the columns straight into the compact types, so the float64 data are never all in memory
+    return dict(CFA_READ_OPTIONS, dtype = dict(CFA_DTYPES, **{'Unnamed: 0': 'float64'}))
+
+#%%
+# Function to load the raw CFA data and supporting datafiles
+# Files are saved to a binary cache in a 'Cache' folder on the first run, so later runs load much faster
+# Inputs: Folder with the data files, whether to load the raw CFA data (False for stream_phase1),
+#         whether to load the CFA data in compact column types (see schema.py)
+# Output: Dictionary of input dataframes (keys match PHASE1_FILES)
+
+def load_phase1_inputs(data_folder, include_cfa = True, compact = False):
+
+    inputs = {}
+    # Load CSV CFA data as floats
+    if include_cfa:
+        inputs['cfa'] = load_cached(os.path.join(data_folder, PHASE1_FILES['cfa']), **_cfa_read_options(compact))
+    # Load other needed files
+    inputs['volcanic_record'] = load_cached(os.path.join(data_folder, PHASE1_FILES['volcanic_record']))
+    inputs['breaks']          = load_cached(os.path.join(data_folder, PHASE1_FILES['breaks']))
+    inputs['annual_depths']   = load_cached(os.path.join(data_folder, PHASE1_FILES['annual_depths']),
+                                            sheet_name = 'Depth-Age Scale')
+    inputs['dust_events']     = load_cached(os.path.join(data_folder, PHASE1_FILES['dust_events']))
+
+    return inputs
+
+#%%
+# Function to interpolate ages for glacial volcanic events
+# Inputs: Volcanic record dataframe, depth-age timescale dataframe
+# Output: Copy of the volcanic record with ages for the glacial events
+
+def _interpolate_volcanic_ages(volcanic_record, annual_depths):
+
+    volcanic_record = volcanic_record.copy()
+    years_interp = pd.Series(np.interp(volcanic_record['Volcanic Depth (m)'], annual_depths['Depth (m)'], annual_depths['Age (Years Before 1950)']))
+    volcanic_record.loc[1209:, 'Start Year (b1950)'] = years_interp
+
+    return volcanic_record
+
+#%%
+# Function to print the number of rows removed for each melter error
+# Input: Error dictionary
+# Output: None
+
+def _print_errors(errors):
+
+    print('\n\tBubble errors:               ', errors['Bubble errors'])
+    print('\tLiquid conductivity < 0.6:   ', errors['Liquid conductivity < 0.6'])
+    print('\tNo/negative flow rate errors:', errors['No/negative flow rate errors'])
+    print('\tDepth not increasing errors: ', errors['Depth not increasing errors'])
+    print('\tRows without depth data:     ', errors['Rows without depth data'])
+    print('\tRows with invalid dust data: ', errors['Rows with invalid dust data'])
+
+#%%
+# Function to correct units, add ages & event labels, and calculate particle concentration & CPP (steps 6-10)
+# Inputs: CFA dataframe, volcanic record with glacial ages, core breaks, depth-age timescale, dust events,
+#         config dictionary, whether to print each step, run report (see report.py)
+# Output: CFA dataframe with the new columns
+
+def _add_columns(cfa, volcanic_record, breaks, annual_depths, dust_events, config, verbose = True, report = None):
+
+    # 6) Apply correction to Abakus data from 7/19/2016
+
+    if verbose: print('\tCorrecting units for one melt day.')
+
+    with stage(report, 'meltday', cfa):
+        cfa = correct_meltday(cfa)
+
+    # 7) Interpolate ages for the CFA rows
+
+    # Need to interpolate ages before adding in the volcanic events
+    if verbose: print('Interpolating depth-age timescale.')
+
+    #Interpolate ages for SPICEcore timescale
+    with stage(report, 'timescale', cfa):
+        cfa['AgeBP'] = np.interp(cfa['Depth (m)'], annual_depths['Depth (m)'], annual_depths['Age (Years Before 1950)'])
+
+    # 8) Label each CFA row near core breaks
+
+    if verbose: print('Labelling core breaks.')
+
+    with stage(report, 'core_breaks', cfa):
+        # Add Y/N 'Break?' column. Default to False.
+        cfa['Break?']     = False
+        # Add Y'N 'New Break?' column to record first row in each discrete core break range. Default False.
+        cfa['New Break?'] = False
+
+        # Get the row indices of all measurements near core breaks
+        # Inputs: CFA data, core break data, depth buffer around core breaks
+        # Buffer: +/- 3 cm of a core break by default ('core_break_buffer' setting)
+        break_rows, new_break_rows = label_core_breaks(cfa, breaks, config['core_break_buffer'])
+        # Change all 'Break?' values in those rows to True
+        cfa.loc[break_rows, 'Break?']         = True
+        cfa.loc[new_break_rows, 'New Break?'] = True
+
+    # 9) Label all measurements near volcanic events and dust events
+
+    if verbose: print('Labelling volcanic events.')
+
+    with stage(report, 'volcanic_events', cfa):
+        # Create Y/N 'Volcanic Event?' column. Default to False
+        cfa['Volcanic Event?']     = False
+        # This column will indicate the first measurement for each event, as a way to count the events
+        cfa['New Volcanic Event?'] = False
+
+        # Get list of all indices occurring near volcanic events (by year, not depth)
+        # Function inputs: CFA data, volcanic record, + year buffer, - year buffer
+        # Buffers: -6/+2 years by default ('volc_start_buffer' and 'volc_end_buffer' settings)
+        volc_rows, new_event_rows = label_volc_events(cfa, volcanic_record,
+                                                      config['volc_start_buffer'], config['volc_end_buffer'])
+        # Change all 'Volcanic Event?' values in those rows to True
+        cfa.loc[volc_rows, 'Volcanic Event?']          = True
+        cfa.loc[new_event_rows, 'New Volcanic Event?'] = True
+
+    if verbose: print('Labelling dust events.')
+
+    with stage(report, 'dust_events', cfa):
+        # Add Y/N 'Dust Event?' column. Default to false.
+        cfa['Dust Event?'] = False
+        # Get the row indices of all measurements within dust events
+        dust_rows = label_dust_events(cfa, dust_events)
+        # Change all 'Dust Event?' values in those rows to True
+        cfa.loc[dust_rows, 'Dust Event?'] = True
+
+    # 10) Calculate particle concentration and CPP
+
+    if verbose: print('Calculating particle concentration and CPP.')
+    with stage(report, 'sums_cpp', cfa):
+        # Need at least 1 value to sum (skip NaN rows)
+        cfa['Sum 1.1-12'] = cfa.loc[:, '1.1':'12'].sum(axis = 1, min_count = 1)
+
+        # Add CPP column to CFA dataframe
+        cfa['CPP'] = find_cpp(cfa)
+
+    return cfa
+
+#%%
+# Function to number the contiguous depth segments of the CFA data, in a 'Segment' column
+# Segments start at 0, and go up by 1 after each depth gap (see find_depth_gaps)
+# Inputs: CFA dataframe (changed in place), config dictionary, last depth & segment number before these rows,
+#         run report (see report.py)
+# Outputs: Gap table of these rows, last depth in these rows
+
+def _add_segments(cfa, config, last_depth = np.nan, segment = 0, report = None):
+
+    with stage(report, 'depth_gaps', cfa):
+        segments, gaps, last_depth = find_depth_gaps(cfa['Depth (m)'], config['gap_depth'], last_depth, segment)
+        cfa['Segment'] = segments
+
+    return gaps, last_depth
+
+#%%
+# Function to save the table of depth gaps (Depth_Gaps_Phase1_...)
+# Inputs: Gap table (see find_depth_gaps), folder to save to
+# Output: None
+
+def _save_gaps(gaps, data_folder):
+
+    gaps.to_csv(os.path.join(data_folder, 'Depth_Gaps_Phase1_' + str(date.today()) + '.csv'), index = False)
+    print('\tDepth gaps saved to CSV [Depth_Gaps_Phase1_...].')
+
+#%%
+# Function to get the final dataset length after all melter errors
+# Input: Error dictionary
+# Output: Final length
+
+def _final_length(errors):
+
+    return (errors['Original length'] - errors['Bubble errors'] - errors['Liquid conductivity < 0.6']
+            - errors['No/negative flow rate errors'] - errors['Depth not increasing errors']
+            - errors['Rows without depth data'] - errors['Rows with invalid dust data'])
+
+#%%
+# Function to run Phase 1 processing
+# The input dataframes are not changed
+# Inputs: Dictionary of input dataframes (from load_phase1_inputs), config dictionary (see config.py),
+#         run report to record each step in (see report.py; saved by export_phase1)
+# Outputs: Cleaned CFA dataframe, dictionary of error counts
+
+def run_phase1(inputs, config = None, report = None):
+    config = make_config(config)
+
+    print('\n\n.......................................................')
+    print('  SPICEcore Dust Data Phase 1 Cleaning: Melter Errors')
+    print('.......................................................')
+
+    cfa             = inputs['cfa'].copy()
+    breaks          = inputs['breaks']
+    annual_depths   = inputs['annual_depths']
+    dust_events     = inputs['dust_events']
+
+    # Interpolate ages for glacial volcanic events
+    volcanic_record = _interpolate_volcanic_ages(inputs['volcanic_record'], annual_depths)
+
+    # Record the number of rows removed for each error type
+    errors = {}
+    # Record the error type of each row (see ledger.py)
+    ledger = np.full(len(cfa), NO_ERROR, dtype = np.int8)
+
+    # Get original length of the CFA dataset, so errors can be tracked
+    original_length = cfa['1'].count()
+    errors['Original length'] = original_length
+    print('\n\n---------------------------------------------------------------------------------')
+    print('Filtering errors from liquid conductivity, flow rate, depth, and Abakus data.')
+    print('Original CFA dataset length:', original_length)
+
+    # 1) Remove data reflecting bubbles with liquid conductivity values
+
+    #    Note: Liquid conductivity is listed in the 'ECM' column of the CFA data
+    #    Do this before NaN'ing a bunch of rows
+    #    NaN all rows where slopes indicate bubbles. Slopes for all rows are calculated at once.
+    with stage(report, 'bubbles', cfa, ledger):
+        bubble_rows = detect_bubbles(cfa, config['bubble_threshold'])
+        record_errors(ledger, cfa.index.isin(bubble_rows), 'Bubble')
+
+    # 2-5) Remove liquid conductivity, flow rate, depth, and Abakus errors, all in one pass
+    #      Rows with more than one error are only counted once, for their first error
+    with stage(report, 'melter_errors', cfa, ledger):
+        remove_melter_errors(cfa, ledger)
+    errors.update({ERROR_COUNTS[error]: count for error, count in count_errors(ledger, PHASE1_ERRORS).items()})
+    _print_errors(errors)
+
+    # 6-10) Correct units, add ages & event labels, and calculate particle concentration & CPP
+    cfa = _add_columns(cfa, volcanic_record, breaks, annual_depths, dust_events, config, report = report)
+
+    # Number the contiguous depth segments, if asked for
+    if config['depth_gaps']:
+        print('Finding depth gaps.')
+        gaps, _ = _add_segments(cfa, config, report = report)
+        errors['Depth gaps'] = len(gaps)
+
+    # Add the error type of each row as the last column
+    set_ledger(cfa, ledger)
+
+    # Pack the event labels into one column, if using compact column types
+    if config['compact_dtypes']:
+        cfa = compact_cfa(cfa)
+
+    # Report final length
+    errors['Final length'] = _final_length(errors)
+    print('\nFinished Phase 1 dust processing.')
+    print('\tFinal dataset length:', errors['Final length'])
+    if config['depth_gaps']:
+        print('\tDepth gaps:', errors['Depth gaps'])
+
+    return cfa, errors
+
+#%%
+# Function to save the Phase 1 CFA data to CSV, Parquet, or Arrow ('output_format' setting, see formats.py)
+# Also saves the run report, if given (Run_Report_Phase1_...), and the depth gaps of data with a 'Segment' column
+# (Depth_Gaps_Phase1_...)
+# Inputs: Cleaned Phase 1 CFA dataframe, folder to save to, run report (see report.py),
+#         config dictionary (see config.py), (old CSV file, list of (start, end) changed rows) to only save the changed
+#         rows of a CSV file (--incremental runs, see patch_csv; None saves every row)
+# Output: Name of the saved file (the Parquet or Arrow file, if saving one)
+
+def export_phase1(cfa, data_folder, report = None, config = None, patch = None):
+    config = make_config(config)
+
+    file_stem = os.path.join(data_folder, 'Cleaned_CFA_Phase1_' + str(date.today()))
+    # Save the event labels as True/False columns
+    with stage(report, 'export', cfa):
+        file = None
+        if patch is not None and config['output_format'] == 'csv':
+            file = patch_csv(cfa, file_stem, *patch)
+        if file is None:
+            file = save_cfa(cfa, file_stem, config['output_format'], config['archive_csv'], config['row_group_depth'])
+
+    print('\tData exported to ' + format_name(config['output_format'], config['archive_csv']) + ' [Cleaned_CFA_Phase1_...].')
+    if 'Segment' in cfa.columns:
+        _save_gaps(segment_gaps(cfa['Depth (m)'], cfa['Segment']), data_folder)
+    if report is not None:
+        save_report(report, data_folder)
+        print('\tRun report saved [Run_Report_Phase1_...].')
+    print('---------------------------------------------------------------------------------')
+
+    return file
+
+#%%
+# Function to get the core break & volcanic event intervals (same as label_core_breaks & label_volc_events)
+# Inputs: Core breaks, volcanic record with glacial ages, config dictionary
+# Outputs: Arrays of lower and upper core break depths, arrays of lower and upper volcanic event ages
+
+def _event_intervals(breaks, volcanic_record, config):
+
+    break_lower = (breaks['Depth (m)'] - config['core_break_buffer']).to_numpy(dtype = 'float')
+    break_upper = (breaks['Depth (m)'] + config['core_break_buffer']).to_numpy(dtype = 'float')
+    volc_lower  = (volcanic_record['Start Year (b1950)'] - config['volc_end_buffer']).to_numpy(dtype = 'float')
+    volc_upper  = (volcanic_record['Start Year (b1950)'] + config['volc_start_buffer']).to_numpy(dtype = 'float')
+
+    return break_lower, break_upper, volc_lower, volc_upper
+
+#%%
+# Function to find which intervals have rows in this chunk of CFA data
+# Inputs: CFA column values (depth or age), arrays of lower and upper interval limits
+# Output: Boolean array (True for intervals with at least one row)
+
+def _intervals_with_rows(values, lower, upper):
+
+    values = np.asarray(values, dtype = 'float')
+    sorted_values = np.sort(values[~np.isnan(values)])
+
+    # Number of rows in each interval (0 for intervals with NaN limits)
+    counts = np.searchsorted(sorted_values, upper, side = 'right') - np.searchsorted(sorted_values, lower, side = 'left')
+
+    return counts > 0
+
+#%%
+# Function to find the first row of each interval which is new in this chunk of CFA data
+# Intervals with rows in an earlier chunk already have their first row
+# Inputs: CFA column values (depth or age), arrays of lower and upper interval limits,
+#         boolean array of intervals seen in earlier chunks (updated in place)
+# Output: Array of first row positions in this chunk
+
+def _first_rows_in_chunk(values, lower, upper, seen):
+
+    has_rows = _intervals_with_rows(values, lower, upper)
+    new = has_rows & ~seen
+    seen |= has_rows
+
+    rows, first_rows = label_intervals(values, lower[new], upper[new])
+
+    return first_rows
+
+#%%
+# Function to run Phase 1 processing chunk by chunk, for raw CFA files too large to load at once
+#    - Only one chunk of the raw CFA data (plus 1 halo row on each side) is in memory at a time
+#    - Each cleaned chunk is appended to the output file(s), with the same data as export_phase1 would save
+#    - Saves a run report, with the steps of every chunk added together (Run_Report_Phase1_...)
+# Inputs: Folder with the data files, folder to save to, config dictionary (see config.py),
+#         number of raw CFA rows per chunk, run report (see report.py; a new one if not given)
+# Outputs: Name of the saved file, dictionary of error counts
+
+def stream_phase1(data_folder, output_folder, config = None, chunk_rows = 1000000, report = None):
+    config = make_config(config)
+    if report is None:
+        report = new_report('Phase 1', config)
+
+    print('\n\n.......................................................')
+    print('  SPICEcore Dust Data Phase 1 Cleaning: Melter Errors')
+    print('.......................................................')
+
+    # Supporting datafiles are small, so load them all at once
+    inputs          = load_phase1_inputs(data_folder, include_cfa = False)
+    breaks          = inputs['breaks']
+    annual_depths   = inputs['annual_depths']
+    dust_events     = inputs['dust_events']
+
+    # Interpolate ages for glacial volcanic events
+    volcanic_record = _interpolate_volcanic_ages(inputs['volcanic_record'], annual_depths)
+
+    # Core break & volcanic event intervals, and whether each one has had its first row yet
+    break_lower, break_upper, volc_lower, volc_upper = _event_intervals(breaks, volcanic_record, config)
+    seen_breaks = np.zeros(len(break_lower), dtype = bool)
+    seen_volc   = np.zeros(len(volc_lower),  dtype = bool)
+
+    # Record the number of rows removed for each error type
+    errors = dict({'Original length': 0}, **{count: 0 for count in ERROR_COUNTS.values()})
+
+    print('\n\n---------------------------------------------------------------------------------')
+    print('Filtering errors from liquid conductivity, flow rate, depth, and Abakus data,')
+    print('and adding timescale & event labels, in chunks of', chunk_rows, 'rows.')
+
+    writer = CFAWriter(os.path.join(output_folder, 'Cleaned_CFA_Phase1_' + str(date.today())),
+                       config['output_format'], config['archive_csv'], config['row_group_depth'])
+    chunks = pd.read_csv(os.path.join(data_folder, PHASE1_FILES['cfa']), chunksize = chunk_rows,
+                         **_cfa_read_options(config['compact_dtypes']))
+
+    # Last raw row of the chunk before, and last depth before depth errors were removed
+    previous_row   = None
+    previous_depth = np.nan
+    # Last depth & segment number so far, and the depth gaps of each chunk
+    last_depth, segment, gaps = np.nan, 0, []
+
+    chunk = next(chunks, None)
+    while chunk is not None:
+        # Read ahead to get the first raw row of the next chunk
+        next_chunk = next(chunks, None)
+        errors['Original length'] += chunk['1'].count()
+
+        # 1) Remove data reflecting bubbles with liquid conductivity values
+        #    Bubble slopes need the raw rows before & after each row, so add them around the chunk
+        halo_before = 0 if previous_row is None else 1
+        cfa = pd.concat([previous_row, chunk, None if next_chunk is None else next_chunk.iloc[:1]])
+        previous_row = chunk.iloc[-1:]
+
+        with stage(report, 'bubbles'):
+            bubble_rows = detect_bubbles(cfa, config['bubble_threshold'])
+            # Drop the halo rows again
+            cfa = cfa.iloc[halo_before:halo_before + len(chunk)].copy()
+            ledger = np.full(len(cfa), NO_ERROR, dtype = np.int8)
+            record_errors(ledger, cfa.index.isin(bubble_rows), 'Bubble')
+
+        # 2-5) Remove liquid conductivity, flow rate, depth, and Abakus errors, all in one pass
+        with stage(report, 'melter_errors', cfa, ledger):
+            previous_depth = remove_melter_errors(cfa, ledger, previous_depth)
+        for error, count in count_errors(ledger, PHASE1_ERRORS).items():
+            errors[ERROR_COUNTS[error]] += count
+
+        # 6-10) Correct units, add ages & event labels, and calculate particle concentration & CPP
+        cfa = _add_columns(cfa, volcanic_record, breaks, annual_depths, dust_events, config, verbose = False,
+                           report = report)
+
+        # Only the first row of each core break & volcanic event in the whole dataset is 'new'
+        cfa['New Break?'] = False
+        new_break_rows = _first_rows_in_chunk(cfa['Depth (m)'], break_lower, break_upper, seen_breaks)
+        cfa.loc[cfa.index[new_break_rows], 'New Break?'] = True
+
+        cfa['New Volcanic Event?'] = False
+        new_event_rows = _first_rows_in_chunk(cfa['AgeBP'], volc_lower, volc_upper, seen_volc)
+        cfa.loc[cfa.index[new_event_rows], 'New Volcanic Event?'] = True
+
+        # Number the contiguous depth segments, if asked for
+        if config['depth_gaps']:
+            chunk_gaps, last_depth = _add_segments(cfa, config, last_depth, segment, report)
+            segment += len(chunk_gaps)
+            gaps.append(chunk_gaps)
+
+        # Add the error type of each row as the last column
+        set_ledger(cfa, ledger)
+
+        # 11) Add the chunk to the output file(s)
+        with stage(report, 'export', cfa):
+            writer.write(cfa)
+
+        chunk = next_chunk
+
+    file = writer.close()
+
+    print('Original CFA dataset length:', errors['Original length'])
+    _print_errors(errors)
+
+    # Report final length
+    errors['Final length'] = _final_length(errors)
+    print('\nFinished Phase 1 dust processing.')
+    print('\tFinal dataset length:', errors['Final length'])
+    if config['depth_gaps']:
+        errors['Depth gaps'] = segment
+        print('\tDepth gaps:', errors['Depth gaps'])
+
+    print('\tData exported to ' + format_name(config['output_format'], config['archive_csv']) + ' [Cleaned_CFA_Phase1_...].')
+    if config['depth_gaps']:
+        _save_gaps(pd.concat(gaps, ignore_index = True), output_folder)
+    save_report(report, output_folder)
+    print('\tRun report saved [Run_Report_Phase1_...].')
+    print('---------------------------------------------------------------------------------')
+
+    return file, errors
@@ -0,0 +1,217 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore Dust Phase 2 Processing: Outliers and Contamination
+#
+# Phase 2 Dust Processing
+#    - Cleans anomalies and outliers from the continuous flow analysis (CFA) data after Phase 1 processing
+#      - Preserves data during known dust and volcanic events
+#      - Records the error type of each 'bad' row in the 'Error Type' column (see ledger.py)
+#      - Saves 'bad' data into another dataframe, labelled by error type
+#      - NaNs 'bad' data in the CFA data and prints error counts
+#      - Error types:
+#        1) Outliers, found by each chosen outlier method ('outlier_methods' setting, see outliers.py):
+#           - Particle size distribution (PSD) 'hump' anomalies, if chosen ('remove_humps' setting)
+#           - Median absolute deviation (MAD) outliers
+#           - Contamination found with trapezoid integrals of blocks of rows
+#        2) Manually-identified issues which remain
+#    - Prints summary statistics
+#    - Saves cleaned and 'bad' data to two separate files (CSV, Parquet, or Arrow, see formats.py)
+#    - Records the time, memory, and rows of each step in a run report, if given (see report.py)
+#
+# List of functions:
+#
+#  1) load_phase2_inputs: Load the Phase 1 CFA data and the manual cleaning intervals
+#  2) run_phase2:         Run Phase 2 processing and report error counts
+#  3) export_phase2:      Save the cleaned and 'bad' Phase 2 CFA data to CSV, Parquet, or Arrow
+#
+# Aaron Chesler and Katie Anderson, 7/16/20
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import os
+from   datetime import date
+
+from .config    import make_config
+from .schema    import CFA_DTYPES, compact_cfa
+from .formats   import save_cfa, patch_csv, find_cfa_file, load_cfa, format_name
+from .handoff   import map_handoff
+from .ledger    import PHASE2_ERRORS, get_ledger, set_ledger, record_errors, error_rows
+from .report    import stage, save_report
+from .functions import load_cached, label_manual_removal
+from .outliers  import OUTLIER_METHODS, OutlierArrays, chosen_methods, find_outliers
+from .stats     import column_statistics, print_statistics
+
+# Name of the manual cleaning file in the data folder
+MANUAL_FILE = 'CFA_Manual_Cleaning.xlsx'
+
+# Columns to NaN in the bad rows (all except depth, age, & boolean columns)
+DATA_COLUMNS = ['Flow Rate', 'ECM', '1', '1.1', '1.2', '1.3', '1.4', '1.5',
+                '1.6', '1.7', '1.8', '1.9', '2', '2.1', '2.2', '2.3', '2.4',
+                '2.5', '2.7', '2.9', '3.2', '3.6', '4', '4.5', '5.1', '5.7',
+                '6.4', '7.2', '8.1', '9', '10', '12', 'CPP', 'Sum 1.1-12']
+
+#%%
+# Function to load the Phase 1 CFA data and the manual cleaning intervals
+# Loads the Parquet or Arrow file saved with the CSV file instead, if there is one (see formats.py)
+# CSV values are read back exactly (pandas' default CSV reader can change the last digit), so Phase 2 gives the
+# same results as from the Phase 1 data in memory (e.g. after --chunk-rows)
+# Inputs: Name of the CFA file after Phase 1 processing (with .csv, .parquet, or .arrow extension),
+#         folder with the data files, whether to load the CFA data in compact column types (see schema.py)
+# Outputs: Phase 1 CFA dataframe, dataframe of depth intervals for manual data removal
+
+def load_phase2_inputs(file, data_folder, compact = False):
+
+    file = find_cfa_file(os.path.join(data_folder, file))
+
+    if not file.lower().endswith('.csv'):
+        # Column types are as saved. Rows are numbered from 0, as for the CSV file.
+        cfa_phase1 = load_cfa(file).reset_index(drop = True)
+        if compact:
+            cfa_phase1 = compact_cfa(cfa_phase1)
+    elif compact:
+        cfa_phase1 = compact_cfa(load_cached(file, header = 0, float_precision = 'round_trip', dtype = CFA_DTYPES))
+        del cfa_phase1['Unnamed: 0']
+    else:
+        cfa_phase1 = load_cached(file, header = 0, float_precision = 'round_trip')
+        del cfa_phase1['Unnamed: 0']
+
+    # Load file with depth intervals for manual data removal
+    manual = load_cached(os.path.join(data_folder, MANUAL_FILE))
+
+    return cfa_phase1, manual
+
+#%%
+# Function to run Phase 2 processing
+# The Phase 1 dataframe is not changed
+# Inputs: Phase 1 CFA dataframe (or a Phase 1 handoff folder from save_handoff, see handoff.py), config dictionary (see config.py),
+#         manual removal depth intervals (loaded from the data folder if not given),
+#         run report to record each step in (see report.py; saved by export_phase2)
+# Outputs: Cleaned CFA dataframe, dataframe of removed 'bad' data, dictionary of error counts
+
+def run_phase2(cfa_phase1, config = None, manual = None, report = None):
+    config = make_config(config)
+
+    # Print header for Phase 2 data processing
+    print('\n\n...................................................................')
+    print('  SPICEcore Dust Data Phase 2 Cleaning: Outliers and Contamination')
+    print('...................................................................')
+
+    # Load file with depth intervals for manual data removal
+    if manual is None:
+        manual = load_cached(os.path.join(config['data_folder'], MANUAL_FILE))
+
+    # Make separate copies of the CFA data before and after phase 2 cleaning to compare summary statistics
+    # Rows are numbered from 0, as they are when the Phase 1 data are loaded from CSV
+    if isinstance(cfa_phase1, str):
+        # Map the handoff files twice: read-only before, and copy-on-write after, so only changed data are copied
+        cfa        = map_handoff(cfa_phase1, writable = True)
+        cfa_phase1 = map_handoff(cfa_phase1)
+    else:
+        cfa_phase1 = cfa_phase1.reset_index(drop = True)
+        cfa = cfa_phase1.copy()
+
+    # Record the number of rows removed for each error type
+    errors = {}
+
+    print('\n\n-----------------------------------------------------------------------')
+    # Get length of dataset from phase 1 cleaning. Use this column to get an accurate count.
+    length = cfa['Sum 1.1-12'].count()
+    errors['Length after Phase 1'] = length
+    print('\n\nRemoving outliers.')
+    print('CFA dataset length after error removal:', length)
+
+    # Error type of each row (Phase 1 error types are kept)
+    ledger = get_ledger(cfa)
+
+    # Ask whether to preserve outliers at volcanic events, if not already chosen
+    preserve_volcanic = config['preserve_volcanic']
+    if preserve_volcanic is None and any(OUTLIER_METHODS[name]['preserve_events'] for name in chosen_methods(config)):
+        choice = input('\tPreserve outliers at volcanic events? Enter Y or N: ')
+        if choice not in ['y', 'Y', 'n', 'N']:
+            print('Invalid entry. Defaulted to preserving outliers at volcanic events.')
+        preserve_volcanic = choice not in ['n', 'N']
+
+    # 1) Identify and remove outliers with each chosen method, in order (see outliers.py):
+    #    PSD hump anomalies (if chosen), MAD outliers, and/or contamination found with trapezoid integrals
+    #    Rows in dust events (and volcanic events, if chosen) are preserved. Arrays used by several methods
+    #    (e.g. CPP & concentration without the humps) are only calculated once.
+    arrays = OutlierArrays(cfa, config)
+    errors.update(find_outliers(arrays, ledger, preserve_volcanic = preserve_volcanic, report = report, verbose = True))
+
+    # Other counts of the methods (e.g. PSD hump events, printed with the method's rows)
+    for name in chosen_methods(config):
+        for other_name, value_name in OUTLIER_METHODS[name]['other_counts'].items():
+            errors[other_name] = arrays[value_name]
+    del arrays
+
+    # 2) Remove remaining manually-identified issues
+    print('\n Removing manually-identified issues.')
+    with stage(report, 'manual_removal', cfa, ledger):
+        # Get the rows in every depth interval in the manual removal file at once
+        manual_rows = label_manual_removal(cfa, manual)
+
+        # Skip all rows where everything but depth has already been NaN'd, and the outliers
+        bad_rows = record_errors(ledger, cfa.index.isin(manual_rows) & cfa['Flow Rate'].notna().to_numpy(), 'Manual Removal')
+    errors['Manual removal'] = int(bad_rows.sum())
+
+    print('\tRows removed: ', errors['Manual removal'])
+
+    with stage(report, 'remove_bad_rows', cfa):
+        # Make one dataframe of all bad data, labelled by error type (humps, outliers, then manual removals)
+        set_ledger(cfa, ledger)
+        bad_rows = error_rows(ledger, PHASE2_ERRORS)
+        bad_cfa  = cfa.iloc[bad_rows]
+
+        # NaN values in all bad rows at once, except depth, age, boolean, & error type columns
+        cfa.loc[cfa.index[bad_rows], DATA_COLUMNS] = np.nan
+
+    # 3) Compute summary statistics before and after Phase 2 processing, if requested
+    if config['print_stats']:
+
+        with stage(report, 'summary_statistics'):
+            # Statistics of the before & after CFA data are calculated together
+            stats = column_statistics({'After Phase 1': cfa_phase1, 'After Phase 2': cfa})
+            print('\n--Results After Phase 1 Processing--')
+            print_statistics(stats, 'After Phase 1')
+            print('\n--Results After Phase 2 Processing--')
+            print_statistics(stats, 'After Phase 2')
+
+    # Report final length
+    errors['Final length'] = (length - sum(errors[OUTLIER_METHODS[name]['count_name']] for name in chosen_methods(config))
+                              - errors['Manual removal'])
+    print('\n\nFinished SPICEcore dust data processing.')
+    print('\n\tFinal dataset length:', errors['Final length'])
+
+    return cfa, bad_cfa, errors
+
+#%%
+# Function to save the cleaned and 'bad' Phase 2 CFA data to CSV, Parquet, or Arrow ('output_format' setting,
+# see formats.py)
+# Also saves the run report, if given (Run_Report_Phase2_...)
+# Inputs: Cleaned Phase 2 CFA dataframe, 'bad' CFA dataframe, folder to save to, run report (see report.py),
+#         config dictionary (see config.py), (old CSV file, list of (start, end) changed rows) to only save the changed
+#         rows of the cleaned CSV file (--incremental runs, see patch_csv; None saves every row)
+# Output: Names of the saved files (the Parquet or Arrow files, if saving them)
+
+def export_phase2(cfa, bad_cfa, data_folder, report = None, config = None, patch = None):
+    config = make_config(config)
+
+    formats = (config['output_format'], config['archive_csv'], config['row_group_depth'])
+    file_stem = os.path.join(data_folder, 'Cleaned_CFA_Phase2_' + str(date.today()))
+    # Save the event labels as True/False columns
+    with stage(report, 'export', cfa):
+        file = None
+        if patch is not None and config['output_format'] == 'csv':
+            file = patch_csv(cfa, file_stem, *patch)
+        if file is None:
+            file = save_cfa(cfa, file_stem, *formats)
+        bad_file = save_cfa(bad_cfa, os.path.join(data_folder, 'Bad_CFA_Phase2_' + str(date.today())),     *formats)
+
+    print('\n\tData exported to ' + format_name(config['output_format'], config['archive_csv']) + ' [Cleaned_CFA_Phase2_...].'
+          '\n\tBad data saved in separate file [Bad_CFA_Phase2_...].')
+    if report is not None:
+        save_report(report, data_folder)
+        print('\tRun report saved [Run_Report_Phase2_...].')
+    print('-----------------------------------------------------------------------')
+
+    return file, bad_file
@@ -0,0 +1,209 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore RUN REPORTS
+#
+# Records how long each Phase 1 & Phase 2 processing stage takes and how much memory it uses
+#    - For each stage: wall time, CPU time, increase in peak memory use (peak RSS), and the
+#      number of rows with data before and after the stage (rows with a value in the '1' Abakus bin,
+#      and no error in the error ledger, so rows count as removed in the stage which finds them)
+#    - Stages run more than once (e.g. for each chunk in stream_phase1) are added together
+#    - Stages run in worker processes (partition.py) are added together with add_stages. Times are
+#      summed over the workers, and the memory increase is the largest of any worker.
+#    - The export functions save the report as JSON & CSV next to the Cleaned_CFA_Phase... files
+#      (Run_Report_Phase1_....json/.csv, Run_Report_Phase2_....json/.csv)
+#    - One stage can be profiled with cProfile ('profile_stage' setting). The profile is saved
+#      next to the report (.prof, for pstats or snakeviz).
+#    - Peak memory use needs the 'resource' module (Linux & macOS). It is None on Windows.
+#
+#    report = new_report('Phase 1', config)
+#    cfa, errors = run_phase1(inputs, config, report)
+#    export_phase1(cfa, data_folder, report)
+#
+# List of functions:
+#
+#  1) new_report:  Start a new run report
+#  2) stage:       Record the time, memory, and rows of one stage (used in a with statement)
+#  3) add_stages:  Add the stages recorded in another run report (e.g. from a worker process) to a run report
+#  4) save_report: Save a run report (and any profile) to JSON & CSV
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+from   datetime import date, datetime
+
+from .ledger import NO_ERROR
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+# Stage names in each phase, in processing order
+# (Phase 1 steps 2-5 are one stage, as they run in one pass. 'incremental' is run_incremental, for --incremental runs.)
+PHASE1_STAGES = ['bubbles', 'melter_errors', 'meltday', 'timescale', 'core_breaks',
+                 'volcanic_events', 'dust_events', 'sums_cpp', 'depth_gaps', 'export', 'incremental']
+PHASE2_STAGES = ['psd_humps', 'mad_outliers', 'integral_contamination', 'manual_removal', 'remove_bad_rows', 'summary_statistics', 'export']
+
+# Columns of the CSV run report
+REPORT_COLUMNS = ['stage', 'calls', 'wall_time_s', 'cpu_time_s', 'peak_rss_increase_mb', 'rows_in', 'rows_out']
+
+#%%
+# Function to start a new run report
+# Inputs: Phase name ('Phase 1' or 'Phase 2'), config dictionary (see config.py)
+# Output: Run report dictionary
+
+def new_report(phase, config = None):
+
+    return {'phase':         phase,
+            'started':       datetime.now().isoformat(timespec = 'seconds'),
+            'settings':      dict(config) if config is not None else None,
+            'profile_stage': config.get('profile_stage') if config is not None else None,
+            'profiler':      None,
+            'stages':        {}}
+
+#%%
+# Function to get an empty record for one stage
+# Input: None
+# Output: Stage record dictionary
+
+def _new_record():
+
+    return {'calls': 0, 'wall_time_s': 0.0, 'cpu_time_s': 0.0,
+            'peak_rss_increase_mb': None, 'rows_in': None, 'rows_out': None}
+
+#%%
+# Function to get the peak memory use of this process so far
+# Input: None
+# Output: Peak resident set size (MB), None if not available
+
+def _peak_rss_mb():
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kB on Linux
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+#%%
+# Function to count the CFA rows with data
+# Inputs: CFA dataframe (or None), error ledger array (or None, see ledger.py)
+# Output: Number of rows with a value in the '1' Abakus bin and no error (None if not available)
+
+def _data_rows(cfa_data, ledger = None):
+
+    if cfa_data is None or '1' not in cfa_data.columns:
+        return None
+    has_data = cfa_data['1'].notna().to_numpy()
+    if ledger is not None:
+        has_data = has_data & (ledger == NO_ERROR)
+    return int(np.count_nonzero(has_data))
+
+#%%
+# Function to record the time, memory, and rows of one stage
+# Used in a with statement around the stage. Does nothing if the report is None.
+#
+#    with stage(report, 'bubbles', cfa):
+#        bubble_rows = detect_bubbles(cfa, threshold)
+#
+# Inputs: Run report dictionary (or None), stage name, CFA dataframe the stage changes and its error ledger
+#         (rows are counted before and after the stage)
+# Output: None
+
+@contextlib.contextmanager
+def stage(report, name, cfa_data = None, ledger = None):
+
+    if report is None:
+        yield
+        return
+
+    record = report['stages'].setdefault(name, _new_record())
+    rows_in    = _data_rows(cfa_data, ledger)
+    peak_start = _peak_rss_mb()
+
+    # Profile this stage, if chosen. Repeated stages are added to the same profile.
+    profiler = None
+    if report['profile_stage'] == name:
+        if report['profiler'] is None:
+            report['profiler'] = cProfile.Profile()
+        profiler = report['profiler']
+        profiler.enable()
+
+    wall_start = time.perf_counter()
+    cpu_start  = time.process_time()
+    try:
+        yield
+    finally:
+        wall_time = time.perf_counter() - wall_start
+        cpu_time  = time.process_time() - cpu_start
+        if profiler is not None:
+            profiler.disable()
+
+        record['calls']       += 1
+        record['wall_time_s'] += wall_time
+        record['cpu_time_s']  += cpu_time
+        if peak_start is not None:
+            record['peak_rss_increase_mb'] = (record['peak_rss_increase_mb'] or 0) + _peak_rss_mb() - peak_start
+        if rows_in is not None:
+            record['rows_in']  = (record['rows_in']  or 0) + rows_in
+            record['rows_out'] = (record['rows_out'] or 0) + _data_rows(cfa_data, ledger)
+
+#%%
+# Function to add the stages recorded in another run report (e.g. from a worker process) to a run report
+# Inputs: Run report dictionary (changed in place), stages of the other run report (its 'stages' dictionary)
+# Output: None
+
+def add_stages(report, stages):
+
+    for name, other in stages.items():
+        record = report['stages'].setdefault(name, _new_record())
+        record['calls']       += other['calls']
+        record['wall_time_s'] += other['wall_time_s']
+        record['cpu_time_s']  += other['cpu_time_s']
+        # Each worker has its own memory, so keep the largest increase
+        if other['peak_rss_increase_mb'] is not None:
+            record['peak_rss_increase_mb'] = max(record['peak_rss_increase_mb'] or 0, other['peak_rss_increase_mb'])
+        for rows in ['rows_in', 'rows_out']:
+            if other[rows] is not None:
+                record[rows] = (record[rows] or 0) + other[rows]
+
+#%%
+# Function to save a run report (and any profile) to JSON & CSV
+# Inputs: Run report dictionary, folder to save to
+# Output: Names of the saved JSON and CSV files
+
+def save_report(report, data_folder):
+
+    name = 'Run_Report_' + report['phase'].replace(' ', '') + '_' + str(date.today())
+    json_file = os.path.join(data_folder, name + '.json')
+    csv_file  = os.path.join(data_folder, name + '.csv')
+
+    stages = [dict(stage = stage_name, **record) for stage_name, record in report['stages'].items()]
+
+    profile_file = None
+    if report['profiler'] is not None:
+        profile_file = os.path.join(data_folder, name + '_' + report['profile_stage'] + '.prof')
+        report['profiler'].dump_stats(profile_file)
+
+    with open(json_file, 'w') as f:
+        json.dump({'phase':         report['phase'],
+                   'started':       report['started'],
+                   'finished':      datetime.now().isoformat(timespec = 'seconds'),
+                   'settings':      report['settings'],
+                   'stages':        stages,
+                   'total_wall_time_s': sum(record['wall_time_s'] for record in stages),
+                   'profile_stage': report['profile_stage'],
+                   'profile_file':  profile_file}, f, indent = 1)
+
+    # Row counts are blank for stages without them
+    table = pd.DataFrame(stages, columns = REPORT_COLUMNS).astype({'rows_in': 'Int64', 'rows_out': 'Int64'})
+    table.to_csv(csv_file, index = False)
+
+    return json_file, csv_file
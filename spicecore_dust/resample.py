@@ -0,0 +1,249 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore AGE-BINNED RESAMPLING
+#
+# Resamples particle concentration & CPP onto regular AgeBP bins (e.g. annual, decadal, and centennial
+# for the 54 ka record), for many bin widths at once
+# Replaces setup_interp & interpolate_cfa in the archived 'Old Scripts/Interpolation Setup.py'
+#    - Rows are sorted by AgeBP once, and the sort is shared by every bin width
+#    - Bins are [n * width, (n + 1) * width) years BP. The rows of each bin are next to each other after the sort,
+#      so sums & counts are one np.add.reduceat over the first row of each bin
+#    - Medians need the values sorted within each bin. Each column's values are ranked once, and for each bin width
+#      one integer sort of (bin, rank) keys puts them in order within every bin (much faster than a lexsort).
+#    - Statistics for each column: mean, median, count (rows with a value), and coverage (fraction of the bin's
+#      years covered by rows with a value). Each row covers the years to the next row, except at the depth gaps
+#      between segments ('Segment' column, see find_depth_gaps; found from the depths if there is no column).
+#    - Every bin between the youngest & oldest rows is listed. Bins without data have count 0 and NaN statistics.
+#    - Results are cached to disk, one file per bin width, matched to the data, columns, and bin width.
+#      Later runs on the same data only calculate new bin widths.
+#
+#    resampled = resample_cfa(cfa, [1, 10, 100], cache_folder = 'path/to/output/Resample_Cache')
+#    export_resample(resampled, 'path/to/output')
+#
+# 'resample_widths' setting: bin widths (years) to resample the cleaned Phase 2 data onto (None doesn't resample)
+#
+# List of functions:
+#
+#  1) resample_cfa:    Resample CFA columns onto regular AgeBP bins, for many bin widths at once
+#  2) export_resample: Save the resampled data to CSV, one file per bin width
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import os
+import hashlib
+from   datetime import date
+
+from .functions import find_depth_gaps
+
+# Columns resampled by default: particle concentration & CPP
+RESAMPLE_COLUMNS = ['Sum 1.1-12', 'CPP']
+# Name of the cache folder (in the output folder)
+RESAMPLE_CACHE = 'Resample_Cache'
+# Bits of the median sort keys used for the value rank (the bin is in the bits above)
+RANK_BITS = 32
+
+#%%
+# Function to get the contiguous segment of each row, for the coverage
+# Input: CFA dataframe
+# Output: Array of segment numbers (None without a 'Segment' or 'Depth (m)' column)
+
+def _row_segments(cfa_data):
+
+    if 'Segment' in cfa_data.columns:
+        return cfa_data['Segment'].to_numpy()
+    if 'Depth (m)' in cfa_data.columns:
+        return find_depth_gaps(cfa_data['Depth (m)'])[0]
+    return None
+
+#%%
+# Function to get a key for the data being resampled, to match cache files to it
+# Inputs: Ages, dictionary of column values, segment numbers (or None)
+# Output: Key (text)
+
+def _data_key(ages, values, segments):
+
+    key = hashlib.md5()
+    for name, array in [('AgeBP', ages)] + list(values.items()) + [('Segment', segments)]:
+        key.update(name.encode())
+        if array is not None:
+            key.update(np.ascontiguousarray(array).view(np.uint8))
+
+    return key.hexdigest()[:12]
+
+#%%
+# Function to get the name of one cache file, without extension
+# Inputs: Cache folder, bin width (years), data key
+# Output: Path of the cache file without extension
+
+def _cache_file(cache_folder, width, key):
+
+    return os.path.join(cache_folder, 'Resampled_%gyr_%s' % (width, key))
+
+#%%
+# Function to load the resampled data of one bin width from the cache
+# Inputs: Cache folder, bin width (years), data key
+# Output: Dataframe of bins (None if not cached)
+
+def _load_cache(cache_folder, width, key):
+
+    cache_file = _cache_file(cache_folder, width, key)
+    if os.path.exists(cache_file + '.parquet'):
+        return pd.read_parquet(cache_file + '.parquet')
+    if os.path.exists(cache_file + '.pkl'):
+        return pd.read_pickle(cache_file + '.pkl')
+    return None
+
+#%%
+# Function to save the resampled data of one bin width to the cache (a pickle file if pyarrow is not installed)
+# Inputs: Dataframe of bins, cache folder, bin width (years), data key
+# Output: None
+
+def _save_cache(bins, cache_folder, width, key):
+
+    os.makedirs(cache_folder, exist_ok = True)
+    cache_file = _cache_file(cache_folder, width, key)
+
+    # Write to a temporary file first so an interrupted run can't leave a broken cache
+    try:
+        bins.to_parquet(cache_file + '.tmp')
+        os.replace(cache_file + '.tmp', cache_file + '.parquet')
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        bins.to_pickle(cache_file + '.tmp')
+        os.replace(cache_file + '.tmp', cache_file + '.pkl')
+
+#%%
+# Function to rank the values of one column, for the medians
+# Input: Column values (NaNs are skipped)
+# Outputs: Rank of each value (in the order of the values without NaNs), sorted values
+
+def _rank_values(column_values):
+
+    values = column_values[~np.isnan(column_values)]
+    order  = np.argsort(values)
+    ranks  = np.empty(len(values), dtype = np.int64)
+    ranks[order] = np.arange(len(values))
+
+    return ranks, values[order]
+
+#%%
+# Function to calculate the statistics of each bin for one bin width
+# Inputs: Ages sorted from youngest to oldest (no NaNs), dictionary of column values in the same order,
+#         dictionary of column value ranks (from _rank_values), years covered by each row, bin width (years)
+# Output: Dataframe with one row per bin (bin start & end ages, and the mean, median, count & coverage of each column)
+
+def _bin_statistics(ages, values, ranks, steps, width):
+
+    # Bin of each row. Rows are sorted by age, so each bin's rows are next to each other.
+    ids = np.floor(ages / width).astype(np.int64)
+    starts = np.flatnonzero(np.diff(ids, prepend = ids[0] - 1)) if len(ids) > 0 else np.empty(0, dtype = np.int64)
+
+    # Every bin from the youngest to the oldest row, and the position of each bin with rows in that list
+    first_id  = ids[0] if len(ids) > 0 else 0
+    n_bins    = ids[-1] - first_id + 1 if len(ids) > 0 else 0
+    positions = ids[starts] - first_id
+    bin_ages  = (first_id + np.arange(n_bins)) * width
+
+    bins = {'Age Start (BP)': bin_ages, 'Age End (BP)': bin_ages + width}
+    for column, column_values in values.items():
+        valid = ~np.isnan(column_values)
+
+        count   = np.zeros(n_bins, dtype = np.int64)
+        total   = np.zeros(n_bins)
+        covered = np.zeros(n_bins)
+        if len(starts) > 0:
+            count[positions]   = np.add.reduceat(valid.astype(np.int64), starts)
+            total[positions]   = np.add.reduceat(np.where(valid, column_values, 0), starts)
+            covered[positions] = np.add.reduceat(np.where(valid, steps, 0), starts)
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            mean = total / count
+        mean[count == 0] = np.nan
+
+        # Median: sort the values within each bin, then take the middle value (or the mean of the middle two)
+        # Sorting (bin, rank) keys sorts by bin, then by value
+        column_ranks, ranked_values = ranks[column]
+        keys = ((ids[valid] - first_id) << RANK_BITS) | column_ranks
+        sorted_values = ranked_values[np.sort(keys) & ((1 << RANK_BITS) - 1)]
+        offsets = np.cumsum(count) - count
+        has_data = count > 0
+        median = np.full(n_bins, np.nan)
+        median[has_data] = (sorted_values[offsets[has_data] + (count[has_data] - 1) // 2]
+                            + sorted_values[offsets[has_data] + count[has_data] // 2]) / 2
+
+        bins[column + ' Mean']     = mean
+        bins[column + ' Median']   = median
+        bins[column + ' Count']    = count
+        # A row's years can reach into the next bin, so coverage is capped at 1
+        bins[column + ' Coverage'] = np.minimum(covered / width, 1)
+
+    return pd.DataFrame(bins)
+
+#%%
+# Function to resample CFA columns onto regular AgeBP bins, for many bin widths at once
+# Rows without an age are skipped, and rows without a value are not counted for that column
+# The CFA data are not changed
+# Inputs: CFA dataframe (e.g. cleaned Phase 2 data), list of bin widths (years), columns to resample,
+#         cache folder (None doesn't cache)
+# Output: Dictionary of bin width -> dataframe with one row per bin
+#         (bin start & end ages, and the mean, median, count & coverage of each column)
+
+def resample_cfa(cfa_data, bin_widths, columns = RESAMPLE_COLUMNS, cache_folder = None):
+
+    bin_widths = list(bin_widths)
+    if any(width <= 0 for width in bin_widths):
+        raise ValueError('Bin widths must be positive: ' + ', '.join('%g' % width for width in bin_widths))
+
+    ages     = cfa_data['AgeBP'].to_numpy(dtype = 'float')
+    values   = {column: cfa_data[column].to_numpy(dtype = 'float') for column in columns}
+    segments = _row_segments(cfa_data)
+
+    # Load the bin widths already in the cache
+    resampled = {}
+    if cache_folder is not None:
+        key = _data_key(ages, values, segments)
+        for width in bin_widths:
+            bins = _load_cache(cache_folder, width, key)
+            if bins is not None:
+                resampled[width] = bins
+
+    missing = [width for width in bin_widths if width not in resampled]
+    if missing:
+        # One sort by age, shared by every bin width
+        rows  = np.flatnonzero(~np.isnan(ages))
+        order = rows[np.argsort(ages[rows], kind = 'stable')]
+        sorted_ages   = ages[order]
+        sorted_values = {column: column_values[order] for column, column_values in values.items()}
+        # Value ranks, shared by every bin width
+        ranks = {column: _rank_values(column_values) for column, column_values in sorted_values.items()}
+
+        # Years covered by each row: up to the next row, except across depth gaps and after the last row
+        steps = np.diff(sorted_ages, append = sorted_ages[-1:])
+        if segments is not None:
+            sorted_segments = segments[order]
+            steps[:-1][sorted_segments[1:] != sorted_segments[:-1]] = 0
+
+        for width in missing:
+            resampled[width] = _bin_statistics(sorted_ages, sorted_values, ranks, steps, width)
+            if cache_folder is not None:
+                _save_cache(resampled[width], cache_folder, width, key)
+
+    return {width: resampled[width] for width in bin_widths}
+
+#%%
+# Function to save the resampled data to CSV, one file per bin width (Resampled_CFA_<width>yr_...)
+# Inputs: Dictionary of bin width -> dataframe of bins (from resample_cfa), folder to save to
+# Output: List of the saved file names
+
+def export_resample(resampled, output_folder):
+
+    files = []
+    for width, bins in resampled.items():
+        file = os.path.join(output_folder, 'Resampled_CFA_%gyr_%s.csv' % (width, date.today()))
+        bins.to_csv(file, index = False)
+        files.append(file)
+
+    print('\tResampled data exported to CSV [Resampled_CFA_...].')
+
+    return files
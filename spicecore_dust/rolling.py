@@ -0,0 +1,198 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore ROLLING MEDIANS
+#
+# Fast rolling (trailing) medians for the Phase 2 MAD background values
+#    - Gives the same values as pandas: Series.rolling(window, min_periods).median()
+#      (NaN and +/-inf are skipped, NaN until a window has min_periods values,
+#       average of the 2 middle values for even counts)
+#    - Calculates several columns (e.g. CPP & particle concentration) in one call
+#    - Uses a block algorithm (Suomela, 2014) compiled with numba: the data are split into blocks
+#      of one window, each block is sorted once, and the window median is tracked with linked lists
+#      through each pair of neighbouring blocks. Run time grows with log(window), so windows of
+#      5,000+ rows are about as fast as windows of 500.
+#    - If numba is not installed, falls back to pandas (same values, slower)
+#
+# List of functions:
+#
+#  1) rolling_median: Calculate rolling medians for one or more columns of data
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+#%%
+# Function to calculate the rolling median of one column with the block algorithm
+# Blocks are 'window' rows long. For rows in block k, the window covers the end of block k-1 (list A)
+# and the start of block k (list B). Each list is a sorted linked list of its block's values:
+# A loses one value per row and B gains one, and the median is tracked with a pointer into each list.
+# Inputs: Column of data (NaN for missing values), window size, minimum number of values, output array
+# Output: None (rolling medians are saved to the output array)
+
+def _rolling_median_blocks(x, window, min_periods, out):
+    n    = x.shape[0]
+    head = window
+    tail = window + 1
+
+    # Sorted values and linked lists for both blocks, with -inf/+inf at the head/tail
+    values_a = np.empty(window + 2)
+    values_b = np.empty(window + 2)
+    next_a   = np.empty(window + 2, np.int64)
+    prev_a   = np.empty(window + 2, np.int64)
+    next_b   = np.empty(window + 2, np.int64)
+    prev_b   = np.empty(window + 2, np.int64)
+    # Sorted position of each row in its block
+    rank_a   = np.empty(window, np.int64)
+    rank_b   = np.empty(window, np.int64)
+    block    = np.empty(window)
+    values_a[head] = -np.inf
+    values_a[tail] = np.inf
+    # No block before the first one
+    count_a = 0
+
+    for k in range((n + window - 1) // window):
+        # Sort block k (NaNs sort to the end and are never linked)
+        for j in range(window):
+            i = k * window + j
+            block[j] = x[i] if i < n else np.nan
+        order   = np.argsort(block, kind = 'mergesort')
+        count_b = 0
+        for s in range(window):
+            rank_b[order[s]] = s
+            values_b[s]      = block[order[s]]
+            if not np.isnan(values_b[s]):
+                count_b += 1
+        values_b[head] = -np.inf
+        values_b[tail] = np.inf
+
+        # Link every value in both blocks
+        for s in range(window):
+            next_a[s] = s + 1
+            prev_a[s] = s - 1
+            next_b[s] = s + 1
+            prev_b[s] = s - 1
+        for nxt, prv, count in ((next_a, prev_a, count_a), (next_b, prev_b, count_b)):
+            if count > 0:
+                nxt[head]      = 0
+                prv[0]         = head
+                nxt[count - 1] = tail
+                prv[tail]      = count - 1
+            else:
+                nxt[head] = tail
+                prv[tail] = head
+            nxt[tail] = tail
+            prv[head] = head
+
+        # Empty list B, last row first. Each unlinked value remembers its neighbours,
+        # so B can be re-linked in row order below.
+        for j in range(window - 1, -1, -1):
+            s = rank_b[j]
+            if s < count_b:
+                next_b[prev_b[s]] = next_b[s]
+                prev_b[next_b[s]] = prev_b[s]
+
+        # Pointers to the first value above the median in each list, and the number of values below them
+        point_a = next_a[head]
+        point_b = tail
+        below   = 0
+        count   = count_a
+
+        for j in range(window):
+            i = k * window + j
+            if i >= n:
+                break
+
+            # Row i - window leaves the window
+            s = rank_a[j]
+            if k > 0 and s < count_a:
+                count -= 1
+                if s < point_a:
+                    below -= 1
+                elif s == point_a:
+                    point_a = next_a[s]
+                next_a[prev_a[s]] = next_a[s]
+                prev_a[next_a[s]] = prev_a[s]
+
+            # Row i joins the window
+            s = rank_b[j]
+            if s < count_b:
+                count += 1
+                next_b[prev_b[s]] = s
+                prev_b[next_b[s]] = s
+                if s < point_b:
+                    below += 1
+
+            # Move the pointers until exactly count // 2 values are below them
+            target = count // 2
+            while True:
+                before_a = prev_a[point_a]
+                before_b = prev_b[point_b]
+                if below < target:
+                    if values_a[point_a] <= values_b[point_b]:
+                        point_a = next_a[point_a]
+                    else:
+                        point_b = next_b[point_b]
+                    below += 1
+                elif below > target:
+                    if values_a[before_a] >= values_b[before_b]:
+                        point_a = before_a
+                    else:
+                        point_b = before_b
+                    below -= 1
+                elif values_a[before_a] > values_b[point_b]:
+                    point_a = before_a
+                    point_b = next_b[point_b]
+                elif values_b[before_b] > values_a[point_a]:
+                    point_b = before_b
+                    point_a = next_a[point_a]
+                else:
+                    break
+
+            if count == 0 or count < min_periods:
+                out[i] = np.nan
+            elif count % 2 == 1:
+                out[i] = min(values_a[point_a], values_b[point_b])
+            else:
+                out[i] = (min(values_a[point_a], values_b[point_b]) +
+                          max(values_a[prev_a[point_a]], values_b[prev_b[point_b]])) / 2
+
+        # Block k is list A for the next block
+        values_a, values_b = values_b, values_a
+        rank_a, rank_b     = rank_b, rank_a
+        count_a            = count_b
+
+if njit is not None:
+    _rolling_median_blocks = njit(cache = True)(_rolling_median_blocks)
+
+#%%
+# Function to calculate rolling medians for one or more columns of data
+# Same values as pandas rolling(window, min_periods = min_periods).median() for each column
+# Inputs: List of columns (arrays or Series of the same length), window size (number of rows),
+#         minimum number of non-NaN values in a window
+# Output: List of rolling median arrays, one per column
+
+def rolling_median(columns, window, min_periods = 3):
+
+    if window < 1 or min_periods > window:
+        raise ValueError('Window must be at least 1 row and at least min_periods (%d): %d' % (min_periods, window))
+
+    data = np.array([np.asarray(column, dtype = 'float') for column in columns])
+
+    if njit is None:
+        # numba not installed
+        return [pd.Series(column).rolling(window, min_periods = min_periods).median().to_numpy()
+                for column in data]
+
+    # pandas skips +/-inf in rolling medians
+    data[~np.isfinite(data)] = np.nan
+    medians = np.empty_like(data)
+    for column, median in zip(data, medians):
+        _rolling_median_blocks(column, window, max(min_periods, 1), median)
+
+    return list(medians)
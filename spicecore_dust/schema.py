@@ -0,0 +1,113 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore CFA TABLE SCHEMA
+#
+# Column types for a compact, lower-memory copy of the continuous flow analysis (CFA) data
+#    - float64 for Depth (m) and AgeBP, which need the precision
+#    - float32 for the Abakus bins, Flow Rate, ECM, particle concentration, and CPP. This is lossy: float32 keeps
+#      ~7 significant digits, so CPP (a ratio), Flow Rate, and ECM are rounded, and particle counts are only
+#      exact below 2**24
+#    - One uint8 'Flags' column instead of the 5 True/False event label columns, with one bit per label
+#    - About half the memory of the all-float64 CFA data
+#
+# Use get_flag to read an event label from either layout, e.g. get_flag(cfa, 'Dust Event?')
+# CSV files keep the original layout: expand_cfa before saving
+#
+# List of functions:
+#
+#  1) compact_cfa: Convert CFA data to the compact column types, packing the event labels into 'Flags'
+#  2) expand_cfa:  Unpack 'Flags' back into the 5 True/False event label columns
+#  3) get_flag:    Get one event label (e.g. 'Dust Event?') as a True/False series
+#  4) set_flag:    Set one event label to True or False for a list of rows
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+
+# Abakus particle size bins (um)
+ABAKUS_BINS = ['1', '1.1', '1.2', '1.3', '1.4', '1.5', '1.6', '1.7', '1.8', '1.9',
+               '2', '2.1', '2.2', '2.3', '2.4', '2.5', '2.7', '2.9', '3.2', '3.6',
+               '4', '4.5', '5.1', '5.7', '6.4', '7.2', '8.1', '9', '10', '12']
+
+# Column types in the compact layout. Columns not listed keep their type.
+CFA_DTYPES = {'Depth (m)': 'float64', 'AgeBP': 'float64',
+              'Flow Rate': 'float32', 'ECM':   'float32',
+              'Sum 1.1-12': 'float32', 'CPP':  'float32'}
+CFA_DTYPES.update({size: 'float32' for size in ABAKUS_BINS})
+
+# Bit for each event label in the 'Flags' column
+FLAG_COLUMN = 'Flags'
+FLAG_BITS = {'Break?':              1,
+             'New Break?':          2,
+             'Volcanic Event?':     4,
+             'New Volcanic Event?': 8,
+             'Dust Event?':         16}
+
+#%%
+# Function to convert CFA data to the compact column types
+# The event label columns (if any) are replaced by one 'Flags' column, in the place of the first label column
+# Input: CFA dataframe (not changed)
+# Output: Compact CFA dataframe
+
+def compact_cfa(cfa_data):
+
+    cfa_data = cfa_data.astype({column: dtype for column, dtype in CFA_DTYPES.items() if column in cfa_data.columns})
+
+    labels = [label for label in FLAG_BITS if label in cfa_data.columns]
+    if labels:
+        flags = np.zeros(len(cfa_data), dtype = np.uint8)
+        for label in labels:
+            flags |= np.where(cfa_data[label] == True, FLAG_BITS[label], 0).astype(np.uint8)
+
+        position = cfa_data.columns.get_loc(labels[0])
+        cfa_data = cfa_data.drop(columns = labels)
+        cfa_data.insert(position, FLAG_COLUMN, flags)
+
+    return cfa_data
+
+#%%
+# Function to unpack the 'Flags' column into the 5 True/False event label columns
+# Other columns are not changed. CFA data without a 'Flags' column are returned as they are.
+# Input: Compact CFA dataframe (not changed)
+# Output: CFA dataframe with the event label columns
+
+def expand_cfa(cfa_data):
+
+    if FLAG_COLUMN not in cfa_data.columns:
+        return cfa_data
+
+    position = cfa_data.columns.get_loc(FLAG_COLUMN)
+    flags    = cfa_data[FLAG_COLUMN].to_numpy()
+    cfa_data = cfa_data.drop(columns = FLAG_COLUMN)
+    for offset, (label, bit) in enumerate(FLAG_BITS.items()):
+        cfa_data.insert(position + offset, label, (flags & bit) > 0)
+
+    return cfa_data
+
+#%%
+# Function to get one event label from CFA data in either layout
+# Inputs: CFA dataframe, label name (e.g. 'Dust Event?')
+# Output: True/False series with the CFA row indices
+
+def get_flag(cfa_data, label):
+
+    if label in cfa_data.columns:
+        return cfa_data[label] == True
+
+    flags = cfa_data[FLAG_COLUMN].to_numpy()
+    return pd.Series((flags & FLAG_BITS[label]) > 0, index = cfa_data.index, name = label)
+
+#%%
+# Function to set one event label for a list of rows, in either layout
+# Inputs: CFA dataframe (changed in place), label name (e.g. 'Dust Event?'), list of row indices, True/False
+# Output: None
+
+def set_flag(cfa_data, label, rows, value = True):
+
+    if label in cfa_data.columns:
+        cfa_data.loc[rows, label] = value
+    elif value:
+        cfa_data.loc[rows, FLAG_COLUMN] = cfa_data.loc[rows, FLAG_COLUMN] | np.uint8(FLAG_BITS[label])
+    else:
+        cfa_data.loc[rows, FLAG_COLUMN] = cfa_data.loc[rows, FLAG_COLUMN] & np.uint8(~FLAG_BITS[label] & 0xFF)
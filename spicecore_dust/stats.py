@@ -0,0 +1,152 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore SUMMARY STATISTICS
+#
+# Summary statistics of particle concentration & CPP, for one or more copies of the CFA data
+# (e.g. before and after Phase 2), all calculated together
+#    - Count, mean, min, max, and standard deviation in one pass through the data, a block of rows
+#      at a time, combining the blocks with Welford's method (Chan et al., 1979). Numerically stable,
+#      and no copies of the columns are made.
+#    - Median and median absolute deviation (MAD) by selection (np.partition, O(n)) instead of
+#      sorting, reusing one copy of each column's values for both
+#    - NaNs are skipped. Values match np.nanmean, np.nanmedian, np.nanmin, np.nanmax, np.nanstd,
+#      and median_absolute_deviation (to the last digit or two of the mean and standard deviation).
+#    - Results are returned as a dataframe (one row per copy of the data & column) and can be printed
+#      in the usual layout with print_statistics
+#
+# List of functions:
+#
+#  1) column_statistics: Calculate summary statistics for columns of one or more CFA dataframes
+#  2) print_statistics:  Print the summary statistics of one CFA dataframe
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+
+# Columns to summarize
+STATS_COLUMNS = ['Sum 1.1-12', 'CPP']
+# Statistics calculated for each column
+STATISTICS = ['count', 'mean', 'median', 'min', 'max', 'std', 'mad']
+
+#%%
+# Function to calculate the count, mean, min, max, and standard deviation of several columns in one pass
+# Blocks of rows are summarized with numpy, then combined with Welford's method
+# Inputs: List of columns (float64 arrays of the same length), number of rows per block
+# Output: Arrays of counts, means, minimums, maximums, and standard deviations (one value per column)
+
+def _one_pass_statistics(arrays, block_rows):
+
+    count = np.zeros(len(arrays))
+    mean  = np.zeros(len(arrays))
+    m2    = np.zeros(len(arrays))
+    low   = np.full(len(arrays), np.nan)
+    high  = np.full(len(arrays), np.nan)
+
+    for start in range(0, len(arrays[0]), block_rows):
+        block = np.stack([values[start:start + block_rows] for values in arrays])
+        valid = ~np.isnan(block)
+
+        block_count = valid.sum(axis = 1)
+        has_values  = block_count > 0
+        block_mean  = np.where(valid, block, 0).sum(axis = 1) / np.maximum(block_count, 1)
+        block_m2    = np.where(valid, (block - block_mean[:, None]) ** 2, 0).sum(axis = 1)
+
+        # Combine with the blocks before (skipping columns without values in this block)
+        total = count + block_count
+        delta = block_mean - mean
+        mean  = np.where(has_values, mean + delta * block_count / np.maximum(total, 1), mean)
+        m2    = np.where(has_values, m2 + block_m2 + delta ** 2 * count * block_count / np.maximum(total, 1), m2)
+        count = total
+
+        # fmin & fmax skip NaNs
+        low  = np.fmin(low,  np.fmin.reduce(block, axis = 1))
+        high = np.fmax(high, np.fmax.reduce(block, axis = 1))
+
+    mean = np.where(count > 0, mean, np.nan)
+    std  = np.where(count > 0, np.sqrt(m2 / np.maximum(count, 1)), np.nan)
+
+    return count, mean, low, high, std
+
+#%%
+# Function to find the median of an array by selection
+# Input: Array of values without NaNs (reordered in place)
+# Output: Median (average of the 2 middle values for even counts)
+
+def _select_median(values):
+
+    n = len(values)
+    if n == 0:
+        return np.nan
+
+    middle = n // 2
+    if n % 2 == 1:
+        values.partition(middle)
+        return values[middle]
+
+    values.partition([middle - 1, middle])
+    return (values[middle - 1] + values[middle]) / 2
+
+#%%
+# Function to calculate summary statistics for columns of one or more CFA dataframes
+# Inputs: Dictionary of CFA dataframes (e.g. {'After Phase 1': cfa_phase1, 'After Phase 2': cfa}) or one dataframe,
+#         columns to summarize, number of rows per block for the one-pass statistics
+# Output: Dataframe of statistics (count, mean, median, min, max, std, mad), indexed by dataframe name & column
+
+def column_statistics(cfa_data, columns = STATS_COLUMNS, block_rows = 65536):
+
+    if isinstance(cfa_data, pd.DataFrame):
+        cfa_data = {'CFA': cfa_data}
+
+    index  = pd.MultiIndex.from_tuples([(name, column) for name in cfa_data for column in columns],
+                                       names = ['data', 'column'])
+    arrays = [cfa[column].to_numpy(dtype = 'float64') for cfa in cfa_data.values() for column in columns]
+
+    # All columns of all dataframes in one pass, if they have the same length
+    if len(set(len(values) for values in arrays)) == 1:
+        one_pass = _one_pass_statistics(arrays, block_rows)
+    else:
+        one_pass = np.column_stack([_one_pass_statistics([values], block_rows) for values in arrays])
+
+    stats = pd.DataFrame(np.column_stack(one_pass), index = index, columns = ['count', 'mean', 'min', 'max', 'std'])
+    stats['count'] = stats['count'].astype('int64')
+
+    # Median, then MAD from the same copy of the values (changed in place to the absolute deviations)
+    medians, mads = [], []
+    for values in arrays:
+        values = values[~np.isnan(values)]
+        median = _select_median(values)
+        np.abs(np.subtract(values, median, out = values), out = values)
+        medians.append(median)
+        mads.append(_select_median(values))
+    stats['median'] = medians
+    stats['mad']    = mads
+
+    return stats[STATISTICS]
+
+#%%
+# Function to print the summary statistics of one CFA dataframe
+# Particle concentration is printed in #/mL (MAD in the column's #/uL, as it has always been printed)
+# Inputs: Dataframe of statistics (from column_statistics), name of the CFA dataframe
+# Output: None
+
+def print_statistics(stats, name = 'CFA'):
+
+    conc = stats.loc[(name, 'Sum 1.1-12')]
+    cpp  = stats.loc[(name, 'CPP')]
+
+    print('Dust Number Concentration (#/mL):')
+    print('    Mean:   %.2f' % (conc['mean'] * 1000))
+    print('    Median: %.2f' % (conc['median'] * 1000))
+    print('    Min:    %.2f' % (conc['min'] * 1000))
+    print('    Max:    %.2f' % (conc['max'] * 1000))
+    print('    StDev:  %.2f' % (conc['std'] * 1000))
+    print('    MAD:    %.2f' % conc['mad'])
+
+    print('\nCoarse Particles (%):')
+    print('    Mean:   %.2f' % cpp['mean'])
+    print('    Median: %.2f' % cpp['median'])
+    print('    Min:    %.2f' % cpp['min'])
+    print('    Max:    %.2f' % cpp['max'])
+    print('    StDev:  %.2f' % cpp['std'])
+    print('    MAD:    %.2f' % cpp['mad'])
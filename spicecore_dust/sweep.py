@@ -0,0 +1,182 @@
+# --------------------------------------------------------------------------------------
+#                     SPICEcore MAD OUTLIER SENSITIVITY SWEEP
+#
+# Runs the Phase 2 MAD outlier removal for many background window sizes, MAD thresholds, and
+# volcanic-event options, and reports how many rows each combination removes
+#    - The Phase 1 data are loaded once and shared read-only with a pool of worker processes: the CPP,
+#      concentration & event label arrays are copied into shared memory blocks once, and every worker
+#      maps the same blocks instead of getting its own copy
+#    - Each worker handles one window size: the rolling background medians are calculated once
+#      and reused for every threshold & volcanic option
+#    - Results are one row per (window, threshold, preserve volcanic) combination
+#
+# List of functions:
+#
+#  1) run_sweep:    Run the MAD outlier removal for every combination of settings
+#  2) export_sweep: Save the sweep results to CSV
+#
+# ---------------------------------------------------------------------------------------
+#%%
+# Import modules and packages
+import numpy  as np
+import pandas as pd
+import os
+from   datetime import date
+from   concurrent.futures import ProcessPoolExecutor
+from   multiprocessing    import shared_memory
+
+from .functions import median_absolute_deviation, find_MAD_outliers
+from .rolling   import rolling_median
+from .schema    import get_flag
+
+# Phase 1 data shared with the worker processes (set once per worker by _start_worker)
+_shared = {}
+# Shared memory blocks mapped by this process, kept open while their arrays are used
+_blocks = []
+
+#%%
+# Function to copy arrays into shared memory blocks, for the worker processes
+# Input: Dictionary of arrays
+# Outputs: List of the shared memory blocks (to close & unlink after the sweep),
+#          dictionary of (block name, shape, type) of each array, for _start_worker
+
+def _share_arrays(arrays):
+
+    blocks, layout = [], {}
+    for name, values in arrays.items():
+        block = shared_memory.SharedMemory(create = True, size = max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype = values.dtype, buffer = block.buf)[:] = values
+        blocks.append(block)
+        layout[name] = (block.name, values.shape, values.dtype.str)
+
+    return blocks, layout
+
+#%%
+# Function to store the shared Phase 1 data in a worker process
+# The arrays are read-only views of the shared memory blocks, not copies
+# Inputs: Dictionary of (block name, shape, type) of each array (from _share_arrays),
+#         dictionary of other values (e.g. the MADs)
+# Output: None
+
+def _start_worker(layout, values):
+    _shared.clear()
+    for name, (block_name, shape, dtype) in layout.items():
+        block = shared_memory.SharedMemory(name = block_name)
+        _blocks.append(block)
+        _shared[name] = np.ndarray(shape, dtype = dtype, buffer = block.buf)
+        _shared[name].flags.writeable = False
+    _shared.update(values)
+
+#%%
+# Function to run the MAD outlier removal for one window size and every threshold & volcanic option
+# Uses the Phase 1 data shared with this process
+# Inputs: Background window size, list of MAD thresholds, list of preserve volcanic options (True/False)
+# Output: List of result rows (dictionaries)
+
+def _sweep_window(window, thresholds, preserve_options):
+    cpp  = _shared['cpp']
+    conc = _shared['conc']
+
+    # Calculate rolling medians once for this window
+    # Will calculate if 3 measurements in the window that aren't NaN
+    cpp_background, conc_background = rolling_median([cpp, conc], window, min_periods = 3)
+
+    results = []
+    for threshold in thresholds:
+        outliers = find_MAD_outliers(cpp, conc, cpp_background, conc_background,
+                                     _shared['cpp_mad'], _shared['conc_mad'], threshold)
+        # Prevent rows in real dust events from being removed
+        outliers = outliers & ~_shared['dust']
+
+        for preserve_volcanic in preserve_options:
+            if preserve_volcanic:
+                remove = outliers & ~_shared['volc']
+            else:
+                remove = outliers
+
+            # Particle concentration (#/mL) & CPP left after removing the outliers
+            kept      = _shared['has_data'] & ~remove
+            kept_conc = conc[kept] * 1000
+            kept_cpp  = cpp[kept]
+            kept_cpp  = kept_cpp[~np.isnan(kept_cpp)]
+
+            results.append({
+                'Window':                window,
+                'MAD Threshold':         threshold,
+                'Preserve Volcanic?':    preserve_volcanic,
+                'Rows Removed':          int(remove.sum()),
+                'Volcanic Rows Removed': int((remove & _shared['volc']).sum()),
+                'Final Length':          int(kept.sum()),
+                'Conc Mean (#/mL)':      np.mean(kept_conc)   if len(kept_conc) else np.nan,
+                'Conc Median (#/mL)':    np.median(kept_conc) if len(kept_conc) else np.nan,
+                'Conc StDev (#/mL)':     np.std(kept_conc)    if len(kept_conc) else np.nan,
+                'CPP Mean':              np.mean(kept_cpp)    if len(kept_cpp)  else np.nan,
+                'CPP Median':            np.median(kept_cpp)  if len(kept_cpp)  else np.nan,
+                'CPP StDev':             np.std(kept_cpp)     if len(kept_cpp)  else np.nan,
+            })
+
+    return results
+
+#%%
+# Function to run the MAD outlier removal for every combination of settings
+# The Phase 1 data are not changed
+# Inputs: Phase 1 CFA dataframe, lists of window sizes and MAD thresholds,
+#         list of preserve volcanic options, number of worker processes (None uses all cores, 1 runs without a pool)
+# Output: Dataframe with one row of removed-row counts & summary statistics per combination
+
+def run_sweep(cfa_phase1, windows, thresholds, preserve_options = (True, False), processes = None):
+
+    print('\nRunning MAD outlier sweep: %d windows x %d thresholds x %d volcanic options.'
+          % (len(windows), len(thresholds), len(preserve_options)))
+
+    # Only the columns needed for outlier removal are shared with the workers
+    cpp  = cfa_phase1['CPP'].to_numpy(dtype = 'float')
+    conc = cfa_phase1['Sum 1.1-12'].to_numpy(dtype = 'float')
+    arrays = {
+        'cpp':      cpp,
+        'conc':     conc,
+        'dust':     get_flag(cfa_phase1, 'Dust Event?').to_numpy(),
+        'volc':     get_flag(cfa_phase1, 'Volcanic Event?').to_numpy(),
+        # Rows counted in the dataset length (same column as Phase 2)
+        'has_data': ~np.isnan(conc),
+    }
+    # MAD doesn't depend on the window or threshold, so calculate it once
+    values = {'cpp_mad':  median_absolute_deviation(cfa_phase1['CPP']),
+              'conc_mad': median_absolute_deviation(cfa_phase1['Sum 1.1-12'])}
+
+    results = []
+    if processes == 1:
+        _shared.clear()
+        _shared.update(arrays)
+        _shared.update(values)
+        for window in windows:
+            results.extend(_sweep_window(window, thresholds, preserve_options))
+    else:
+        # Each worker maps the shared memory blocks once, when it starts
+        blocks, layout = _share_arrays(arrays)
+        try:
+            with ProcessPoolExecutor(max_workers = processes, initializer = _start_worker,
+                                     initargs = (layout, values)) as pool:
+                for window_results in pool.map(_sweep_window, windows,
+                                               [thresholds] * len(windows), [preserve_options] * len(windows)):
+                    results.extend(window_results)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    return pd.DataFrame(results)
+
+#%%
+# Function to save the sweep results to CSV
+# Inputs: Sweep results dataframe, folder to save to
+# Output: Name of the saved file
+
+def export_sweep(sweep, output_folder):
+
+    file = os.path.join(output_folder, 'MAD_Sweep_' + str(date.today()) + '.csv')
+    sweep.to_csv(file, index = False)
+
+    print('\tSweep results exported to CSV [MAD_Sweep_...].')
+
+    return file